@@ -2,9 +2,11 @@ import os
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog, messagebox
-import threading
-from robust_downloader import download_file_robust # Pour les téléchargements directs
-from streaming_downloader import download_streaming_video # Nouveau: Pour les téléchargements de streaming
+from download_queue import DownloadQueue, DIRECT, STREAMING, PLAYLIST, preload, close_connections # File d'attente des téléchargements directs et streaming
+from events import EventQueue
+from progress import PROGRESS_INTERVAL
+
+PRELOAD_DELAY = 0.5  # Secondes après la création de la fenêtre avant d'importer les téléchargeurs en fond
 
 class DownloadManagerApp(ctk.CTk):
     def __init__(self):
@@ -45,6 +47,28 @@ class DownloadManagerApp(ctk.CTk):
         self.status_label = ctk.CTkLabel(self, text="Prêt à télécharger...", wraplength=550)
         self.status_label.pack(pady=10, padx=20, fill="x", anchor="w")
 
+        # Statuts, progression et changements d'état arrivent des threads de téléchargement dans une file ;
+        # la GUI la vide sur le thread principal toutes les PROGRESS_INTERVAL secondes (progression fusionnée)
+        self.events = EventQueue()
+        self.after(int(PROGRESS_INTERVAL * 1000), self._poll_events)
+
+        # File d'attente : limite les téléchargements simultanés et les connexions par hôte
+        self.download_queue = DownloadQueue(progress_callback=self.events.progress,
+                                            status_callback=self.events.status,
+                                            job_callback=self.events.job)
+        self.download_queue.start()
+
+        # requests et yt-dlp ne retardent pas l'affichage : importés en fond une fois la fenêtre visible
+        self.after(int(PRELOAD_DELAY * 1000), preload)
+
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+
+    def on_closing(self):
+        """Fermeture de la fenêtre : plus de nouveau job, connexions gardées ouvertes fermées."""
+        self.download_queue.stop()
+        close_connections()
+        self.destroy()
+
     # --- Méthodes pour configurer les onglets ---
 
     def setup_direct_download_tab(self, tab):
@@ -72,7 +96,7 @@ class DownloadManagerApp(ctk.CTk):
         browse_button = ctk.CTkButton(dest_frame, text="Parcourir", command=self.browse_direct_folder)
         browse_button.pack(side="right")
 
-        download_button = ctk.CTkButton(tab, text="Télécharger (Direct)", command=self.start_direct_download_thread)
+        download_button = ctk.CTkButton(tab, text="Télécharger (Direct)", command=self.enqueue_direct_download)
         download_button.pack(pady=10, padx=10)
         self.direct_download_button = download_button # Garde une référence au bouton
 
@@ -98,7 +122,12 @@ class DownloadManagerApp(ctk.CTk):
         browse_button = ctk.CTkButton(dest_frame, text="Parcourir", command=self.browse_streaming_folder)
         browse_button.pack(side="right")
 
-        download_button = ctk.CTkButton(tab, text="Télécharger (Streaming)", command=self.start_streaming_download_thread)
+        # Playlist : toutes les vidéos, plusieurs à la fois (sinon seule la vidéo de l'URL)
+        self.streaming_playlist_var = ctk.BooleanVar(value=False)
+        playlist_checkbox = ctk.CTkCheckBox(tab, text="Télécharger toute la playlist", variable=self.streaming_playlist_var)
+        playlist_checkbox.pack(pady=(0, 5), padx=10, anchor="w")
+
+        download_button = ctk.CTkButton(tab, text="Télécharger (Streaming)", command=self.enqueue_streaming_download)
         download_button.pack(pady=10, padx=10)
         self.streaming_download_button = download_button # Garde une référence au bouton
 
@@ -119,8 +148,14 @@ class DownloadManagerApp(ctk.CTk):
             self.streaming_dest_entry.delete(0, tk.END)
             self.streaming_dest_entry.insert(0, folder_selected)
 
+    def _poll_events(self):
+        """Traite les événements reçus des téléchargements (thread principal de Tkinter) puis se reprogramme."""
+        self.events.dispatch(on_status=self.update_status_gui, on_progress=self.update_progress_gui,
+                             on_job=self.on_job_update)
+        self.after(int(PROGRESS_INTERVAL * 1000), self._poll_events)
+
     def update_progress_gui(self, current, total, status_extra_info=""):
-        """Callback pour mettre à jour la barre de progression et le texte."""
+        """Met à jour la barre de progression et le texte. À appeler depuis le thread principal de Tkinter."""
         if total > 0:
             progress_value = current / total
             self.progress_bar.set(progress_value)
@@ -132,70 +167,37 @@ class DownloadManagerApp(ctk.CTk):
             self.progress_bar.set(0) # Garde la barre vide si pas de total
             self.status_label.configure(text_color="white")
             self.status_label.configure(text=f"Téléchargement : {current / (1024*1024):.2f} Mo (taille inconnue) {status_extra_info}")
-        self.update_idletasks()
 
     def update_status_gui(self, message, is_error=False):
-        """Callback pour mettre à jour le label de statut. Exécuté dans le thread principal de Tkinter."""
-        # Utiliser after pour s'assurer que les mises à jour UI sont sur le thread principal
-        def _update():
-            if is_error:
-                self.status_label.configure(text=f"ERREUR: {message}", text_color="red")
-            else:
-                self.status_label.configure(text=message, text_color="green" if "succès" in message or "terminé" in message else "white")
-            self.update_idletasks()
-        self.after(0, _update)
-
-
-    def start_direct_download_thread(self):
-        """Démarre le téléchargement direct dans un thread séparé."""
+        """Met à jour le label de statut. À appeler depuis le thread principal de Tkinter."""
+        if is_error:
+            self.status_label.configure(text=f"ERREUR: {message}", text_color="red")
+        else:
+            self.status_label.configure(text=message, text_color="green" if "succès" in message or "terminé" in message else "white")
+
+
+    def enqueue_direct_download(self):
+        """Ajoute le téléchargement direct à la file d'attente."""
         url = self.direct_url_entry.get()
         destination = self.direct_dest_entry.get()
         if not url:
             messagebox.showwarning("URL Manquante", "Veuillez entrer une URL à télécharger.")
             return
+        self.download_queue.submit(url, DIRECT, destination)
 
-        self._reset_ui_for_download()
-        self.direct_download_button.configure(state="disabled", text="Téléchargement en cours...")
-
-        download_thread = threading.Thread(target=self._run_direct_download, args=(url, destination))
-        download_thread.start()
-
-    def _run_direct_download(self, url, destination):
-        """Fonction interne exécutée dans le thread de téléchargement direct."""
-        try:
-            download_file_robust(url, destination,
-                                 progress_callback=self.update_progress_gui,
-                                 status_callback=self.update_status_gui)
-        finally:
-            self.direct_download_button.configure(state="normal", text="Télécharger (Direct)")
-            if "succès" in self.status_label.cget("text") and self.progress_bar.get() < 1:
-                self.progress_bar.set(1)
-
-    def start_streaming_download_thread(self):
-        """Démarre le téléchargement streaming dans un thread séparé."""
+    def enqueue_streaming_download(self):
+        """Ajoute le téléchargement streaming à la file d'attente."""
         url = self.streaming_url_entry.get()
         destination = self.streaming_dest_entry.get()
         if not url:
             messagebox.showwarning("URL Manquante", "Veuillez entrer une URL de vidéo streaming.")
             return
+        self.download_queue.submit(url, PLAYLIST if self.streaming_playlist_var.get() else STREAMING, destination)
 
-        self._reset_ui_for_download()
-        self.streaming_download_button.configure(state="disabled", text="Téléchargement en cours...")
-
-        download_thread = threading.Thread(target=self._run_streaming_download, args=(url, destination))
-        download_thread.start()
-
-    def _run_streaming_download(self, url, destination):
-        """Fonction interne exécutée dans le thread de téléchargement streaming."""
-        try:
-            download_streaming_video(url, destination,
-                                    progress_callback=self.update_progress_gui,
-                                    status_callback=self.update_status_gui)
-        finally:
-            self.streaming_download_button.configure(state="normal", text="Télécharger (Streaming)")
-            # La barre de progression pour yt-dlp est plus délicate, il faut s'assurer qu'elle se remplit
-            # _report_hook devrait gérer de mettre progress_bar à 1.0 à la fin.
-
+    def on_job_update(self, job):
+        """Changement d'état d'un job de la file (reçu via la file d'événements, thread principal)."""
+        if job.state == job.RUNNING:
+            self._reset_ui_for_download()
 
     def _reset_ui_for_download(self):
         """Réinitialise l'UI avant un nouveau téléchargement."""
@@ -0,0 +1,402 @@
+import asyncio
+import os
+import time
+
+try:
+    import aiohttp
+except ImportError:  # Dépendance de ce seul module : le reste du programme s'en passe
+    aiohttp = None
+
+from bandwidth import throttle_for
+from disk_writer import WRITE_BLOCK_SIZE
+from robust_downloader import BROWSER_HEADERS, CHECKPOINT_INTERVAL, _content_range_total
+from journal import DownloadJournal, RemoteFileChanged
+from progress import PROGRESS_INTERVAL
+from segments import MAX_CONNECTIONS, MIN_SEGMENT_SIZE
+from storage import PreallocatedStorage
+
+MAX_CONCURRENT_REQUESTS = 256  # Requêtes HTTP en vol, tous téléchargements confondus
+CONNECT_TIMEOUT = 10  # Secondes pour établir une connexion
+READ_TIMEOUT = 10  # Secondes sans recevoir d'octet avant d'abandonner une requête
+
+
+class AsyncDownload:
+    """Équivalent asyncio de download_file_robust : segments Range, reprise, callbacks de progression/statut.
+
+    Toutes les requêtes passent par `semaphore`, partagé entre les téléchargements d'un même lot.
+    La limite de débit globale (bandwidth.GLOBAL_LIMIT) est partagée avec les téléchargements par threads.
+    Les appels disque bloquants (préallocation, écritures regroupées par WRITE_BLOCK_SIZE, journal) passent
+    par le pool de threads de la boucle : un disque lent ne fige pas les autres requêtes en vol.
+    La requête initiale demande 'Range: bytes=0-' : son corps sert au premier segment, ou à tout le fichier
+    en téléchargement simple. Un fichier simple interrompu reprend à sa taille actuelle si le serveur le permet.
+    """
+
+    def __init__(self, session, semaphore, url, destination_folder="downloads", progress_callback=None,
+                 status_callback=None):
+        self.session = session
+        self.semaphore = semaphore
+        self.url = url
+        self.destination_folder = destination_folder
+        self.progress_callback = progress_callback
+        self.status_callback = status_callback
+        self.file_name = url.split('/')[-1]
+        self.file_path = os.path.join(destination_folder, self.file_name)
+        self.final_url = url
+        self.total_size = 0
+        self.downloaded = 0
+        self.last_checkpoint = time.monotonic()
+        self.checkpointing = False  # Sauvegarde du journal en cours dans le pool de threads
+        self.last_progress = 0.0
+        self.throttle = throttle_for()
+        self.initial_response = None  # Réponse de la requête initiale, gardée ouverte pour le premier segment
+
+    @staticmethod
+    async def _io(function, *args):
+        """Exécute un appel disque bloquant hors de la boucle asyncio."""
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def _throttle(self, nbytes):
+        delay = self.throttle.delay(nbytes)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def update_status(self, message, is_error=False):
+        if self.status_callback:
+            self.status_callback(message, is_error)
+        else:
+            print(message)
+
+    def update_progress(self, current, total, force=False):
+        # Au plus une notification par PROGRESS_INTERVAL et par fichier, même avec des milliers de blocs
+        if not self.progress_callback:
+            return
+        now = time.monotonic()
+        if force or now - self.last_progress >= PROGRESS_INTERVAL:
+            self.last_progress = now
+            self.progress_callback(current, total)
+
+    async def run(self):
+        """Télécharge le fichier ; retourne True s'il est complet à la fin, False sinon (comme download_file_robust)."""
+        try:
+            return await self._run()
+        except OSError as e:
+            # Dossier impossible à créer, fichier cible qui est un dossier, disque plein... : ce fichier seulement
+            self.update_status(f"❌ Erreur d'accès au disque pour '{self.file_name}' : {e}", True)
+            return False
+
+    async def _run(self):
+        if not os.path.exists(self.destination_folder):
+            await self._io(lambda: os.makedirs(self.destination_folder, exist_ok=True))
+            self.update_status(f"Dossier de destination créé : {self.destination_folder}")
+
+        storage = PreallocatedStorage(self.destination_folder, self.file_name)
+        headers = BROWSER_HEADERS.copy()
+        headers['Range'] = 'bytes=0-'  # 206 si le serveur accepte les plages ; le corps sert dans les deux cas
+        try:
+            async with self.semaphore:
+                self.initial_response = response = await self.session.get(self.url, headers=headers)
+                response.raise_for_status()
+                self.final_url = str(response.url)
+                accept_ranges = response.status == 206
+                self.total_size = (_content_range_total(response) if accept_ranges else response.content_length) or 0
+                journal = await self._io(self._open_journal, storage, response)
+
+            if os.path.exists(self.file_path) and 0 < self.total_size == os.path.getsize(self.file_path):
+                self.update_status(f"Le fichier '{self.file_name}' est déjà complet "
+                                   f"({self.total_size} octets). Téléchargement ignoré.", False)
+                self.update_progress(self.total_size, self.total_size, force=True)
+                await self._io(storage.discard)
+                return True
+
+            # Petit fichier ou pas de plages : un seul flux
+            connections = self._connections() if accept_ranges else 0
+            if connections <= 1 and not journal.segments:
+                return await self._download_simple(journal, accept_ranges)
+            return await self._download_segmented(storage, journal, max(connections, 1))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.update_status(f"❌ Erreur lors du téléchargement de {self.url}: {e}", True)
+            return False
+        finally:
+            self._close_initial_response()
+
+    def _close_initial_response(self):
+        if self.initial_response is not None:
+            self.initial_response.close()
+            self.initial_response = None
+
+    def _take_initial_response(self, segment):
+        """Réponse initiale si `segment` commence à l'octet 0 (son corps en est le début), sinon None."""
+        if segment.start == 0 and segment.position == 0 and self.initial_response is not None:
+            response, self.initial_response = self.initial_response, None
+            return response
+        return None
+
+    def _open_journal(self, storage, response):
+        """Journal du téléchargement ; l'avancement précédent n'est repris que si les validateurs concordent."""
+        journal = DownloadJournal.from_response(storage.journal_path, self.url, response, self.total_size)
+        previous = storage.read_journal()
+        if previous is None:
+            return journal
+        if previous.url == self.url and previous.matches(journal.etag, journal.last_modified, self.total_size):
+            journal.segments = previous.segments
+        else:
+            self.update_status(f"Le fichier '{self.file_name}' a changé sur le serveur : reprise refusée.", True)
+            storage.discard()
+        return journal
+
+    def _connections(self):
+        """Une connexion par tranche de MIN_SEGMENT_SIZE, dans la limite de MAX_CONNECTIONS."""
+        return min(MAX_CONNECTIONS, self.total_size // MIN_SEGMENT_SIZE)
+
+    async def _download_simple(self, journal, accept_ranges):
+        initial_bytes = await self._io(self._resumable_size, accept_ranges)
+        if initial_bytes:
+            self._close_initial_response()  # Son corps part de l'octet 0 : une requête à partir de la reprise
+            headers = BROWSER_HEADERS.copy()
+            headers['Range'] = f'bytes={initial_bytes}-'
+            if_range = journal.if_range()
+            if if_range:
+                headers['If-Range'] = if_range  # 200 (fichier entier) si le fichier a changé entre-temps
+            async with self.semaphore:
+                response = await self.session.get(self.final_url, headers=headers)
+            self.initial_response = response  # Fermée par _run
+            response.raise_for_status()
+            if response.status == 206:
+                self.update_status(f"Reprise du téléchargement simple à partir de {initial_bytes} octets...", False)
+            else:
+                self.update_status(f"Le serveur ne permet pas la reprise de '{self.file_name}' : "
+                                   f"redémarrage complet.", False)
+                initial_bytes = 0
+        async with self.semaphore:
+            return await self._receive_simple(self.initial_response, initial_bytes)
+
+    def _resumable_size(self, accept_ranges):
+        """Taille du fichier partiel laissé par un téléchargement simple interrompu, 0 s'il faut repartir de zéro."""
+        if not accept_ranges or not self.total_size or not os.path.exists(self.file_path):
+            return 0
+        size = os.path.getsize(self.file_path)
+        return size if size < self.total_size else 0
+
+    async def _receive_simple(self, response, initial_bytes):
+        f = await self._io(open, self.file_path, 'ab' if initial_bytes else 'wb')
+        self.downloaded = initial_bytes
+        pending = bytearray()
+        try:
+            # iter_any() rend les données telles que reçues ; elles sont regroupées avant chaque écriture
+            async for chunk in response.content.iter_any():
+                pending += chunk
+                if len(pending) >= WRITE_BLOCK_SIZE:
+                    await self._write(f, pending)
+                self.downloaded += len(chunk)
+                self.update_progress(self.downloaded, self.total_size)
+                await self._throttle(len(chunk))
+        finally:
+            try:
+                if pending:
+                    await self._write(f, pending)
+            finally:
+                await self._io(f.close)
+        self.update_progress(self.downloaded, self.total_size, force=True)
+
+        if self.total_size and self.downloaded != self.total_size:
+            self.update_status(f"⚠️ AVERTISSEMENT : Le téléchargement de '{self.file_name}' n'est pas complet "
+                               f"(taille attendue: {self.total_size}, téléchargée: {self.downloaded}).", True)
+            return False
+        self.update_status(f"✅ Téléchargement de '{self.file_name}' terminé avec succès.", False)
+        return True
+
+    async def _download_segmented(self, storage, journal, connections):
+        try:
+            # Préallocation (fallocate) : peut durer sur un gros fichier
+            scheduler = await self._io(storage.load_segments, journal, connections, self.update_status)
+        except OSError as e:
+            self.update_status(f"❌ Impossible de préparer les fichiers temporaires : {e}", True)
+            return False
+        self.downloaded = scheduler.downloaded_bytes()
+        if not any(segment.start == 0 and segment.position == 0 for segment in scheduler.segments):
+            self._close_initial_response()  # Reprise : le début du fichier est déjà là
+
+        await asyncio.gather(*(self._worker(scheduler, storage) for _ in range(connections)))
+        await self._checkpoint(scheduler, storage, force=True)
+
+        if not scheduler.complete:
+            self.update_status(f"❌ Le téléchargement de '{self.file_name}' est incomplet "
+                               f"({scheduler.downloaded_bytes()}/{self.total_size} octets). Relancez pour reprendre.",
+                               True)
+            return False
+        try:
+            await self._io(storage.finalize, scheduler.segments)
+        except OSError as e:
+            self.update_status(f"❌ Erreur lors de la finalisation de '{self.file_name}' : {e}", True)
+            return False
+        self.update_progress(self.total_size, self.total_size, force=True)
+        self.update_status(f"✅ Téléchargement multi-segments de '{self.file_name}' terminé avec succès.", False)
+        return True
+
+    async def _worker(self, scheduler, storage):
+        while True:
+            segment = scheduler.next_segment()
+            if segment is None:
+                return
+            success = await self._download_part(scheduler, storage, segment)
+            scheduler.release(segment, failed=not success)
+            if not success:
+                return
+
+    async def _download_part(self, scheduler, storage, segment):
+        headers = BROWSER_HEADERS.copy()
+        headers['Range'] = f'bytes={segment.position}-{segment.end}'
+        if_range = storage.journal.if_range()
+        if if_range:
+            headers['If-Range'] = if_range
+        try:
+            async with self.semaphore:
+                # Segment 0 : le corps de la requête initiale, déjà en route
+                response = self._take_initial_response(segment) or await self.session.get(self.final_url,
+                                                                                           headers=headers)
+                async with response:
+                    response.raise_for_status()
+                    if response.status != 206:
+                        self.update_status(f"Serveur ne supporte pas les plages pour la partie {segment.start}, "
+                                           f"ou le fichier a changé.", True)
+                        return False
+                    storage.journal.check_response(response)
+
+                    f = await self._io(storage.open_segment, segment)
+                    pending = bytearray()
+                    try:
+                        async for chunk in response.content.iter_any():
+                            # Le segment a pu être raccourci par un autre worker : on n'écrit que notre plage
+                            keep = scheduler.claim(segment, len(chunk))
+                            if keep:
+                                pending += chunk if keep == len(chunk) else chunk[:keep]
+                                self.downloaded += keep
+                                self.update_progress(self.downloaded, self.total_size)
+                            if len(pending) >= WRITE_BLOCK_SIZE:
+                                segment.written += await self._write(f, pending)
+                                await self._checkpoint(scheduler, storage)
+                            if segment.done:
+                                break
+                            await self._throttle(len(chunk))
+                    finally:
+                        # Octets reçus avant une coupure : écrits aussi, seuls les manquants seront redemandés
+                        try:
+                            if pending:
+                                segment.written += await self._write(f, pending)
+                        finally:
+                            await self._io(f.close)
+        except RemoteFileChanged as e:
+            self.update_status(f"❌ Le fichier distant a changé ({e}).", True)
+            return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.update_status(f"❌ Erreur lors du téléchargement de la partie {segment.start}: {e}", True)
+            return False
+        except OSError as e:
+            self.update_status(f"❌ Erreur d'écriture pour la partie {segment.start} : {e}", True)
+            return False
+
+        if not segment.done:
+            self.update_status(f"❌ Partie {segment.start} interrompue avant la fin "
+                               f"({segment.position}/{segment.end + 1}).", True)
+            return False
+        return True
+
+    async def _write(self, f, pending):
+        """Écrit les octets regroupés dans `pending` puis le vide ; retourne le nombre d'octets écrits."""
+        try:
+            await self._io(f.write, pending)
+            return len(pending)
+        finally:
+            pending.clear()
+
+    async def _checkpoint(self, scheduler, storage, force=False):
+        if self.checkpointing or not force and time.monotonic() - self.last_checkpoint < CHECKPOINT_INTERVAL:
+            return
+        self.last_checkpoint = time.monotonic()
+        self.checkpointing = True  # Une seule sauvegarde à la fois (fichier temporaire du journal commun)
+        try:
+            await self._io(storage.checkpoint, scheduler.snapshot())
+        except OSError as e:
+            self.update_status(f"Impossible de sauvegarder l'avancement : {e}", True)
+        finally:
+            self.checkpointing = False
+
+
+def _create_session(max_concurrency):
+    if aiohttp is None:
+        raise ImportError("Les téléchargements asyncio nécessitent aiohttp : pip install aiohttp")
+    connector = aiohttp.TCPConnector(limit=max_concurrency, limit_per_host=max_concurrency)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def download_file_async(url, destination_folder="downloads", progress_callback=None, status_callback=None,
+                              session=None, semaphore=None):
+    """
+    Télécharge un fichier comme download_file_robust, mais dans la boucle asyncio courante.
+
+    :param session: aiohttp.ClientSession à réutiliser (créée et fermée ici si None)
+    :param semaphore: asyncio.Semaphore limitant les requêtes en vol (partagé entre téléchargements)
+    :return: True si le fichier est complet à la fin, False sinon
+    """
+    semaphore = semaphore or asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    if session is not None:
+        return await AsyncDownload(session, semaphore, url, destination_folder, progress_callback,
+                                   status_callback).run()
+    async with _create_session(MAX_CONCURRENT_REQUESTS) as session:
+        return await AsyncDownload(session, semaphore, url, destination_folder, progress_callback,
+                                   status_callback).run()
+
+
+async def download_many_async(urls, destination_folder="downloads", max_concurrency=MAX_CONCURRENT_REQUESTS,
+                              progress_callback=None, status_callback=None):
+    """
+    Télécharge une liste d'URLs sur une seule boucle, avec au plus `max_concurrency` requêtes en vol.
+
+    :param progress_callback: Prend (url, current_bytes, total_bytes) en param
+    :param status_callback: Prend (message, is_error=False) en param
+    :return: Liste de booléens (fichier complet ou non), dans l'ordre de `urls`
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    async with _create_session(max_concurrency) as session:
+        downloads = []
+        for url in urls:
+            callback = None
+            if progress_callback:
+                callback = (lambda u: lambda current, total: progress_callback(u, current, total))(url)
+            downloads.append(AsyncDownload(session, semaphore, url, destination_folder, callback,
+                                           status_callback).run())
+        # Une erreur imprévue sur un fichier ne doit pas interrompre les autres
+        results = await asyncio.gather(*downloads, return_exceptions=True)
+    for url, result in zip(urls, results):
+        if isinstance(result, BaseException):
+            message = f"❌ Erreur inattendue pour {url} : {type(result).__name__}: {result}"
+            if status_callback:
+                status_callback(message, True)
+            else:
+                print(message)
+    return [result is True for result in results]
+
+
+def download_many(urls, destination_folder="downloads", max_concurrency=MAX_CONCURRENT_REQUESTS,
+                  progress_callback=None, status_callback=None):
+    """Point d'entrée synchrone de download_many_async (lance sa propre boucle asyncio)."""
+    return asyncio.run(download_many_async(urls, destination_folder, max_concurrency, progress_callback, status_callback))
+
+
+if __name__ == "__main__":
+    # Validation locale : 1000 petits fichiers et un gros fichier segmenté servis par un serveur de test
+    from local_server import LocalFileServer
+
+    with LocalFileServer() as server:
+        test_urls = [server.add_file(f"petit_{i}.bin", size=32 * 1024) for i in range(1000)]
+        test_urls.append(server.add_file("gros.bin", size=64 * 1024 * 1024))
+        errors = []
+
+        def collect_errors(message, is_error=False):
+            if is_error:
+                errors.append(message)
+
+        start_time = time.perf_counter()
+        download_many(test_urls, "downloads_async_test", status_callback=collect_errors)
+        print(f"{len(test_urls)} fichiers en {time.perf_counter() - start_time:.2f} s, {len(errors)} erreur(s).")
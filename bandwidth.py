@@ -0,0 +1,147 @@
+import datetime
+import threading
+import time
+
+MIN_READ_SIZE = 16 * 1024
+READ_INTERVAL = 0.1  # Une lecture limitée couvre ~0,1 s du débit autorisé : flux régulier, sans rafales
+BURST_TIME = 0.5  # Capacité du seau : 0,5 s de débit
+SCHEDULE_CHECK_INTERVAL = 30.0  # Secondes entre deux consultations du planning
+
+
+class BandwidthSchedule:
+    """Limites de débit par plage horaire.
+
+    `rules` : [("22:00", "07:00", 0), ("07:00", "22:00", 2 * 1024 * 1024)], en octets/s (0 = illimité).
+    Une plage dont le début est après la fin passe minuit. Hors de toute plage : `default`.
+    """
+
+    def __init__(self, rules, default=0):
+        self.rules = [(self._parse(start), self._parse(end), rate) for start, end, rate in rules]
+        self.default = default
+
+    @staticmethod
+    def _parse(value):
+        return datetime.datetime.strptime(value, "%H:%M").time()
+
+    def rate_at(self, moment=None):
+        now = (moment or datetime.datetime.now()).time()
+        for start, end, rate in self.rules:
+            if start <= end and start <= now < end or start > end and (now >= start or now < end):
+                return rate
+        return self.default
+
+
+class TokenBucket:
+    """Seau à jetons : `rate` octets/s en moyenne, rafales jusqu'à BURST_TIME secondes de débit. 0 = illimité.
+
+    Chaque lecture réserve ses octets en une seule opération courte sous verrou. Le solde peut
+    devenir négatif : l'appelant dort ensuite, hors verrou, le temps de rembourser sa dette.
+    Les workers se partagent ainsi le débit sans se bloquer mutuellement.
+    """
+
+    def __init__(self, rate=0, schedule=None):
+        self._lock = threading.Lock()
+        self._rate = max(0, rate or 0)
+        self._tokens = self._capacity()
+        self._updated = time.monotonic()
+        self._schedule = None
+        self._next_schedule_check = 0.0
+        if schedule is not None:
+            self.set_schedule(schedule)
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def _capacity(self):
+        return self._rate * BURST_TIME
+
+    def _refill(self, now):
+        if self._rate:
+            self._tokens = min(self._capacity(), self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def _change_rate(self, rate, now):
+        self._refill(now)
+        self._rate = max(0, rate or 0)
+        # Une ancienne dette ne doit pas bloquer longtemps après un changement de limite
+        self._tokens = max(-self._capacity(), min(self._tokens, self._capacity()))
+
+    def set_rate(self, rate):
+        """Change la limite en cours de route (octets/s, 0 ou None = illimité). Désactive le planning."""
+        with self._lock:
+            self._schedule = None
+            self._change_rate(rate, time.monotonic())
+
+    def set_schedule(self, schedule):
+        """Suit un BandwidthSchedule (None pour l'abandonner, la limite actuelle reste alors en place)."""
+        with self._lock:
+            self._schedule = schedule
+            self._next_schedule_check = 0.0
+            self._apply_schedule(time.monotonic())
+
+    def _apply_schedule(self, now):
+        if self._schedule is not None and now >= self._next_schedule_check:
+            self._next_schedule_check = now + SCHEDULE_CHECK_INTERVAL
+            rate = self._schedule.rate_at()
+            if rate != self._rate:
+                self._change_rate(rate, now)
+
+    def reserve(self, nbytes):
+        """Prélève `nbytes` jetons et retourne le temps (s) à attendre avant de continuer."""
+        if not self._rate and self._schedule is None:
+            return 0.0  # Illimité : pas de verrou
+        with self._lock:
+            now = time.monotonic()
+            self._apply_schedule(now)
+            if not self._rate:
+                return 0.0
+            self._refill(now)
+            self._tokens -= nbytes
+            return -self._tokens / self._rate if self._tokens < 0 else 0.0
+
+
+# Limite commune à tous les téléchargements (segments, files d'attente, téléchargements asynchrones)
+GLOBAL_LIMIT = TokenBucket()
+
+
+def set_global_limit(rate):
+    """Limite le débit total de l'application (octets/s, 0 ou None = illimité)."""
+    GLOBAL_LIMIT.set_rate(rate)
+
+
+def set_global_schedule(schedule):
+    """Applique un BandwidthSchedule à la limite globale, ex. illimité la nuit."""
+    GLOBAL_LIMIT.set_schedule(schedule)
+
+
+class Throttle:
+    """Limites appliquées à un téléchargement : la limite globale et, éventuellement, la sienne."""
+
+    def __init__(self, *buckets):
+        self.buckets = [GLOBAL_LIMIT, *buckets]
+
+    def max_read(self):
+        """Taille maximale d'une lecture pour rester régulier, ou None sans limite active."""
+        rates = [bucket.rate for bucket in self.buckets if bucket.rate]
+        if not rates:
+            return None
+        return max(MIN_READ_SIZE, int(min(rates) * READ_INTERVAL))
+
+    def delay(self, nbytes):
+        """Réserve `nbytes` dans chaque seau ; retourne l'attente nécessaire (pour asyncio.sleep)."""
+        return max(bucket.reserve(nbytes) for bucket in self.buckets)
+
+    def consume(self, nbytes):
+        delay = self.delay(nbytes)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def throttle_for(limit=None):
+    """Throttle d'un téléchargement. `limit` : octets/s, ou un TokenBucket à modifier en cours de route."""
+    if limit is None:
+        return Throttle()
+    if not isinstance(limit, TokenBucket):
+        limit = TokenBucket(limit)
+    return Throttle(limit)
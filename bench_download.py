@@ -0,0 +1,184 @@
+"""Banc d'essai des téléchargeurs contre un serveur local aux comportements réalistes.
+
+Mesure, pour chaque combinaison scénario x taille de fichier x nombre de segments x taille de bloc :
+débit, temps jusqu'au premier octet (TTFB), CPU client par Go et pic de mémoire résidente.
+
+Usage : python bench_download.py [--scenarios baseline,no-range] [--sizes 8,64] [--segments auto,1,4,8]
+                                 [--chunks auto,65536] [--downloader robust|simple|stream] [--repeat N] [--json FICHIER]
+                                 [--fsync none|checkpoint|always]
+
+`stream` lit le fichier avec robust_downloader.open_stream sans l'écrire : le pic de mémoire montre
+alors la borne du tampon de réordonnancement.
+
+Le serveur tourne dans un processus séparé et chaque mesure dans un processus neuf :
+le CPU et la mémoire relevés sont ceux du seul client, pour ce seul cas.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from disk_writer import FSYNC_POLICIES, FSYNC_POLICY
+
+# Comportements de serveur (options de LocalFileServer)
+SCENARIOS = {
+    'baseline': {},
+    'no-range': {'ranges': False},
+    'throttled': {'rate': 20 * 1024 * 1024},  # 20 Mo/s par connexion : le parallélisme doit payer
+    'latency': {'latency': 0.05},
+    'disconnect': {'disconnect_after': 4 * 1024 * 1024},
+    'redirect': {'redirects': 3},
+}
+
+
+def _serve(options, sizes, ready, port_value, stop):
+    from local_server import LocalFileServer
+    files = {f"{size}M.bin": os.urandom(size * 1024 * 1024) for size in sizes}
+    server = LocalFileServer(files, **options).start()
+    port_value.value = server.port
+    ready.set()
+    stop.wait()
+    server.stop()
+
+
+def _run_case(downloader, url, segments, chunk, fsync_policy, results):
+    """Exécuté dans un processus neuf : télécharge `url` une fois et renvoie les mesures."""
+    import buffers
+    import http_session
+    from robust_downloader import download_file_robust, open_stream
+    from simple_downloader import download_file
+
+    if chunk != 'auto':
+        buffers.MIN_BUFFER_SIZE = buffers.MAX_BUFFER_SIZE = int(chunk)
+
+    # TTFB : en-têtes de la première réponse reçus
+    first_response = []
+    original_get = http_session.get
+
+    def timed_get(*args, **kwargs):
+        response = original_get(*args, **kwargs)
+        if not first_response:
+            first_response.append(time.perf_counter())
+        return response
+    http_session.get = timed_get
+
+    destination = tempfile.mkdtemp(prefix="bench_download_")
+    quiet = lambda message, is_error=False: None
+    options = {} if segments == 'auto' else {'max_connections': int(segments), 'adaptive_connections': False}
+    streamed = 0
+    try:
+        # Les messages et barres tqdm des téléchargeurs ne doivent pas se mêler au tableau
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+                contextlib.redirect_stderr(devnull):
+            cpu_start, wall_start = time.process_time(), time.perf_counter()
+            if downloader == 'simple':
+                returned = download_file(url, destination)
+            elif downloader == 'stream':
+                with open_stream(url, status_callback=quiet, **options) as stream:
+                    streamed = sum(len(chunk) for chunk in stream)
+                returned = True
+            else:
+                returned = download_file_robust(url, destination, status_callback=quiet, fsync_policy=fsync_policy,
+                                                **options)
+        cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+        file_name = url.rsplit('/', 1)[1]
+        path = os.path.join(destination, file_name)
+        size = os.path.getsize(path) if os.path.exists(path) else streamed
+        ok = returned is not False and size == int(file_name.split('M')[0]) * 1024 * 1024
+    finally:
+        shutil.rmtree(destination, ignore_errors=True)
+
+    results.put({
+        'ok': ok,
+        'throughput': size / (1024 * 1024) / wall if wall else 0.0,
+        'ttfb': (first_response[0] - wall_start) if first_response else None,
+        'cpu_per_gb': cpu / (size / 1024 ** 3) if size else None,
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # Kio -> Mio (Linux)
+    })
+
+
+def measure(context, downloader, url, segments, chunk, fsync_policy):
+    results = context.Queue()
+    process = context.Process(target=_run_case, args=(downloader, url, segments, chunk, fsync_policy, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def best_of(runs):
+    """Meilleur débit / TTFB / CPU sur les essais ; pic mémoire le plus haut ; ok seulement si tous réussissent."""
+    values = lambda key: [run[key] for run in runs if run[key] is not None]
+    return {
+        'ok': all(run['ok'] for run in runs),
+        'throughput': max(values('throughput'), default=0.0),
+        'ttfb': min(values('ttfb'), default=None),
+        'cpu_per_gb': min(values('cpu_per_gb'), default=None),
+        'peak_rss': max(values('peak_rss'), default=0.0),
+    }
+
+
+def _format(value, pattern, scale=1):
+    return pattern.format(value * scale) if value is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai des téléchargeurs sur serveur local.")
+    parser.add_argument('--scenarios', default='baseline,no-range,throttled,latency',
+                        help=f"parmi {', '.join(SCENARIOS)}")
+    parser.add_argument('--sizes', default='8,64', help="tailles de fichier en Mo")
+    parser.add_argument('--segments', default='auto,1,4,8',
+                        help="connexions par fichier (robust) ; 'auto' = nombre ajusté pendant le téléchargement")
+    parser.add_argument('--chunks', default='auto,65536', help="taille du tampon de réception ('auto' = adaptatif)")
+    parser.add_argument('--downloader', choices=('robust', 'simple', 'stream'), default='robust')
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default=FSYNC_POLICY,
+                        help="durabilité des écritures du téléchargeur robust")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--json', help="écrit aussi les résultats dans ce fichier (comparaison entre versions)")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    segment_counts = ['1'] if args.downloader == 'simple' else args.segments.split(',')
+    chunks = args.chunks.split(',')
+    context = multiprocessing.get_context('spawn')
+
+    print(f"{'scénario':<11} {'Mo':>5} {'seg':>4} {'bloc':>7} {'ok':>3} {'Mo/s':>8} {'TTFB ms':>8} "
+          f"{'CPU s/Go':>9} {'RSS Mio':>8}")
+    rows = []
+    for scenario in args.scenarios.split(','):
+        ready, stop = context.Event(), context.Event()
+        port_value = context.Value('i', 0)
+        server = context.Process(target=_serve, args=(SCENARIOS[scenario], sizes, ready, port_value, stop),
+                                 daemon=True)
+        server.start()
+        ready.wait()
+        try:
+            for size in sizes:
+                url = f"http://127.0.0.1:{port_value.value}/{size}M.bin"
+                for segments in segment_counts:
+                    for chunk in chunks:
+                        result = best_of([measure(context, args.downloader, url, segments, chunk, args.fsync)
+                                          for _ in range(args.repeat)])
+                        row = {'scenario': scenario, 'downloader': args.downloader, 'size_mb': size,
+                               'segments': segments, 'chunk': chunk, **result}
+                        rows.append(row)
+                        print(f"{scenario:<11} {size:>5} {segments:>4} {chunk:>7} {'oui' if result['ok'] else 'non':>3} "
+                              f"{result['throughput']:>8.0f} {_format(result['ttfb'], '{:.1f}', 1000):>8} "
+                              f"{_format(result['cpu_per_gb'], '{:.2f}'):>9} {result['peak_rss']:>8.0f}")
+        finally:
+            stop.set()
+            server.join()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
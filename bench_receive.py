@@ -0,0 +1,92 @@
+"""Coût CPU de la boucle de réception : iter_content(1024) historique contre tampon adaptatif + readinto.
+
+Usage : python bench_receive.py [taille_en_Mo] [répétitions]
+Le serveur de test tourne dans un processus séparé pour que seul le CPU du client soit mesuré.
+Vérifie d'abord que les réponses lues par iter_into rendent leur connexion au pool keep-alive.
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+import http_session
+from buffers import iter_into
+from local_server import LocalFileServer
+
+
+def _serve(size, ready, port_value, stop):
+    server = LocalFileServer({'bench.bin': os.urandom(size)}).start()
+    port_value.value = int(server.url('bench.bin').split(':')[2].split('/')[0])
+    ready.set()
+    stop.wait()
+    server.stop()
+
+
+def receive_iter_content(response, file, chunk_size):
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if chunk:
+            file.write(chunk)
+
+
+def receive_readinto(response, file):
+    for chunk in iter_into(response):
+        file.write(chunk)
+
+
+def measure(session, url, receive, *args):
+    """Retourne (secondes CPU par Go, débit en Mo/s) pour un téléchargement complet."""
+    with tempfile.TemporaryFile() as file:
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        with session.get(url, stream=True) as response:
+            response.raise_for_status()
+            receive(response, file, *args)
+            size = file.tell()
+        cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    return cpu / (size / 1024 ** 3), size / (1024 * 1024) / wall
+
+
+def check_connection_reuse(requests_count=5):
+    """Vérifie que des requêtes successives lues par iter_into réutilisent une seule connexion keep-alive."""
+    with LocalFileServer({'small.bin': os.urandom(256 * 1024)}) as server:
+        for _ in range(requests_count):
+            with http_session.get(server.url('small.bin'), stream=True) as response:
+                for _ in iter_into(response):
+                    pass
+        connections = server.connections
+    status = "✅" if connections == 1 else "❌"
+    print(f"{status} {requests_count} requêtes successives : {connections} connexion(s) TCP ouverte(s)")
+    return connections == 1
+
+
+def main(size_mb=256, repeat=3):
+    check_connection_reuse()
+    ready, stop = multiprocessing.Event(), multiprocessing.Event()
+    port_value = multiprocessing.Value('i', 0)
+    server = multiprocessing.Process(target=_serve, args=(size_mb * 1024 * 1024, ready, port_value, stop), daemon=True)
+    server.start()
+    ready.wait()
+    url = f"http://127.0.0.1:{port_value.value}/bench.bin"
+
+    cases = [
+        ("iter_content(1024) (avant)", receive_iter_content, 1024),
+        ("iter_content(64 Kio)", receive_iter_content, 64 * 1024),
+        ("tampon adaptatif + readinto", receive_readinto),
+    ]
+    print(f"Fichier de {size_mb} Mo, meilleur de {repeat} essais")
+    print(f"{'méthode':<30} {'CPU s/Go':>10} {'Mo/s':>10}")
+    with requests.Session() as session:
+        for name, receive, *args in cases:
+            results = [measure(session, url, receive, *args) for _ in range(repeat)]
+            cpu_per_gb = min(r[0] for r in results)
+            throughput = max(r[1] for r in results)
+            print(f"{name:<30} {cpu_per_gb:>10.2f} {throughput:>10.0f}")
+
+    stop.set()
+    server.join()
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
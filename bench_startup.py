@@ -0,0 +1,83 @@
+"""Banc d'essai du démarrage : coût d'import de chaque module, mesuré dans un interpréteur neuf.
+
+Usage : python bench_startup.py [--modules cli,app,download_queue] [--repeat 5] [--top 5] [--json FICHIER]
+
+Pour chaque module : durée de l'import d'après `python -X importtime` (meilleur essai et médiane),
+durée totale du processus (démarrage de l'interpréteur compris), et les dépendances les plus
+coûteuses chargées au passage. L'import de `app` correspond au travail fait avant l'ouverture
+de la fenêtre, création des widgets exceptée ; celui de `cli` au démarrage du mode sans interface.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_MODULES = ('events', 'download_queue', 'cli', 'app', 'robust_downloader', 'streaming_downloader')
+
+
+def import_once(module):
+    """Importe `module` dans un nouveau processus ; retourne (secondes du processus, [(nom, self µs, cumul µs)])."""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise ImportError(result.stderr.strip().splitlines()[-1])
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return wall, imports
+
+
+def measure(module, repeat, top):
+    import_times, process_times = [], []
+    imports = []
+    for _ in range(repeat):
+        wall, imports = import_once(module)
+        import_times.append(next(cumulative for name, _, cumulative in imports if name == module) / 1e6)
+        process_times.append(wall)
+    heaviest = sorted(imports, key=lambda entry: entry[1], reverse=True)[:top]
+    return {
+        'module': module,
+        'import_best': min(import_times),
+        'import_median': statistics.median(import_times),
+        'process_best': min(process_times),
+        'modules_loaded': len(imports),
+        'heaviest': [{'name': name, 'self': self_us / 1e6} for name, self_us, _ in heaviest],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps d'import des modules de l'application.")
+    parser.add_argument('--modules', default=','.join(DEFAULT_MODULES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help="dépendances les plus lentes affichées par module")
+    parser.add_argument('--json', help="écrit aussi les résultats dans ce fichier (comparaison entre versions)")
+    args = parser.parse_args()
+
+    print(f"{'module':<22} {'import ms':>10} {'médiane':>8} {'process ms':>11} {'modules':>8}  plus lents (self ms)")
+    rows = []
+    for module in args.modules.split(','):
+        try:
+            row = measure(module, args.repeat, args.top)
+        except ImportError as e:
+            print(f"{module:<22} échec : {e}")
+            continue
+        rows.append(row)
+        heaviest = ', '.join(f"{entry['name']} {entry['self'] * 1000:.1f}" for entry in row['heaviest'])
+        print(f"{module:<22} {row['import_best'] * 1000:>10.1f} {row['import_median'] * 1000:>8.1f} "
+              f"{row['process_best'] * 1000:>11.1f} {row['modules_loaded']:>8}  {heaviest}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import time
+
+MIN_BUFFER_SIZE = 64 * 1024
+MAX_BUFFER_SIZE = 4 * 1024 * 1024
+TARGET_READ_TIME = 0.05  # Durée visée par lecture : ~20 itérations/s par connexion quel que soit le débit
+RATE_SMOOTHING = 0.3  # Poids de la dernière mesure dans la moyenne mobile du débit
+
+
+class AdaptiveBuffer:
+    """Tampon de réception réutilisé d'une lecture à l'autre, dont la taille suit le débit mesuré.
+
+    Sur une connexion rapide la taille double jusqu'à MAX_BUFFER_SIZE, ce qui divise d'autant
+    le nombre d'itérations Python, d'acquisitions de verrou et d'écritures disque.
+    """
+
+    def __init__(self, initial_size=None, max_size=None):
+        # Lus à l'appel : un banc d'essai peut fixer la taille en modifiant MIN/MAX_BUFFER_SIZE
+        self.size = initial_size or MIN_BUFFER_SIZE
+        self.max_size = max_size or MAX_BUFFER_SIZE
+        self.rate = 0.0
+        self._buffer = bytearray(self.size)
+        self._view = memoryview(self._buffer)
+
+    def view(self):
+        """memoryview de `size` octets sur le tampon, à passer à readinto()."""
+        if len(self._buffer) < self.size:
+            self._view.release()
+            self._buffer = bytearray(self.size)
+            self._view = memoryview(self._buffer)
+        return self._view[:self.size]
+
+    def record(self, nbytes, elapsed):
+        """Met à jour le débit estimé après une lecture et ajuste la taille du tampon."""
+        if elapsed <= 0:
+            elapsed = 1e-6
+        rate = nbytes / elapsed
+        self.rate = rate if not self.rate else (1 - RATE_SMOOTHING) * self.rate + RATE_SMOOTHING * rate
+        wanted = self.rate * TARGET_READ_TIME
+        if wanted > self.size and nbytes == self.size:
+            self.size = min(self.size * 2, self.max_size)
+        elif wanted < self.size / 4:
+            self.size = max(self.size // 2, MIN_BUFFER_SIZE)
+
+
+def _readinto_function(response):
+    """Fonction readinto du corps de `response` (requests), au plus près du socket.
+
+    Sans Content-Encoding, on lit directement dans http.client : aucun objet bytes n'est alloué.
+    Sinon on passe par urllib3, qui décompresse.
+    """
+    encoding = response.headers.get('content-encoding', 'identity').lower()
+    fp = getattr(response.raw, '_fp', None)
+    if encoding == 'identity' and fp is not None and hasattr(fp, 'readinto'):
+        return fp.readinto
+    response.raw.decode_content = True
+    return response.raw.readinto
+
+
+def iter_into(response, buffer=None, throttle=None):
+    """Itère sur le corps de `response` en remplissant un AdaptiveBuffer réutilisé.
+
+    Chaque élément est une memoryview sur le tampon : elle n'est valable que jusqu'à
+    l'itération suivante (l'écrire ou la copier avant de continuer).
+    Avec un `throttle` (bandwidth.Throttle), les lectures sont plafonnées et espacées pour
+    respecter la limite de débit : le serveur est freiné par le contrôle de flux TCP.
+    """
+    buffer = buffer or AdaptiveBuffer()
+    readinto = _readinto_function(response)
+    fp = getattr(response.raw, '_fp', None)
+    while True:
+        view = buffer.view()
+        max_read = throttle.max_read() if throttle else None
+        if max_read:
+            view = view[:max_read]
+        started = time.perf_counter()
+        nbytes = readinto(view)
+        if fp is not None and fp.isclosed():
+            # Corps terminé (lu dans http.client, sans qu'urllib3 le sache) : la connexion retourne au pool,
+            # sinon Response.close() la fermerait au lieu de la garder pour la requête suivante
+            response.raw.release_conn()
+        if not nbytes:
+            return
+        buffer.record(nbytes, time.perf_counter() - started)
+        if throttle:
+            throttle.consume(nbytes)
+        yield view[:nbytes]
@@ -0,0 +1,114 @@
+import base64
+import binascii
+import hashlib
+import re
+import threading
+
+READ_BACK_BLOCK = 1024 * 1024
+
+# Noms des algorithmes dans les en-têtes Digest / Repr-Digest -> noms hashlib
+_HEADER_ALGORITHMS = {'sha-256': 'sha256', 'sha-512': 'sha512', 'sha-384': 'sha384', 'sha': 'sha1',
+                      'sha-1': 'sha1', 'md5': 'md5'}
+_HEX_LENGTHS = {32: 'md5', 40: 'sha1', 64: 'sha256', 128: 'sha512'}
+
+
+class ChecksumMismatch(Exception):
+    """Le contenu téléchargé ne correspond pas à l'empreinte attendue."""
+
+
+def parse_expected_hash(value):
+    """'sha256:abcd…', 'blake2b:…' ou une empreinte hexadécimale seule -> (algorithme, hex).
+
+    Sans préfixe, l'algorithme est déduit de la longueur (md5, sha1, sha256, sha512).
+    """
+    algorithm, _, digest = value.strip().rpartition(':')
+    digest = digest.lower()
+    if not algorithm:
+        algorithm = _HEX_LENGTHS.get(len(digest))
+    algorithm = (algorithm or '').lower().replace('-', '')
+    if algorithm not in hashlib.algorithms_available or not re.fullmatch(r'[0-9a-f]+', digest):
+        raise ValueError(f"Empreinte attendue invalide : {value!r} (format 'sha256:<hex>')")
+    return algorithm, digest
+
+
+def checksums_from_headers(headers, partial=False):
+    """Empreintes du fichier complet annoncées par le serveur (Repr-Digest, Digest, Content-MD5).
+
+    Ignorées si la réponse est compressée. Pour une réponse 206 (`partial`), Content-MD5 ne porte
+    que sur la plage envoyée et n'est donc pas retenu.
+    """
+    if headers.get('Content-Encoding', 'identity').lower() != 'identity':
+        return []
+    checksums = []
+    for header in ('Repr-Digest', 'Digest'):
+        for item in headers.get(header, '').split(','):
+            name, _, value = item.strip().partition('=')
+            algorithm = _HEADER_ALGORITHMS.get(name.strip().lower())
+            if algorithm:
+                digest = _decode_base64(value.strip().strip(':'))
+                if digest:
+                    checksums.append((algorithm, digest))
+    content_md5 = None if partial else _decode_base64(headers.get('Content-MD5', ''))
+    if content_md5:
+        checksums.append(('md5', content_md5))
+    # Le même algorithme peut être annoncé par plusieurs en-têtes
+    return list(dict(checksums).items())
+
+
+def _decode_base64(value):
+    try:
+        return base64.b64decode(value, validate=True).hex() if value else None
+    except (binascii.Error, ValueError):
+        return None
+
+
+class OrderedHasher:
+    """Calcule une ou plusieurs empreintes au fil du téléchargement, dans l'ordre du fichier.
+
+    Les octets qui arrivent exactement à la position courante sont hachés tout de suite (le segment
+    en tête du fichier). Ceux des segments plus loin sont déjà sur disque : quand une plage contiguë
+    est complète, catch_up() la relit depuis `read_range(start, length)` (encore dans le cache
+    du système) puis le hachage reprend directement sur les octets reçus.
+    """
+
+    def __init__(self, checksums, read_range=None):
+        self.checksums = list(checksums)  # [(algorithme, hex attendu), ...]
+        self.read_range = read_range
+        self.position = 0
+        self._hashes = {algorithm: hashlib.new(algorithm) for algorithm, _ in self.checksums}
+        self._lock = threading.Lock()
+
+    def update(self, offset, data):
+        """Hache `data` si elle commence à la position courante ; sinon elle sera relue par catch_up()."""
+        if offset != self.position:
+            return
+        with self._lock:
+            if offset != self.position:
+                return
+            for hash_object in self._hashes.values():
+                hash_object.update(data)
+            self.position += len(data)
+
+    def catch_up(self, available):
+        """Hache depuis le disque les octets [position, available[ déjà écrits."""
+        if self.position >= available or self.read_range is None:
+            return
+        with self._lock:
+            while self.position < available:
+                data = self.read_range(self.position, min(READ_BACK_BLOCK, available - self.position))
+                if not data:
+                    break
+                for hash_object in self._hashes.values():
+                    hash_object.update(data)
+                self.position += len(data)
+
+    def verify(self):
+        """Lève ChecksumMismatch si une des empreintes calculées diffère de celle attendue (None : rien d'attendu)."""
+        for algorithm, expected in self.checksums:
+            actual = self._hashes[algorithm].hexdigest()
+            if expected is not None and actual != expected:
+                raise ChecksumMismatch(f"{algorithm} attendu {expected}, obtenu {actual}")
+
+    def digests(self):
+        """[(algorithme, hex calculé), ...], une fois tout le fichier haché."""
+        return [(algorithm, self._hashes[algorithm].hexdigest()) for algorithm, _ in self.checksums]
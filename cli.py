@@ -0,0 +1,412 @@
+"""Mode sans interface : téléchargements en lot, ou démon piloté par un socket de contrôle local.
+
+Usage :
+  python cli.py URL [URL ...]                       téléchargements directs
+  python cli.py --streaming URL                     vidéos (yt-dlp)
+  python cli.py --playlist URL                      toutes les vidéos d'une playlist, plusieurs à la fois
+  python cli.py -i urls.txt -i manifeste.jsonl      listes d'URL ou manifestes JSONL ('-' = entrée standard)
+  python cli.py --daemon [--socket myidm.sock]      démon : file persistante, commandes via le socket
+  python cli.py --send '{"cmd": "list"}'            envoie une commande au démon et affiche sa réponse
+
+Un manifeste JSONL contient un objet par ligne : {"url": ..., "kind": "direct"|"streaming"|"playlist",
+"destination": ..., "priority": ..., "max_speed": ..., "expected_hash": "sha256:...",
+"mirrors": [autres URL du même fichier]} (seul "url" est requis).
+Les lignes vides ou commençant par '#' sont ignorées.
+
+La sortie standard ne contient que des événements JSON, un par ligne (job, status, progress, error,
+summary) ; les messages des téléchargeurs et de yt-dlp partent sur la sortie d'erreur.
+En mode lot, le programme attend aussi la fin des fusions vidéo + audio (postprocess.POSTPROCESS).
+Code de retour en mode lot : 0 si tout a réussi, 1 sinon.
+
+Commandes du démon (un objet JSON par ligne, une réponse JSON par ligne) :
+submit (mêmes champs qu'une ligne de manifeste), list, cancel {id}, priority {id, priority},
+speed {id, max_speed}, global_speed {max_speed}, clear, metrics {format: json|prometheus}, shutdown.
+Le socket Unix n'est accessible qu'à son propriétaire. Sur TCP (--port), tout processus local peut se
+connecter : chaque commande doit porter le champ "token", jeton aléatoire que le démon écrit au démarrage
+dans --token-file (lisible par son seul propriétaire) ; --send le lit et l'ajoute automatiquement.
+"""
+import argparse
+import hmac
+import json
+import os
+import secrets
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from bandwidth import set_global_limit
+from download_queue import DownloadQueue, DownloadJob, DIRECT, STREAMING, PLAYLIST, MAX_ACTIVE_DOWNLOADS, \
+    MAX_CONNECTIONS_PER_HOST, preload, close_connections
+from events import EventQueue
+from metrics import REGISTRY
+from postprocess import POSTPROCESS, MAX_POSTPROCESS_JOBS
+
+DAEMON_QUEUE_FILE = "daemon_queue.json"  # Distinct de la file de la GUI
+CONTROL_SOCKET = "myidm.sock"
+CONTROL_PORT = 47800  # Systèmes sans socket Unix : TCP sur 127.0.0.1
+CONTROL_TOKEN_FILE = "myidm.token"  # Jeton exigé sur le port TCP de contrôle, lisible par le seul propriétaire
+REPORT_INTERVAL = 1.0  # Secondes entre deux événements de progression d'un même job
+MAX_COMMAND_SIZE = 64 * 1024
+SEND_TIMEOUT = 30.0  # Secondes d'attente de la réponse du démon (--send)
+
+FINISHED_STATES = (DownloadJob.DONE, DownloadJob.FAILED)
+
+
+class ManifestError(ValueError):
+    """Ligne de liste d'URL ou de manifeste inutilisable."""
+
+
+class JsonReporter:
+    """Écrit les événements sur `stream`, un objet JSON par ligne (sortie lisible par un programme)."""
+
+    def __init__(self, stream, interval=REPORT_INTERVAL):
+        self.stream = stream
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._reported = {}  # id du job -> (octets, total) du dernier événement de progression
+        self._next_progress = 0.0
+
+    def emit(self, event, **fields):
+        line = json.dumps({'event': event, 'time': round(time.time(), 3), **fields}, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def status(self, message, is_error=False):
+        self.emit('status', message=message, error=is_error)
+
+    def job(self, data):
+        self.emit('job', **data)
+
+    def progress(self, jobs):
+        """Progression des jobs en cours qui ont avancé, au plus une fois par `interval`."""
+        now = time.monotonic()
+        if now < self._next_progress:
+            return
+        self._next_progress = now + self.interval
+        for job in jobs:
+            current = (job.downloaded, job.total)
+            if job.state == DownloadJob.RUNNING and self._reported.get(job.id) != current:
+                self._reported[job.id] = current
+                self.emit('progress', id=job.id, downloaded=job.downloaded, total=job.total)
+
+
+def parse_entry(line, defaults):
+    """Transforme une ligne (URL seule ou objet JSON) en arguments de DownloadQueue.submit, ou None si ignorée."""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if line.startswith('{'):
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            raise ManifestError(f"JSON invalide : {e}")
+    else:
+        data = {'url': line}
+    return job_arguments(data, defaults)
+
+
+def job_arguments(data, defaults):
+    """Valide un objet de manifeste (ou une commande submit) et complète les champs absents par `defaults`."""
+    if not isinstance(data, dict) or not isinstance(data.get('url'), str) or not data['url']:
+        raise ManifestError("champ 'url' manquant")
+    entry = {**defaults, **{key: data[key] for key in defaults if data.get(key) is not None}, 'url': data['url']}
+    if entry['kind'] not in (DIRECT, STREAMING, PLAYLIST):
+        raise ManifestError(f"type inconnu : {entry['kind']}")
+    try:
+        entry['priority'] = int(entry['priority'])
+        entry['max_speed'] = int(entry['max_speed'])
+    except (TypeError, ValueError):
+        raise ManifestError("'priority' et 'max_speed' doivent être des entiers")
+    mirrors = entry['mirrors']
+    if mirrors is not None and (not isinstance(mirrors, list) or not all(isinstance(m, str) and m for m in mirrors)):
+        raise ManifestError("'mirrors' doit être une liste d'URL")
+    return entry
+
+
+def read_entries(sources, defaults, reporter):
+    """Lit les URL et manifestes de `sources` (chemins, '-' pour l'entrée standard)."""
+    entries = []
+    for source in sources:
+        if source == '-':
+            entries += _read_lines(sys.stdin, source, defaults, reporter)
+            continue
+        try:
+            with open(source, 'r', encoding='utf-8') as f:
+                entries += _read_lines(f, source, defaults, reporter)
+        except OSError as e:
+            reporter.emit('error', source=source, message=str(e))
+    return entries
+
+
+def _read_lines(lines, source, defaults, reporter):
+    entries = []
+    for number, line in enumerate(lines, 1):
+        try:
+            entry = parse_entry(line, defaults)
+        except ManifestError as e:
+            reporter.emit('error', source=source, line=number, message=str(e))
+            continue
+        if entry is not None:
+            entries.append(entry)
+    return entries
+
+
+def pump(events, queue, reporter, until, interval=REPORT_INTERVAL):
+    """Relaie les événements de la file vers `reporter` jusqu'à ce que `until()` soit vrai."""
+    while not until():
+        events.dispatch(on_status=reporter.status, on_job=reporter.job, timeout=min(interval, 0.5))
+        reporter.progress(list(queue.jobs))
+    events.dispatch(on_status=reporter.status, on_job=reporter.job)
+
+
+# --- Démon ---
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    """Une connexion de contrôle : une commande JSON par ligne, une réponse JSON par ligne."""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline(MAX_COMMAND_SIZE)
+            if not line:
+                return
+            try:
+                command = json.loads(line)
+                if not isinstance(command, dict):
+                    raise ManifestError("la commande doit être un objet JSON")
+                if not self.authorized(command.pop('token', None)):
+                    self.reply({'ok': False, 'error': "jeton de contrôle absent ou invalide"})
+                    return  # Connexion fermée : pas de seconde chance sur la même connexion
+                reply = self.server.daemon.execute(command)
+            except (ValueError, KeyError, TypeError) as e:
+                reply = {'ok': False, 'error': str(e)}
+            self.reply(reply)
+
+    def authorized(self, token):
+        expected = getattr(self.server, 'token', None)
+        if expected is None:
+            return True  # Socket Unix : réservé au propriétaire par ses permissions
+        return isinstance(token, str) and hmac.compare_digest(token.encode('utf-8'), expected.encode('utf-8'))
+
+    def reply(self, reply):
+        self.wfile.write((json.dumps(reply, ensure_ascii=False) + "\n").encode('utf-8'))
+
+
+if hasattr(socket, 'AF_UNIX'):
+    class UnixControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+class TcpControlServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Daemon:
+    """Démon de téléchargement : file persistante pilotée par le socket de contrôle."""
+
+    def __init__(self, queue, defaults):
+        self.queue = queue
+        self.defaults = defaults
+        self.stopped = threading.Event()
+        self._commands = {
+            'submit': self._submit,
+            'list': lambda command: {'jobs': [job.to_dict() for job in list(self.queue.jobs)]},
+            'cancel': lambda command: {'cancelled': self.queue.cancel(int(command['id']))},
+            'priority': lambda command: self.queue.set_priority(int(command['id']), int(command['priority'])),
+            'speed': lambda command: self.queue.set_speed_limit(int(command['id']), int(command['max_speed'])),
+            'global_speed': lambda command: set_global_limit(int(command['max_speed'])),
+            'clear': lambda command: self.queue.clear_finished(),
+            'metrics': self._metrics,
+            'shutdown': lambda command: self.stopped.set(),
+        }
+
+    def execute(self, command):
+        handler = self._commands.get(command.get('cmd'))
+        if handler is None:
+            return {'ok': False, 'error': f"commande inconnue : {command.get('cmd')}"}
+        return {'ok': True, **(handler(command) or {})}
+
+    def _submit(self, command):
+        job = self.queue.submit(**job_arguments(command, self.defaults))
+        return {'job': job.to_dict()}
+
+    @staticmethod
+    def _metrics(command):
+        if command.get('format') == 'prometheus':
+            return {'metrics': REGISTRY.to_prometheus()}
+        return {'metrics': json.loads(REGISTRY.to_json())}
+
+
+def control_server(args, daemon):
+    if args.port is not None or not hasattr(socket, 'AF_UNIX'):
+        server = TcpControlServer(('127.0.0.1', args.port or CONTROL_PORT), ControlHandler)
+        server.token = secrets.token_urlsafe(32)
+        write_token(args.token_file, server.token)
+    else:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)  # Reste d'un démon précédent
+        # Créé directement en 0600 : un chmod après bind() laisserait une fenêtre où d'autres peuvent se connecter
+        umask = os.umask(0o177)
+        try:
+            server = UnixControlServer(args.socket, ControlHandler)
+        finally:
+            os.umask(umask)
+    server.daemon = daemon
+    return server
+
+
+def write_token(path, token):
+    """Écrit le jeton de contrôle dans un fichier neuf, lisible et modifiable par le seul propriétaire."""
+    if os.path.exists(path):
+        os.remove(path)  # Reste d'un démon précédent, peut-être avec d'autres permissions
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token)
+
+
+def read_token(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def send_command(args):
+    """Envoie `args.send` au démon et écrit sa réponse sur la sortie standard.
+
+    Code de retour : 0 si le démon répond ok, 1 s'il refuse la commande, 2 si l'échange échoue (démon absent,
+    autre programme sur le port, commande ou réponse qui n'est pas du JSON) ; l'erreur part sur stderr.
+    """
+    try:
+        reply = _exchange(args)
+        ok = json.loads(reply).get('ok')
+    except (OSError, ValueError, AttributeError) as e:
+        sys.stderr.write(f"Échange avec le démon impossible : {type(e).__name__}: {e}\n")
+        return 2
+    sys.stdout.write(reply)
+    return 0 if ok else 1
+
+
+def _exchange(args):
+    command = args.send.strip()
+    if args.port is not None or not hasattr(socket, 'AF_UNIX'):
+        token = read_token(args.token_file)
+        if token is not None:
+            command = json.dumps({**json.loads(command), 'token': token}, ensure_ascii=False)
+        connection = socket.create_connection(('127.0.0.1', args.port or CONTROL_PORT))
+    else:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(args.socket)
+    connection.settimeout(SEND_TIMEOUT)
+    with connection, connection.makefile('rwb') as stream:
+        stream.write(command.encode('utf-8') + b"\n")
+        stream.flush()
+        reply = stream.readline(MAX_COMMAND_SIZE).decode('utf-8')
+    if not reply:
+        raise ConnectionError("connexion fermée sans réponse")
+    return reply
+
+
+# --- Point d'entrée ---
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Téléchargements sans interface graphique (lot ou démon).")
+    parser.add_argument('urls', nargs='*', help="URL à télécharger")
+    parser.add_argument('-i', '--input', action='append', default=[],
+                        help="liste d'URL ou manifeste JSONL ('-' = entrée standard), répétable")
+    parser.add_argument('-d', '--destination', default="downloads")
+    parser.add_argument('--streaming', dest='kind', action='store_const', const=STREAMING, default=DIRECT,
+                        help="type par défaut : vidéo via yt-dlp")
+    parser.add_argument('--playlist', dest='kind', action='store_const', const=PLAYLIST,
+                        help="type par défaut : playlist entière via yt-dlp")
+    parser.add_argument('-j', '--jobs', type=int, default=MAX_ACTIVE_DOWNLOADS, help="téléchargements simultanés")
+    parser.add_argument('--connections-per-host', type=int, default=MAX_CONNECTIONS_PER_HOST)
+    parser.add_argument('--max-speed', type=int, default=0, help="débit maximal par job (octets/s, 0 = illimité)")
+    parser.add_argument('--merge-jobs', type=int, default=MAX_POSTPROCESS_JOBS,
+                        help="fusions ffmpeg simultanées (indépendant de --jobs)")
+    parser.add_argument('--global-speed', type=int, default=0, help="débit maximal total (octets/s)")
+    parser.add_argument('--progress-interval', type=float, default=REPORT_INTERVAL)
+    parser.add_argument('--queue-file', help="file persistante (par défaut : aucune en lot, "
+                                             f"{DAEMON_QUEUE_FILE} en démon)")
+    parser.add_argument('--daemon', action='store_true', help="reste actif et écoute le socket de contrôle")
+    parser.add_argument('--socket', default=CONTROL_SOCKET, help="socket Unix de contrôle")
+    parser.add_argument('--port', type=int, help="port TCP de contrôle sur 127.0.0.1 (au lieu du socket Unix)")
+    parser.add_argument('--token-file', default=CONTROL_TOKEN_FILE,
+                        help="jeton exigé sur le port TCP de contrôle (écrit par le démon, lu par --send)")
+    parser.add_argument('--send', metavar='JSON', help="envoie une commande au démon puis quitte")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    if args.send:
+        return send_command(args)
+
+    # Tout ce qu'écrivent les téléchargeurs et yt-dlp part sur stderr : stdout reste du JSON pur
+    reporter = JsonReporter(sys.stdout, args.progress_interval)
+    sys.stdout = sys.stderr
+
+    POSTPROCESS.max_workers = args.merge_jobs
+    if args.global_speed:
+        set_global_limit(args.global_speed)
+    defaults = {'kind': args.kind, 'destination': args.destination,
+                'priority': 0, 'max_speed': args.max_speed, 'expected_hash': None, 'mirrors': None}
+    sources = args.input or ([] if args.urls or args.daemon else ['-'])
+    entries = [job_arguments({'url': url}, defaults) for url in args.urls] + read_entries(sources, defaults, reporter)
+
+    events = EventQueue()
+    queue = DownloadQueue(queue_file=args.queue_file or (DAEMON_QUEUE_FILE if args.daemon else None),
+                          max_active=args.jobs, max_connections_per_host=args.connections_per_host,
+                          progress_callback=events.progress, status_callback=events.status,
+                          job_callback=lambda job: events.job(job.to_dict()))
+    submitted = [queue.submit(**entry) for entry in entries]
+    queue.start()
+
+    if args.daemon:
+        return run_daemon(args, queue, events, reporter, defaults)
+
+    try:
+        pump(events, queue, reporter,
+             lambda: all(job.state in FINISHED_STATES for job in submitted) and not POSTPROCESS.pending(),
+             args.progress_interval)
+    except KeyboardInterrupt:
+        reporter.emit('interrupted')
+        return 130
+    finally:
+        queue.stop()
+        close_connections()
+    done = sum(1 for job in submitted if job.state == DownloadJob.DONE)
+    reporter.emit('summary', done=done, failed=len(submitted) - done, postprocess_failed=POSTPROCESS.failed)
+    return 0 if done == len(submitted) and not POSTPROCESS.failed else 1
+
+
+def run_daemon(args, queue, events, reporter, defaults):
+    daemon = Daemon(queue, defaults)
+    server = control_server(args, daemon)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    address = server.server_address
+    reporter.emit('listening', address=address if isinstance(address, str) else f"{address[0]}:{address[1]}")
+    preload()  # Le socket répond déjà ; les téléchargeurs se chargent en attendant la première commande
+    try:
+        pump(events, queue, reporter, daemon.stopped.is_set, args.progress_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)
+        if getattr(server, 'token', None) is not None and read_token(args.token_file) == server.token:
+            os.remove(args.token_file)  # Sauf s'il a été remplacé par un autre démon
+        queue.stop()  # Les jobs en cours sont interrompus ; ils reprendront au prochain démarrage
+        close_connections()
+    reporter.emit('stopped')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
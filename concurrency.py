@@ -0,0 +1,87 @@
+import threading
+import time
+
+from segments import MIN_SEGMENT_SIZE
+
+MAX_ADAPTIVE_CONNECTIONS = 32  # Plafond par fichier quand le nombre de connexions s'adapte
+INITIAL_CONNECTIONS = 2
+EVALUATION_INTERVAL = 1.0  # Secondes de mesure du débit entre deux décisions
+MIN_GAIN = 0.1  # Gain de débit total (+10 %) exigé pour garder les connexions ajoutées
+PROBE_INTERVAL = 10.0  # Une fois stabilisé, essai d'une connexion de plus toutes les 10 s
+BACKOFF_COOLDOWN = 5.0  # Secondes sans nouvelle connexion après une erreur serveur (429, 503, coupure...)
+
+
+class ConnectionController:
+    """Nombre de connexions d'un téléchargement segmenté, ajusté d'après le débit total mesuré.
+
+    Démarrage lent : on part de INITIAL_CONNECTIONS et on double tant que le débit total progresse
+    d'au moins MIN_GAIN. Dès qu'un palier n'apporte plus rien, on revient au précédent puis on essaie
+    périodiquement une connexion de plus. Une erreur du serveur (429, 5xx, coupure) divise le nombre
+    de connexions par deux. Jamais plus d'une connexion par MIN_SEGMENT_SIZE du fichier.
+    Avec adaptive=False, `max_connections` connexions du début à la fin (comportement historique).
+    """
+
+    def __init__(self, total_size, max_connections=MAX_ADAPTIVE_CONNECTIONS, adaptive=True,
+                 initial=INITIAL_CONNECTIONS):
+        self.max_connections = max(1, min(max_connections, total_size // MIN_SEGMENT_SIZE))
+        self.adaptive = adaptive
+        self.target = min(initial, self.max_connections) if adaptive else self.max_connections
+        self.slow_start = adaptive
+        self.rate = 0.0  # Dernier débit total mesuré (octets/s)
+        self._lock = threading.Lock()
+        self._window = None  # (instant, octets, connexions) au début de la mesure en cours
+        self._baseline = None  # (connexions, débit) du dernier palier retenu
+        self._hold_until = 0.0
+        self._next_probe = 0.0
+
+    def update(self, downloaded, now=None):
+        """Nouvelle mesure (octets téléchargés au total) ; retourne le nombre de connexions voulu."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if not self.adaptive:
+                return self.target
+            if self._window is None or self._window[2] != self.target:
+                # Première mesure, ou nombre de connexions changé entre-temps : nouvelle fenêtre
+                self._window = (now, downloaded, self.target)
+                return self.target
+            started, start_bytes, connections = self._window
+            if now - started < EVALUATION_INTERVAL:
+                return self.target
+            self.rate = (downloaded - start_bytes) / (now - started)
+            self._window = (now, downloaded, connections)
+            self._decide(connections, self.rate, now)
+            return self.target
+
+    def _decide(self, connections, rate, now):
+        if self._baseline is not None and self._baseline[0] != connections:
+            # Première mesure complète après un ajout de connexions : ont-elles servi ?
+            base_connections, base_rate = self._baseline
+            if rate < base_rate * (1 + MIN_GAIN):
+                self._set(base_connections)
+                self.slow_start = False
+                self._next_probe = now + PROBE_INTERVAL
+                return
+        self._baseline = (connections, rate)
+        if now < self._hold_until or connections >= self.max_connections:
+            return
+        if self.slow_start:
+            self._set(min(connections * 2, self.max_connections))
+        elif now >= self._next_probe:
+            self._set(connections + 1)
+            self._next_probe = now + PROBE_INTERVAL
+
+    def _set(self, connections):
+        self.target = max(1, connections)
+
+    def backoff(self, now=None):
+        """Le serveur sature ou refuse (429, 5xx, coupure) : moitié moins de connexions, pas de hausse pendant un temps."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if not self.adaptive or now < self._hold_until:
+                return self.target  # Erreurs simultanées de plusieurs workers : une seule réduction
+            self._set(self.target // 2)
+            self.slow_start = False
+            self._baseline = None
+            self._hold_until = now + BACKOFF_COOLDOWN
+            self._next_probe = self._hold_until + PROBE_INTERVAL
+            return self.target
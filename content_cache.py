@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from extraction_cache import normalize_url, user_cache_dir
+from metrics import REGISTRY
+
+CONTENT_CACHE_DIR = user_cache_dir('content')
+MAX_CONTENT_CACHE_SIZE = 8 * 1024 * 1024 * 1024  # Octets de fichiers gardés au-delà desquels les moins utilisés partent
+# Ordre d'essai pour copier un fichier entre le cache et une destination : reflink (copie à la demande,
+# Btrfs, XFS) puis copie complète ; fichiers toujours indépendants. 'hardlink' seulement sur demande.
+MATERIALIZE_METHODS = ('reflink', 'copy')
+HASH_BLOCK_SIZE = 1024 * 1024
+FICLONE = 0x40049409  # ioctl Linux de clonage d'un fichier entier (reflink)
+
+
+class ContentCache:
+    """Cache local des fichiers téléchargés, adressé par leur contenu (SHA-256).
+
+    Chaque fichier n'y est gardé qu'une fois (objects/<sha256>), retrouvé par deux index :
+    la source (URL finale normalisée, ETag fort, taille), et chaque empreinte connue du contenu
+    ('sha256:<hex>', 'md5:<hex>'...). Une entrée n'est retenue que si elle confirme toutes les empreintes
+    attendues : une source qui a changé de contenu sans changer d'ETag ne passe pas.
+
+    Les fichiers passent du téléchargement au cache, puis du cache à une destination, avec la première
+    méthode de `methods` qui réussit (MATERIALIZE_METHODS : reflink puis copie). Sur un système de
+    fichiers qui sait cloner, télécharger à nouveau le même fichier, sous une autre URL ou vers un autre
+    dossier, devient une opération locale quasi immédiate. Avec 'hardlink' dans `methods`, le cache et les
+    destinations partagent le même fichier : le modifier sur place les modifie tous ; un objet dont la
+    taille ou la date de modification ne correspond plus à l'enregistrement est alors écarté.
+    Au-delà de `max_size` octets, les objets les moins récemment utilisés sont évincés ; les entrées
+    d'index qui y menaient disparaissent à leur prochaine lecture.
+    """
+
+    def __init__(self, directory=CONTENT_CACHE_DIR, max_size=MAX_CONTENT_CACHE_SIZE, methods=MATERIALIZE_METHODS):
+        self.directory = directory
+        self.max_size = max_size
+        self.methods = methods
+        self._lock = threading.Lock()
+
+    @property
+    def objects_dir(self):
+        return os.path.join(self.directory, "objects")
+
+    @property
+    def index_dir(self):
+        return os.path.join(self.directory, "index")
+
+    def _object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    def _index_path(self, key):
+        return os.path.join(self.index_dir, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json")
+
+    @staticmethod
+    def source_key(final_url, etag, size):
+        """Clé d'index d'une source, ou None sans ETag fort (un ETag faible ne garantit pas les mêmes octets)."""
+        if not etag or etag.startswith('W/') or not size:
+            return None
+        return f"source\n{normalize_url(final_url)}\n{etag}\n{size}"
+
+    @staticmethod
+    def digest_key(algorithm, digest):
+        return f"digest\n{algorithm}:{digest.lower()}"
+
+    def lookup(self, final_url=None, etag=None, size=None, digests=()):
+        """Retourne le SHA-256 d'un fichier en cache correspondant à la source ou à l'une des empreintes, ou None.
+
+        Toutes les empreintes `digests` ([(algorithme, hex), ...]) doivent être connues et identiques
+        pour le fichier trouvé.
+        """
+        expected = {algorithm: digest.lower() for algorithm, digest in digests}
+        keys = [self.digest_key(algorithm, digest) for algorithm, digest in expected.items()]
+        if final_url:
+            keys.append(self.source_key(final_url, etag, size))
+        for key in keys:
+            entry = self._read_index(key, size) if key else None
+            if entry and all(entry['digests'].get(algorithm) == digest for algorithm, digest in expected.items()):
+                REGISTRY.increment("content_cache_total", result="hit")
+                return entry['sha256']
+        REGISTRY.increment("content_cache_total", result="miss")
+        return None
+
+    def _read_index(self, key, size=None):
+        path = self._index_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            stat = os.stat(self._object_path(entry['sha256']))
+            if stat.st_size != entry['size'] or stat.st_mtime_ns != entry['mtime_ns']:
+                # Modifié sur place à travers un lien physique : le contenu n'est plus celui indexé
+                self._remove(self._object_path(entry['sha256']))
+                raise ValueError("objet modifié")
+            if size and stat.st_size != size:
+                return None
+            entry['digests'] = dict(entry.get('digests') or {})
+        except FileNotFoundError:
+            self._remove(path)  # Entrée absente, ou objet évincé depuis
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            self._remove(path)
+            return None
+        return entry
+
+    def materialize(self, sha256, destination):
+        """Place le fichier `sha256` en `destination` ; retourne la méthode utilisée, ou None en cas d'échec."""
+        source = self._object_path(sha256)
+        method = self._place(source, destination, f"{destination}.{threading.get_ident()}.cache.tmp")
+        if method:
+            self._touch(source)
+        return method
+
+    def _place(self, source, destination, temp_path):
+        """Copie `source` en `destination` (via `temp_path`) avec la première méthode qui réussit, ou None."""
+        for method in self.methods:
+            try:
+                if method == 'reflink':
+                    _reflink(source, temp_path)
+                elif method == 'hardlink':
+                    os.link(source, temp_path)
+                else:
+                    shutil.copyfile(source, temp_path)  # copy_file_range / sendfile quand le système le permet
+                os.replace(temp_path, destination)
+                self._remove(temp_path)  # Destination déjà liée au même objet : rename() ne fait rien
+            except OSError:
+                self._remove(temp_path)  # Autre système de fichiers, clonage non supporté... : méthode suivante
+                continue
+            return method
+        return None
+
+    def store(self, path, final_url=None, etag=None, size=None, digests=()):
+        """Ajoute le fichier complet `path` au cache ; retourne son SHA-256, ou None si le cache est inutilisable.
+
+        `digests` ([(algorithme, hex), ...]) sont des empreintes du fichier calculées à la réception : sans
+        SHA-256 parmi elles, le fichier est relu en entier pour le calculer.
+        """
+        digests = [(algorithm, digest.lower()) for algorithm, digest in digests]
+        sha256 = dict(digests).get('sha256')
+        try:
+            if sha256 is None:
+                sha256 = _file_sha256(path)
+                digests.append(('sha256', sha256))
+            object_path = self._object_path(sha256)
+            if not os.path.exists(object_path):
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                if self._place(path, object_path, f"{object_path}.{threading.get_ident()}.tmp") is None:
+                    return None
+            stat = os.stat(object_path)
+            entry = {'sha256': sha256, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'url': final_url,
+                     'digests': dict(digests)}
+            keys = [self.digest_key(algorithm, digest) for algorithm, digest in digests]
+            keys.append(self.source_key(final_url, etag, size or stat.st_size) if final_url else None)
+            os.makedirs(self.index_dir, exist_ok=True)
+            for key in keys:
+                if key is not None:
+                    self._write_index(key, entry)
+        except OSError:
+            return None  # Un cache inutilisable ne doit pas faire échouer le téléchargement
+        self._evict()
+        return sha256
+
+    def _write_index(self, key, entry):
+        path = self._index_path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, path)
+        except OSError:
+            self._remove(temp_path)
+            raise
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _objects(self):
+        objects = []
+        try:
+            with os.scandir(self.objects_dir) as prefixes:
+                for prefix in prefixes:
+                    with os.scandir(prefix.path) as entries:
+                        objects.extend(entry for entry in entries if not entry.name.endswith('.tmp'))
+        except OSError:
+            pass
+        return objects
+
+    def _evict(self):
+        """Supprime les objets les moins récemment utilisés jusqu'à repasser sous max_size."""
+        with self._lock:
+            objects = []
+            for entry in self._objects():
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Supprimé entre-temps par un autre thread
+                objects.append((stat.st_atime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in objects)
+            for _, size, path in sorted(objects):
+                if total <= self.max_size:
+                    break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _touch(path):
+        """Date d'accès mise à jour (ordre d'éviction LRU), date de modification intacte (contrôle d'intégrité)."""
+        try:
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _file_sha256(path):
+    hash_object = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(HASH_BLOCK_SIZE)
+            if not data:
+                return hash_object.hexdigest()
+            hash_object.update(data)
+
+
+def _reflink(source, destination):
+    """Clone `source` en `destination` sans copier les données (OSError si le système de fichiers ne sait pas)."""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("reflink non supporté sur ce système")
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+# Cache commun aux téléchargements directs qui l'activent (download_file_robust(cache=CONTENT_CACHE))
+CONTENT_CACHE = ContentCache()
@@ -0,0 +1,272 @@
+import os
+import threading
+import time
+from collections import deque
+
+WRITE_BLOCK_SIZE = 1024 * 1024  # Les blocs reçus plus petits sont regroupés jusqu'à cette taille avant écriture
+MAX_WRITE_QUEUE = 32 * 1024 * 1024  # Octets en attente d'écriture au-delà desquels les workers attendent le disque
+
+# Politique de durabilité (fsync)
+FSYNC_NONE = 'none'  # Le système écrit quand il veut : après une coupure de courant, le journal peut mentir
+FSYNC_CHECKPOINT = 'checkpoint'  # fsync avant chaque sauvegarde du journal et à la fin de chaque segment
+FSYNC_ALWAYS = 'always'  # fsync après chaque bloc (disques amovibles, données précieuses)
+FSYNC_POLICIES = (FSYNC_NONE, FSYNC_CHECKPOINT, FSYNC_ALWAYS)
+FSYNC_POLICY = FSYNC_CHECKPOINT
+
+_WRITE, _CLOSE, _CHECKPOINT, _STOP = 'write', 'close', 'checkpoint', 'stop'
+
+
+class DiskWriter:
+    """Étage d'écriture d'un téléchargement segmenté : un thread dédié vide une file bornée vers le disque.
+
+    Les workers réseau ne font que déposer leurs blocs (les petits regroupés par segment jusqu'à
+    `block_size` octets) et repartent lire le socket. Tant que le disque suit (rien en file pour ce
+    segment), un worker à la fois écrit lui-même son bloc, sans le recopier ni réveiller le thread d'écriture : c'est le cas
+    courant, et la copie coûtait autant que le reste du traitement. Un disque lent ne bloque donc qu'un
+    worker dans son écriture, ou les autres quand `max_queue` octets attendent déjà, et ce temps d'attente est mesuré (queue_wait) au lieu de se
+    confondre avec le débit réseau. segment.written n'avance qu'une fois les octets écrits : le journal
+    et la relecture des empreintes ne voient jamais d'octets encore en file. Selon `fsync_policy`,
+    le thread d'écriture appelle fsync avant chaque sauvegarde du journal (FSYNC_CHECKPOINT), après
+    chaque bloc (FSYNC_ALWAYS) ou jamais (FSYNC_NONE).
+    """
+
+    def __init__(self, fsync_policy=FSYNC_POLICY, max_queue=MAX_WRITE_QUEUE, block_size=WRITE_BLOCK_SIZE):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Politique fsync inconnue : {fsync_policy!r} ({', '.join(FSYNC_POLICIES)})")
+        self.fsync_policy = fsync_policy
+        self.max_queue = max_queue
+        self.block_size = block_size
+        self.queued = 0  # Octets en file
+        self.error = None  # Première erreur d'écriture (disque plein, support retiré...)
+        # Mesures
+        self.bytes = 0
+        self.writes = 0
+        self.write_time = 0.0  # Secondes passées dans write(), thread d'écriture et écritures directes
+        self.fsyncs = 0
+        self.fsync_time = 0.0
+        self.queue_peak = 0
+        self.queue_waits = 0  # Blocs qui ont dû attendre de la place dans la file
+        self.queue_wait = 0.0  # Secondes d'attente des workers réseau, tous confondus
+        self.direct_writes = 0  # Blocs écrits par leur worker, sans passer par la file
+        self._direct = threading.Lock()  # Tenu par le worker qui écrit directement, ou pendant une sauvegarde du journal
+        self._items = deque()
+        self._dirty = set()  # Fichiers écrits depuis le dernier fsync
+        self._checkpoint_pending = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="disk-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def open(self, segment, file):
+        """Enveloppe le fichier ouvert par le stockage pour `segment` (positionné sur segment.position)."""
+        return QueuedFile(self, segment, file)
+
+    def checkpoint(self, save, wait=False):
+        """Programme `save()` (sauvegarde du journal) après les écritures en file, précédée d'un fsync selon la politique.
+
+        Sans `wait`, une sauvegarde déjà en file rend celle-ci inutile.
+        """
+        done = threading.Event()
+        with self._condition:
+            if self._checkpoint_pending and not wait:
+                return
+            self._checkpoint_pending = True
+            self._items.append((_CHECKPOINT, save, done))
+            self._condition.notify_all()
+        if wait:
+            done.wait()
+
+    def close(self):
+        """Termine les écritures en file puis arrête le thread."""
+        if self._thread is None:
+            return
+        with self._condition:
+            self._items.append((_STOP,))
+            self._condition.notify_all()
+        self._thread.join()
+        self._thread = None
+
+    def stats(self):
+        return {'bytes': self.bytes, 'writes': self.writes, 'write_time': self.write_time, 'fsyncs': self.fsyncs,
+                'fsync_time': self.fsync_time, 'queue_peak': self.queue_peak, 'queue_waits': self.queue_waits,
+                'queue_wait': self.queue_wait, 'direct_writes': self.direct_writes, 'fsync_policy': self.fsync_policy, 'error': self.error}
+
+    # --- Côté workers ---
+
+    def _write_direct(self, handle, data):
+        """Écrit `data` depuis le thread du worker ; False s'il faut la passer par la file.
+
+        Seulement si aucun bloc de ce segment n'attend dans la file (ils doivent passer avant) et qu'aucun
+        autre worker n'est déjà en train d'écrire : un disque lent ne retient qu'un worker à la fois.
+        """
+        if handle.queued or not self._direct.acquire(blocking=False):
+            return False
+        try:
+            self._write(handle, data)
+            with self._condition:
+                self.direct_writes += 1
+        finally:
+            self._direct.release()
+        return True
+
+    def _put(self, item, size=0):
+        with self._condition:
+            item[1].queued += size
+            if size and self.queued and self.queued + size > self.max_queue:
+                # File pleine : le disque est le goulot, le worker attend (contrôle de flux TCP côté serveur)
+                started = time.perf_counter()
+                while self.queued and self.queued + size > self.max_queue:
+                    self._condition.wait()
+                self.queue_waits += 1
+                self.queue_wait += time.perf_counter() - started
+            self.queued += size
+            self.queue_peak = max(self.queue_peak, self.queued)
+            self._items.append(item)
+            self._condition.notify_all()
+
+    # --- Thread d'écriture ---
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._items:
+                    self._condition.wait()
+                item = self._items.popleft()
+            kind = item[0]
+            if kind == _WRITE:
+                _, handle, data = item
+                self._write(handle, data)
+                with self._condition:
+                    self.queued -= len(data)
+                    handle.queued -= len(data)
+                    self._condition.notify_all()
+            elif kind == _CLOSE:
+                _, handle, done = item
+                self._close(handle)
+                done.set()
+            elif kind == _CHECKPOINT:
+                _, save, done = item
+                with self._condition:
+                    self._checkpoint_pending = False
+                with self._direct:  # Aucune écriture directe entre le fsync et la sauvegarde du journal
+                    self._sync_dirty()
+                    save()
+                done.set()
+            else:
+                return
+
+    def _write(self, handle, data):
+        if handle.error:
+            return  # Une écriture a déjà échoué pour ce segment : la suite est redemandée plus tard
+        try:
+            started = time.perf_counter()
+            handle.file.write(data)
+            elapsed = time.perf_counter() - started
+            if self.fsync_policy == FSYNC_ALWAYS:
+                self._fsync(handle.file)
+            else:
+                self._dirty.add(handle.file)
+        except OSError as e:
+            handle.error = e
+            self.error = self.error or f"{type(e).__name__}: {e}"
+            return
+        with self._condition:  # Thread d'écriture et écritures directes
+            self.write_time += elapsed
+            self.bytes += len(data)
+            self.writes += 1
+        handle.segment.written += len(data)  # Lu sans verrou (progression, journal, empreintes)
+
+    def _close(self, handle):
+        try:
+            if handle.file in self._dirty:
+                self._dirty.discard(handle.file)
+                if self.fsync_policy != FSYNC_NONE and not handle.error:
+                    self._fsync(handle.file)
+        except OSError as e:
+            handle.error = handle.error or e
+            self.error = self.error or f"{type(e).__name__}: {e}"
+        finally:
+            handle.file.close()
+
+    def _sync_dirty(self):
+        if self.fsync_policy == FSYNC_NONE:
+            return
+        for file in list(self._dirty):
+            try:
+                self._fsync(file)
+            except OSError as e:
+                self.error = self.error or f"{type(e).__name__}: {e}"
+        self._dirty.clear()
+
+    def _fsync(self, file):
+        started = time.perf_counter()
+        os.fsync(file.fileno())
+        elapsed = time.perf_counter() - started
+        with self._condition:
+            self.fsync_time += elapsed
+            self.fsyncs += 1
+
+
+class QueuedFile:
+    """Fichier d'un segment vu par son worker : write() dépose les blocs reçus dans la file du DiskWriter.
+
+    Un bloc d'au moins `block_size` octets est écrit tout de suite si le disque suit, sinon copié (le tampon
+    de réception est réutilisé) et mis en file ; les plus petits sont accumulés jusqu'à `block_size` octets, puis le tampon d'accumulation
+    part sans être recopié. Le reste part à la fermeture, qui attend que tout soit écrit. Une erreur d'écriture est levée (OSError)
+    au write() suivant ou à la fermeture, et les octets non écrits redeviennent à télécharger.
+    """
+
+    def __init__(self, writer, segment, file):
+        self.writer = writer
+        self.segment = segment
+        self.file = file
+        self.error = None
+        self.queued = 0  # Octets de ce segment dans la file du DiskWriter
+        self._pending = bytearray()
+
+    def write(self, data):
+        if self.error:
+            raise self.error
+        size = len(data)
+        if not self._pending and size >= self.writer.block_size:
+            if not self.writer._write_direct(self, data):
+                self.writer._put((_WRITE, self, bytes(data)), size)
+        else:
+            self._pending += data
+            if len(self._pending) >= self.writer.block_size:
+                self._flush()
+        if self.error:
+            raise self.error
+        return size
+
+    def _flush(self):
+        if self.writer._write_direct(self, self._pending):
+            self._pending.clear()
+            return
+        pending, self._pending = self._pending, bytearray()  # Confié au thread d'écriture : plus modifié ici
+        self.writer._put((_WRITE, self, pending), len(pending))
+
+    def close(self):
+        if self._pending and not self.error:
+            self._flush()
+        done = threading.Event()
+        self.writer._put((_CLOSE, self, done))
+        done.wait()
+        if self.error:
+            # Les octets réservés mais jamais écrits seront redemandés (segment incomplet, pas de trou)
+            self.segment.position = self.segment.written
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.close()
+        except OSError:
+            if exc_type is None:
+                raise
+        return False
@@ -0,0 +1,382 @@
+import importlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from bandwidth import TokenBucket
+from segments import MAX_CONNECTIONS
+from streaming_downloader import MAX_CONCURRENT_VIDEOS, CONCURRENT_FRAGMENTS  # Module léger : yt-dlp n'y est importé qu'au téléchargement
+
+QUEUE_FILE = "download_queue.json"
+MAX_ACTIVE_DOWNLOADS = 3  # Téléchargements en cours simultanément, tous hôtes confondus
+MAX_CONNECTIONS_PER_HOST = 8  # Connexions simultanées vers un même hôte, tous téléchargements confondus
+MAX_FINISHED_JOBS = 100  # Jobs terminés (réussis ou échoués) gardés dans la file, les plus récents
+
+DIRECT = 'direct'
+STREAMING = 'streaming'
+PLAYLIST = 'playlist'  # Playlist ou page de vidéos : plusieurs vidéos yt-dlp en parallèle
+
+# Les téléchargeurs (requests, tqdm, yt-dlp) ne sont importés qu'au premier job de leur type, ou par preload()
+DOWNLOADER_MODULES = {DIRECT: 'robust_downloader', STREAMING: 'streaming_downloader',
+                      PLAYLIST: 'streaming_downloader'}
+
+
+def preload(kinds=(DIRECT, STREAMING)):
+    """Importe les téléchargeurs dans un thread de fond, pour que le premier job démarre sans attendre.
+
+    À appeler une fois l'interface affichée. Un import simultané depuis un job attend simplement la fin
+    de celui-ci (verrou d'import de Python).
+    """
+    def _load():
+        for kind in kinds:
+            try:
+                importlib.import_module(DOWNLOADER_MODULES[kind])
+            except ImportError:
+                pass  # L'erreur sera signalée, avec le job concerné, à son lancement
+
+    thread = threading.Thread(target=_load, name="preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def close_connections():
+    """Ferme les connexions keep-alive des téléchargements directs, à la fermeture de l'application.
+
+    Sans rien importer : si aucun téléchargement direct n'a eu lieu, il n'y a rien à fermer.
+    """
+    http_session = sys.modules.get('http_session')
+    if http_session is not None:
+        http_session.close_all()
+
+
+class DownloadJob:
+    """Un téléchargement de la file : direct (download_file_robust), streaming (download_streaming_video)
+    ou playlist (download_playlist)."""
+
+    QUEUED, RUNNING, MERGING, DONE, FAILED = 'queued', 'running', 'merging', 'done', 'failed'
+
+    def __init__(self, job_id, url, kind=DIRECT, destination="downloads", priority=0, state=QUEUED, added_at=None,
+                 max_speed=0, expected_hash=None, mirrors=None):
+        self.id = job_id
+        self.url = url
+        self.kind = kind
+        self.destination = destination
+        self.priority = priority
+        self.state = state
+        self.added_at = added_at or time.time()
+        self.max_speed = max_speed  # Octets/s, 0 = illimité (la limite globale s'applique toujours)
+        self.expected_hash = expected_hash  # "sha256:..." vérifié à la fin (téléchargement direct)
+        self.mirrors = list(mirrors or [])  # Autres URL du même fichier (téléchargement direct)
+        self.connections = 0  # Connexions réservées sur l'hôte pendant l'exécution
+        self.videos = 1  # Vidéos en parallèle (playlist) et fragments par vidéo : videos × fragments = connections
+        self.fragments = 1
+        self.downloaded = 0  # Dernière progression reçue pour ce job
+        self.total = 0
+        self.limit = TokenBucket(max_speed)  # Partagé par les segments du job, modifiable en cours de route
+
+    @property
+    def host(self):
+        return urlsplit(self.url).netloc.lower()
+
+    @property
+    def hosts(self):
+        """Hôtes que le job peut contacter d'après ses URL : le sien, puis ceux de ses miroirs."""
+        hosts = [self.host]
+        for mirror in self.mirrors:
+            host = urlsplit(mirror).netloc.lower()
+            if host not in hosts:
+                hosts.append(host)
+        return hosts
+
+    def to_dict(self):
+        return {'id': self.id, 'url': self.url, 'kind': self.kind, 'destination': self.destination,
+                'priority': self.priority, 'state': self.state, 'added_at': self.added_at,
+                'max_speed': self.max_speed, 'expected_hash': self.expected_hash, 'mirrors': self.mirrors}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['url'], data.get('kind', DIRECT), data.get('destination', "downloads"),
+                   data.get('priority', 0), data.get('state', cls.QUEUED), data.get('added_at'),
+                   data.get('max_speed', 0), data.get('expected_hash'), data.get('mirrors'))
+
+    def __repr__(self):
+        return f"DownloadJob({self.id}, {self.kind}, {self.state}, {self.url})"
+
+
+class DownloadQueue:
+    """File d'attente persistante des téléchargements.
+
+    Les jobs de plus haute priorité partent en premier (puis dans l'ordre d'ajout), dans la limite
+    de `max_active` téléchargements simultanés et de `max_connections_per_host` connexions par hôte.
+    Un job direct reçoit les connexions encore libres vers son hôte (au plus MAX_CONNECTIONS),
+    un job playlist autant de vidéos simultanées (au plus MAX_CONCURRENT_VIDEOS).
+    Les connexions d'un job sont décomptées sur chacun de ses hôtes (URL et miroirs) : les segments
+    peuvent toutes les ouvrir vers n'importe lequel. Limite connue : une redirection vers un autre hôte
+    (CDN) n'est pas visible avant le démarrage, ses connexions restent comptées sur l'hôte de l'URL.
+    La file est sauvegardée dans `queue_file` : les jobs interrompus repartent au prochain démarrage
+    (None : file en mémoire seulement). Seuls les `keep_finished` derniers jobs terminés y restent :
+    les plus anciens sont oubliés au chargement et à chaque fin de job.
+    Un job streaming ou playlist dont les fusions ffmpeg sont encore en file (postprocess) libère sa place
+    et ses connexions mais reste MERGING : il ne passe DONE qu'une fois toutes ses fusions réussies, FAILED sinon.
+    """
+
+    def __init__(self, queue_file=QUEUE_FILE, max_active=MAX_ACTIVE_DOWNLOADS,
+                 max_connections_per_host=MAX_CONNECTIONS_PER_HOST, progress_callback=None, status_callback=None,
+                 job_callback=None, keep_finished=MAX_FINISHED_JOBS):
+        self.queue_file = queue_file
+        self.keep_finished = keep_finished
+        self.max_active = max_active
+        self.max_connections_per_host = max_connections_per_host
+        self.progress_callback = progress_callback
+        self.status_callback = status_callback
+        self.job_callback = job_callback  # Appelé avec le job à chaque changement d'état
+
+        self.jobs = self._load()
+        self._ids = itertools.count(max((job.id for job in self.jobs), default=0) + 1)
+        self._condition = threading.Condition()
+        self._host_connections = defaultdict(int)
+        self._active = 0
+        self._dispatcher = None
+        self._stopping = False
+
+    def _load(self):
+        if self.queue_file is None:
+            return []
+        try:
+            with open(self.queue_file, 'r', encoding='utf-8') as f:
+                jobs = [DownloadJob.from_dict(data) for data in json.load(f)]
+        except (OSError, ValueError, KeyError):
+            return []
+        for job in jobs:
+            if job.state in (DownloadJob.RUNNING, DownloadJob.MERGING):  # Interrompu par la fermeture précédente
+                job.state = DownloadJob.QUEUED
+        return self._prune(jobs)
+
+    def _prune(self, jobs):
+        """`jobs` sans les jobs terminés au-delà des `keep_finished` plus récents (ordre conservé)."""
+        finished = [job for job in jobs if job.state in (DownloadJob.DONE, DownloadJob.FAILED)]
+        if len(finished) <= self.keep_finished:
+            return jobs
+        dropped = set(map(id, finished[:len(finished) - self.keep_finished]))
+        return [job for job in jobs if id(job) not in dropped]
+
+    def _save(self):
+        if self.queue_file is None:
+            return
+        temp_path = f"{self.queue_file}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump([job.to_dict() for job in self.jobs], f, indent=1)
+            os.replace(temp_path, self.queue_file)
+        except OSError as e:
+            self._update_status(f"Impossible de sauvegarder la file d'attente : {e}", True)
+
+    def _update_status(self, message, is_error=False):
+        if self.status_callback:
+            self.status_callback(message, is_error)
+        else:
+            print(message)
+
+    def _notify_job(self, job):
+        if self.job_callback:
+            self.job_callback(job)
+
+    # --- API publique ---
+
+    def submit(self, url, kind=DIRECT, destination="downloads", priority=0, max_speed=0, expected_hash=None,
+               mirrors=None):
+        """Ajoute un téléchargement à la file et retourne le DownloadJob créé."""
+        with self._condition:
+            job = DownloadJob(next(self._ids), url, kind, destination, priority, max_speed=max_speed,
+                              expected_hash=expected_hash, mirrors=mirrors)
+            self.jobs.append(job)
+            self._save()
+            self._condition.notify()
+        self._update_status(f"Ajouté à la file d'attente ({self.pending_count()} en attente) : {url}")
+        self._notify_job(job)
+        return job
+
+    def set_priority(self, job_id, priority):
+        with self._condition:
+            for job in self.jobs:
+                if job.id == job_id:
+                    job.priority = priority
+            self._save()
+            self._condition.notify()
+
+    def set_speed_limit(self, job_id, max_speed):
+        """Change le débit maximal d'un job (octets/s, 0 = illimité), y compris pendant son téléchargement."""
+        with self._condition:
+            for job in self.jobs:
+                if job.id == job_id:
+                    job.max_speed = max_speed
+                    job.limit.set_rate(max_speed)
+            self._save()
+
+    def cancel(self, job_id):
+        """Retire un job qui n'a pas encore démarré. Retourne False s'il est déjà en cours ou terminé."""
+        with self._condition:
+            for job in self.jobs:
+                if job.id == job_id and job.state == DownloadJob.QUEUED:
+                    self.jobs.remove(job)
+                    self._save()
+                    return True
+        return False
+
+    def clear_finished(self):
+        with self._condition:
+            self.jobs = [job for job in self.jobs if job.state not in (DownloadJob.DONE, DownloadJob.FAILED)]
+            self._save()
+
+    def pending_count(self):
+        with self._condition:
+            return sum(1 for job in self.jobs if job.state == DownloadJob.QUEUED)
+
+    def start(self):
+        """Démarre le répartiteur (thread de fond). Les jobs déjà en file partent immédiatement."""
+        with self._condition:
+            if self._dispatcher is not None:
+                return self
+            self._stopping = False
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+            self._dispatcher.start()
+        return self
+
+    def stop(self):
+        """Arrête de lancer de nouveaux jobs (ceux en cours vont jusqu'au bout)."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+            self._dispatcher = None
+
+    def wait(self, timeout=None):
+        """Attend que la file soit vide et qu'aucun job ne soit en cours (fusions comprises)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._active or any(job.state in (DownloadJob.QUEUED, DownloadJob.MERGING) for job in self.jobs):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    # --- Répartition ---
+
+    def _dispatch_loop(self):
+        with self._condition:
+            while not self._stopping:
+                job = self._next_job()
+                if job is None:
+                    self._condition.wait()
+                    continue
+                self._reserve(job)
+                self._save()
+                threading.Thread(target=self._run_job, args=(job,), daemon=True).start()
+
+    def _reserve(self, job):
+        """Passe `job` en cours et réserve ses connexions sur ses hôtes (appelé avec le verrou)."""
+        job.state = DownloadJob.RUNNING
+        self._active += 1
+        for host in job.hosts:
+            self._host_connections[host] += job.connections
+
+    def _next_job(self):
+        """Job prioritaire dont les hôtes ont encore des connexions libres (appelé avec le verrou).
+
+        Hôtes connus d'avance seulement (DownloadJob.hosts) : voir la limite sur les redirections (DownloadQueue).
+        """
+        if self._active >= self.max_active:
+            return None
+        queued = [job for job in self.jobs if job.state == DownloadJob.QUEUED]
+        for job in sorted(queued, key=lambda j: (-j.priority, j.added_at)):
+            free = min(self.max_connections_per_host - self._host_connections[host] for host in job.hosts)
+            if free <= 0:
+                continue
+            if job.kind in (STREAMING, PLAYLIST):
+                # Chaque vidéo ouvre jusqu'à `fragments` connexions (formats HLS/DASH) : on les compte toutes
+                job.videos = min(MAX_CONCURRENT_VIDEOS, max(1, free // CONCURRENT_FRAGMENTS)) \
+                    if job.kind == PLAYLIST else 1
+                job.fragments = max(1, min(CONCURRENT_FRAGMENTS, free // job.videos))
+                job.connections = job.videos * job.fragments
+            else:
+                job.connections = min(MAX_CONNECTIONS, free)
+            return job
+        return None
+
+    def _run_job(self, job):
+        self._notify_job(job)
+
+        def progress(current, total, *extra):
+            job.downloaded, job.total = current, total
+            if self.progress_callback:
+                self.progress_callback(current, total, *extra)
+
+        success = False
+        merges = []  # Futures des fusions ffmpeg programmées par le job (appendées depuis ses threads)
+        try:
+            if job.kind == PLAYLIST:
+                from streaming_downloader import download_playlist
+                success = download_playlist(job.url, job.destination,
+                                            progress_callback=progress,
+                                            status_callback=self.status_callback,
+                                            max_workers=job.videos,
+                                            concurrent_fragments=job.fragments,
+                                            merge_callback=merges.append)
+            elif job.kind == STREAMING:
+                from streaming_downloader import download_streaming_video
+                success = download_streaming_video(job.url, job.destination,
+                                                   progress_callback=progress,
+                                                   status_callback=self.status_callback,
+                                                   concurrent_fragments=job.fragments,
+                                                   merge_callback=merges.append)
+            else:
+                from robust_downloader import download_file_robust
+                success = download_file_robust(job.url, job.destination,
+                                               progress_callback=progress,
+                                               status_callback=self.status_callback,
+                                               max_connections=job.connections,
+                                               expected_hash=job.expected_hash,
+                                               mirrors=job.mirrors,
+                                               max_speed=job.limit)
+        except Exception as e:
+            self._update_status(f"❌ Erreur inattendue pour {job.url} : {e}", True)
+        finally:
+            merging = success and bool(merges)
+            with self._condition:
+                self._active -= 1
+                for host in job.hosts:
+                    self._host_connections[host] -= job.connections
+                if merging:
+                    # Le réseau est libéré pour les jobs suivants, le résultat attend les fusions
+                    job.state = DownloadJob.MERGING
+                    self._save()
+                    self._condition.notify_all()
+                else:
+                    self._finish(job, success)
+            self._notify_job(job)
+            if merging:
+                for future in merges:
+                    future.add_done_callback(lambda _: self._merged(job, merges))
+
+    def _merged(self, job, merges):
+        """Appelé à la fin de chaque fusion du job (thread de postprocess) : termine le job après la dernière."""
+        with self._condition:
+            if job.state != DownloadJob.MERGING or not all(future.done() for future in merges):
+                return
+            self._finish(job, all(not future.cancelled() and future.exception() is None and future.result()
+                                  for future in merges))
+        self._notify_job(job)
+
+    def _finish(self, job, success):
+        """Passe `job` DONE ou FAILED et sauvegarde la file (appelé avec le verrou)."""
+        job.state = DownloadJob.DONE if success else DownloadJob.FAILED
+        self.jobs = self._prune(self.jobs)
+        self._save()
+        self._condition.notify_all()
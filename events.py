@@ -0,0 +1,65 @@
+import threading
+from collections import deque
+
+STATUS, PROGRESS, JOB = 'status', 'progress', 'job'
+MAX_PENDING_EVENTS = 1000
+
+
+class EventQueue:
+    """File d'événements des threads de téléchargement vers l'interface (GUI ou CLI), sans dépendance à Tk.
+
+    status(), progress() et job() s'utilisent directement comme status_callback, progress_callback
+    et job_callback, depuis n'importe quel thread. Le consommateur appelle dispatch() ou drain()
+    depuis son propre thread (boucle after() de Tk, boucle principale du CLI).
+    La progression est fusionnée (seule la dernière compte) et les autres événements sont bornés
+    à `max_pending` : la mémoire reste constante même si personne ne lit.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_EVENTS):
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=max_pending)
+        self._progress = None
+        self.dropped = 0  # Événements perdus faute de lecture
+
+    def status(self, message, is_error=False):
+        self._put((STATUS, (message, is_error)))
+
+    def job(self, job):
+        self._put((JOB, (job,)))
+
+    def progress(self, *args):
+        with self._condition:
+            self._progress = args
+            self._condition.notify()
+
+    def _put(self, event):
+        with self._condition:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            self._condition.notify()
+
+    def drain(self, timeout=0):
+        """Retourne les événements en attente [(type, args), ...], la progression la plus récente en dernier.
+
+        :param timeout: Secondes à attendre si rien n'est en attente (0 = pas d'attente, None = indéfiniment)
+        """
+        with self._condition:
+            if not self._events and self._progress is None and timeout != 0:
+                self._condition.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            if self._progress is not None:
+                events.append((PROGRESS, self._progress))
+                self._progress = None
+            return events
+
+    def dispatch(self, on_status=None, on_progress=None, on_job=None, timeout=0):
+        """Vide la file en appelant le gestionnaire de chaque événement ; retourne le nombre d'événements."""
+        handlers = {STATUS: on_status, PROGRESS: on_progress, JOB: on_job}
+        events = self.drain(timeout)
+        for kind, args in events:
+            handler = handlers[kind]
+            if handler:
+                handler(*args)
+        return len(events)
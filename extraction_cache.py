@@ -0,0 +1,186 @@
+import calendar
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from metrics import REGISTRY
+
+
+def user_cache_dir(name):
+    """Dossier de cache de l'utilisateur : %LOCALAPPDATA%, ~/Library/Caches ou $XDG_CACHE_HOME (~/.cache)."""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'myidm', name)
+
+
+CACHE_DIR = user_cache_dir('extraction')
+CACHE_TTL = 3600.0  # Secondes de validité d'une extraction sans date d'expiration connue
+MAX_CACHE_SIZE = 64 * 1024 * 1024  # Octets sur disque au-delà desquels les entrées les moins utilisées partent
+EXPIRY_MARGIN = 300.0  # Une URL signée qui expire dans moins de 5 min ne vaut plus la peine d'être reprise
+
+# Paramètres de suivi sans effet sur le contenu : retirés de la clé
+IGNORED_PARAMS = ('utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content', 'fbclid', 'gclid',
+                  'si', 'feature')
+# Champs des info dicts jamais écrits sur disque : en-têtes de requête et cookies de session
+SECRET_FIELDS = ('http_headers', 'cookies')
+
+
+def normalize_url(url):
+    """Forme canonique d'une URL pour la clé du cache : schéma et hôte en minuscules, port par défaut,
+    fragment et paramètres de suivi retirés, paramètres triés."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key not in IGNORED_PARAMS)
+    return urlunsplit((scheme, host, parts.path or '/', urlencode(query), ''))
+
+
+def url_expiry(url):
+    """Horodatage d'expiration d'une URL signée (YouTube, CloudFront, S3, Akamai), ou None."""
+    params = dict(parse_qsl(urlsplit(url).query))
+    for key in ('expire', 'Expires', 'expires'):
+        if params.get(key, '').isdigit():
+            return int(params[key])
+    if params.get('X-Amz-Date') and params.get('X-Amz-Expires', '').isdigit():
+        try:
+            signed = calendar.timegm(time.strptime(params['X-Amz-Date'], "%Y%m%dT%H%M%SZ"))
+        except ValueError:
+            return None
+        return signed + int(params['X-Amz-Expires'])
+    for key in ('hdnts', 'hdnea', '__token__'):  # Jetons Akamai : "exp=1700000000~acl=...~hmac=..."
+        for field in params.get(key, '').split('~'):
+            if field.startswith('exp=') and field[4:].isdigit():
+                return int(field[4:])
+    return None
+
+
+def info_expiry(info):
+    """Expiration la plus proche parmi les URL de média d'un info dict yt-dlp (formats retenus en priorité)."""
+    formats = info.get('requested_formats') or info.get('formats') or []
+    urls = [info.get('url')] + [fmt.get('url') for fmt in formats]
+    expiries = [url_expiry(url) for url in urls if url]
+    expiries = [expiry for expiry in expiries if expiry is not None]
+    return min(expiries) if expiries else None
+
+
+def without_secrets(value):
+    """Copie d'un info dict (et de ses formats, entrées...) sans les champs SECRET_FIELDS."""
+    if isinstance(value, dict):
+        return {key: without_secrets(item) for key, item in value.items() if key not in SECRET_FIELDS}
+    if isinstance(value, list):
+        return [without_secrets(item) for item in value]
+    return value
+
+
+class ExtractionCache:
+    """Cache disque des extractions yt-dlp (info dicts), par URL normalisée.
+
+    Une entrée est ignorée et supprimée après `ttl` secondes, ou dès que l'une de ses URL signées
+    expire dans moins de EXPIRY_MARGIN secondes. Au-delà de `max_size` octets, les entrées les moins
+    récemment utilisées sont évincées. `kind` distingue les extractions d'une même URL faites avec
+    des options différentes (vidéo seule, playlist à plat).
+    Les entrées contiennent encore des URL signées : dossier et fichiers ne sont lisibles que par
+    l'utilisateur, et les en-têtes et cookies (SECRET_FIELDS) sont retirés avant l'écriture ; yt-dlp
+    recalcule les en-têtes par défaut à la reprise, et une reprise qui échoue relance l'extraction.
+    """
+
+    def __init__(self, directory=CACHE_DIR, ttl=CACHE_TTL, max_size=MAX_CACHE_SIZE):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def _path(self, url, kind):
+        key = hashlib.sha256(f"{kind}\n{normalize_url(url)}".encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, url, kind='video'):
+        """Retourne l'info dict en cache pour `url`, ou None (absent, périmé ou illisible)."""
+        path = self._path(url, kind)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            now = time.time()
+            expires_at = min(entry['cached_at'] + self.ttl, (entry.get('expires_at') or float('inf')) - EXPIRY_MARGIN)
+            if now >= expires_at:
+                raise ValueError("entrée périmée")
+            os.utime(path, (now, os.stat(path).st_mtime))  # Date d'accès : ordre d'éviction LRU
+        except FileNotFoundError:
+            REGISTRY.increment("extraction_cache_total", result="miss")
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            self._remove(path)
+            REGISTRY.increment("extraction_cache_total", result="expired")
+            return None
+        REGISTRY.increment("extraction_cache_total", result="hit")
+        return entry['info']
+
+    def put(self, url, info, kind='video'):
+        """Enregistre `info` (passé par YoutubeDL.sanitize_info, donc sérialisable en JSON), sans SECRET_FIELDS."""
+        path = self._path(url, kind)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            self._remove(temp_path)
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'url': url, 'cached_at': time.time(), 'expires_at': info_expiry(info),
+                           'info': without_secrets(info)}, f)
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError):
+            self._remove(temp_path)  # Un cache inutilisable ne doit pas empêcher le téléchargement
+            return
+        self._evict()
+
+    def invalidate(self, url, kind='video'):
+        self._remove(self._path(url, kind))
+
+    def clear(self):
+        for entry in self._entries():
+            self._remove(entry.path)
+
+    def _entries(self):
+        try:
+            with os.scandir(self.directory) as entries:
+                return [entry for entry in entries if entry.name.endswith('.json')]
+        except OSError:
+            return []
+
+    def _evict(self):
+        """Supprime les entrées les moins récemment lues jusqu'à repasser sous max_size."""
+        with self._lock:
+            entries = []
+            for entry in self._entries():
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Supprimée entre-temps par un autre thread
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_size:
+                    break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Cache commun aux téléchargements streaming du processus
+EXTRACTION_CACHE = ExtractionCache()
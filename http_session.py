@@ -0,0 +1,83 @@
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.cookies import RequestsCookieJar
+
+DEFAULT_POOL_SIZE = 32  # Connexions keep-alive gardées ouvertes par hôte (= concurrency.MAX_ADAPTIVE_CONNECTIONS)
+HOST_POOL_SIZES = {}  # Tailles spécifiques, ex. {'video.sibnet.ru': 16}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+# Les sessions partagées ne gardent aucun cookie : chaque téléchargement a son propre bocal (new_cookie_jar)
+_NO_COOKIES = DefaultCookiePolicy(allowed_domains=[])
+
+
+def _host_key(url):
+    parts = urlsplit(url)
+    return parts.scheme.lower(), parts.netloc.lower()
+
+
+def set_host_pool_size(host, size):
+    """Fixe le nombre de connexions gardées ouvertes vers `host` (ex. 'example.com' ou 'example.com:8080').
+
+    La session déjà créée pour cet hôte est remplacée au prochain appel à get_session().
+    """
+    with _sessions_lock:
+        HOST_POOL_SIZES[host.lower()] = size
+        for key in [k for k in _sessions if k[1] == host.lower()]:
+            del _sessions[key]
+
+
+def get_session(url):
+    """Retourne la session partagée pour l'hôte de `url`.
+
+    Une session par hôte : les connexions TCP/TLS sont réutilisées entre la requête initiale,
+    les segments et les téléchargements successifs vers le même serveur. Ses cookies ne le sont pas :
+    la session n'en garde aucun, ils passent par le bocal du téléchargement (get(..., cookies=jar)).
+    """
+    key = _host_key(url)
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            pool_size = HOST_POOL_SIZES.get(key[1], DEFAULT_POOL_SIZE)
+            session = requests.Session()
+            session.cookies.set_policy(_NO_COOKIES)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[key] = session
+        return session
+
+
+def new_cookie_jar():
+    """Bocal de cookies d'un téléchargement, partagé par ses requêtes (sondage, segments, miroirs)."""
+    return RequestsCookieJar()
+
+
+def get(url, cookies=None, **kwargs):
+    """Équivalent de requests.get() passant par la session partagée de l'hôte.
+
+    `cookies` (new_cookie_jar()) est envoyé avec la requête et reçoit les cookies posés par la réponse
+    et ses redirections.
+    """
+    response = get_session(url).get(url, cookies=cookies, **kwargs)
+    if cookies is not None:
+        for received in response.history + [response]:
+            cookies.update(received.cookies)
+    return response
+
+
+def close_all():
+    """Ferme toutes les connexions ouvertes (à appeler à la fermeture de l'application)."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
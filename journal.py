@@ -0,0 +1,89 @@
+import json
+import os
+
+
+class RemoteFileChanged(Exception):
+    """Le fichier distant ne correspond plus au journal (ETag, Last-Modified ou taille différents)."""
+
+
+class DownloadJournal:
+    """Journal de reprise d'un téléchargement segmenté.
+
+    Contient l'URL, l'URL finale après redirections, les validateurs HTTP (ETag, Last-Modified),
+    la taille totale et l'avancement de chaque segment. Avec lui, une reprise n'a besoin
+    d'aucune requête préalable : chaque segment envoie If-Range, et un serveur dont le fichier
+    a changé répond 200 au lieu de 206, ce qui refuse la reprise au lieu de mélanger deux versions.
+    """
+
+    def __init__(self, path, url, final_url=None, total_size=0, etag=None, last_modified=None, segments=None,
+                 checksums=None):
+        self.path = path
+        self.url = url
+        self.final_url = final_url or url
+        self.total_size = total_size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.segments = segments or []  # [[start, written, end], ...]
+        self.checksums = checksums or []  # [[algorithme, hex], ...] à vérifier à la fin
+
+    @classmethod
+    def from_response(cls, path, url, response, total_size):
+        return cls(path, url, str(response.url), total_size,
+                   response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+    @classmethod
+    def load(cls, path):
+        """Lit le journal, ou None s'il n'existe pas ou est illisible."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return cls(path, data['url'], data.get('final_url'), data.get('total_size', 0), data.get('etag'),
+                       data.get('last_modified'), data.get('segments'), data.get('checksums'))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, segments=None):
+        """Écrit le journal de façon atomique (fichier temporaire puis renommage)."""
+        if segments is not None:
+            self.segments = segments
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'url': self.url, 'final_url': self.final_url, 'total_size': self.total_size,
+                       'etag': self.etag, 'last_modified': self.last_modified, 'segments': self.segments,
+                       'checksums': self.checksums}, f)
+        os.replace(temp_path, self.path)
+
+    def delete(self):
+        for path in (self.path, f"{self.path}.tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @property
+    def completed_bytes(self):
+        return sum(written - start for start, written, end in self.segments)
+
+    def if_range(self):
+        """Valeur de l'en-tête If-Range : ETag fort de préférence, sinon Last-Modified (None si aucun)."""
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+    def matches(self, etag, last_modified, total_size):
+        """Vrai si les validateurs observés correspondent à ceux du journal."""
+        if total_size != self.total_size:
+            return False
+        if self.etag and etag:
+            return self.etag == etag
+        if self.last_modified and last_modified:
+            return self.last_modified == last_modified
+        return True
+
+    def check_response(self, response):
+        """Lève RemoteFileChanged si une réponse 206 ne correspond plus au fichier journalisé."""
+        content_range = response.headers.get('Content-Range', '')
+        total = content_range.rpartition('/')[2]
+        if total.isdigit() and int(total) != self.total_size:
+            raise RemoteFileChanged(f"taille distante {total} au lieu de {self.total_size}")
+        etag = response.headers.get('ETag')
+        if self.etag and etag and etag != self.etag:
+            raise RemoteFileChanged(f"ETag {etag} au lieu de {self.etag}")
@@ -0,0 +1,184 @@
+import http.server
+import os
+import re
+import socketserver
+import sys
+import threading
+import time
+
+SEND_BLOCK = 64 * 1024  # Taille des écritures quand le débit est limité ou la connexion coupée en route
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, comme un vrai serveur
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        options = self.server.options
+        if options['latency']:
+            time.sleep(options['latency'])
+
+        # /_hop<n>/nom : étapes d'une chaîne de redirections vers /nom
+        match = re.fullmatch(r'/(?:_hop(\d+)/)?(.*)', self.path)
+        hop, name = int(match.group(1) or 0), match.group(2)
+        if hop < options['redirects']:
+            self.send_response(302)
+            self.send_header('Location', f"/_hop{hop + 1}/{name}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        data = self.server.files.get(name)
+        if data is None:
+            self.send_error(404)
+            return
+
+        # Change dès que le contenu servi sous ce nom est remplacé
+        etag = f'"{len(data):x}-{id(data):x}"'
+        start, end, status = 0, len(data) - 1, 200
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        if match and data and options['ranges'] and (if_range is None or if_range == etag):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), len(data) - 1) if match.group(2) else len(data) - 1
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start + 1))
+        if options['ranges']:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.end_headers()
+
+        if send_body:
+            try:
+                self._send_body(memoryview(data)[start:end + 1], options)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Le client a coupé (segment volé, téléchargement annulé...)
+
+    def _send_body(self, body, options):
+        rate, cut = options['rate'], options['disconnect_after']
+        if not rate and cut is None:
+            self.wfile.write(body)
+            return
+        if cut is not None and cut < len(body):
+            body = body[:cut]
+            self.close_connection = True  # Coupure en plein corps : le client reçoit moins que Content-Length
+        started = time.monotonic()
+        for offset in range(0, len(body), SEND_BLOCK):
+            self.wfile.write(body[offset:offset + SEND_BLOCK])
+            if rate:
+                # Débit limité par connexion : on attend d'être revenu sous `rate` octets/s
+                ahead = (offset + SEND_BLOCK) / rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+
+class _ThreadingServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+    connections = 0  # Connexions TCP acceptées (réutilisation keep-alive du client)
+
+    def process_request(self, request, client_address):
+        self.connections += 1  # Appelé par le seul thread serve_forever
+        super().process_request(request, client_address)
+
+    def handle_error(self, request, client_address):
+        # Connexion fermée par le client (segment terminé, réponse abandonnée) : rien d'anormal
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class LocalFileServer:
+    """Serveur HTTP local (Range, keep-alive, ETag) pour tester les téléchargeurs sans réseau.
+
+    Comportements de serveurs réels, réglables à la création ou via configure() :
+      ranges           : False pour ignorer Range (réponses 200, pas d'Accept-Ranges)
+      rate             : débit maximal par connexion en octets/s (0 = illimité)
+      latency          : délai en secondes avant chaque réponse
+      disconnect_after : coupe la connexion après ce nombre d'octets de corps (None = jamais)
+      redirects        : nombre de redirections 302 avant le fichier
+
+    Exemple :
+        with LocalFileServer({'test.bin': os.urandom(1024)}, rate=1024 * 1024) as server:
+            download_file_robust(server.url('test.bin'), 'downloads')
+    """
+
+    def __init__(self, files=None, host='127.0.0.1', port=0, **options):
+        self._server = _ThreadingServer((host, port), _RequestHandler)
+        self._server.files = dict(files or {})
+        self._server.options = {'ranges': True, 'rate': 0, 'latency': 0, 'disconnect_after': None, 'redirects': 0}
+        self.configure(**options)
+        self._thread = None
+
+    def configure(self, **options):
+        """Change le comportement du serveur (voir la docstring de la classe) pour les requêtes suivantes."""
+        unknown = set(options) - set(self._server.options)
+        if unknown:
+            raise TypeError(f"Options inconnues : {', '.join(sorted(unknown))}")
+        self._server.options.update(options)
+        return self
+
+    @property
+    def files(self):
+        return self._server.files
+
+    def add_file(self, name, size=None, data=None):
+        """Ajoute un fichier servi sous /name (contenu aléatoire de `size` octets si data n'est pas fourni)."""
+        self._server.files[name] = data if data is not None else os.urandom(size)
+        return self.url(name)
+
+    @property
+    def connections(self):
+        """Nombre de connexions TCP acceptées depuis le démarrage."""
+        return self._server.connections
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def url(self, name):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/{name}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    server = LocalFileServer({'test.bin': os.urandom(50 * 1024 * 1024)}).start()
+    print(f"Serveur de test : {server.url('test.bin')} (Ctrl+C pour arrêter)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,271 @@
+import contextlib
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+MAX_RECORDED_DOWNLOADS = 100  # Téléchargements terminés gardés en détail pour to_json()
+METRIC_PREFIX = "myidm"
+
+
+class SegmentMetrics:
+    """Mesures d'une requête de segment (ou du flux unique en mode simple / d'un format yt-dlp)."""
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.requested_at = time.time()
+        self._started = time.perf_counter()
+        self.ttfb = None  # Secondes jusqu'aux en-têtes de la réponse (connexion et DNS compris)
+        self.reused_probe = False  # Corps de la requête de sondage repris pour ce segment
+        self.bytes = 0  # Incrémenté par le worker à chaque bloc écrit
+        self.disk_time = 0.0  # Secondes passées dans les écritures disque (attente de la file du DiskWriter comprise)
+        self.duration = None
+        self.error = None
+
+    def response(self, response):
+        self.ttfb = response.elapsed.total_seconds()
+
+    def finish(self, error=None):
+        self.error = error
+        self.duration = time.perf_counter() - self._started
+
+    @property
+    def elapsed(self):
+        return self.duration if self.duration is not None else time.perf_counter() - self._started
+
+    @property
+    def rate(self):
+        elapsed = self.elapsed
+        return self.bytes / elapsed if elapsed else 0.0
+
+    def to_dict(self):
+        return {'start': self.start, 'end': self.end, 'requested_at': self.requested_at, 'ttfb': self.ttfb,
+                'reused_probe': self.reused_probe, 'bytes': self.bytes, 'duration': self.duration,
+                'rate': self.rate, 'disk_time': self.disk_time, 'error': self.error}
+
+
+class DownloadMetrics:
+    """Mesures d'un téléchargement : phases (sondage, redirections), segments, octets, relances, erreurs."""
+
+    def __init__(self, registry, download_id, url, kind):
+        self._registry = registry
+        self.id = download_id
+        self.url = url
+        self.kind = kind
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.final_url = url
+        self.total_size = 0
+        self.probe_time = None  # Sondage complet, redirections comprises
+        self.ttfb = None
+        self.redirects = 0
+        self.redirect_times = []  # TTFB de chaque étape de la chaîne de redirections
+        self.phases = {}  # Nom de phase -> secondes depuis le début (ex. extraction yt-dlp)
+        self.connection_changes = []  # [(secondes depuis le début, connexions)] décidés par le ConnectionController
+        self.sources = []  # Débit, octets et abandon de chaque source (mirrors.Mirror.to_dict)
+        self.disk = {}  # Écritures, fsync et attente de la file (disk_writer.DiskWriter.stats)
+        self.segments = []
+        self.retries = 0
+        self.errors = []
+        self.duration = None
+        self.success = None
+        self._lock = threading.Lock()
+
+    def probe(self, response, elapsed):
+        """Enregistre la réponse de sondage : URL finale, redirections et TTFB de chaque étape."""
+        self.probe_time = elapsed
+        self.final_url = str(response.url)
+        self.redirects = len(response.history)
+        self.redirect_times = [hop.elapsed.total_seconds() for hop in response.history]
+        self.ttfb = response.elapsed.total_seconds()
+        self._registry.span("probe", self.started_at, elapsed, download=self.id, redirects=self.redirects,
+                            status=response.status_code)
+
+    def mark(self, phase):
+        """Note la fin de la phase `phase` (durée depuis le début du téléchargement)."""
+        elapsed = time.perf_counter() - self._started
+        self.phases[phase] = elapsed
+        self._registry.span(phase, self.started_at, elapsed, download=self.id)
+
+    def connections(self, count):
+        self.connection_changes.append((time.perf_counter() - self._started, count))
+
+    def segment(self, start, end):
+        segment = SegmentMetrics(start, end)
+        with self._lock:
+            self.segments.append(segment)
+        return segment
+
+    def finish_segment(self, segment, error=None):
+        segment.finish(error)
+        if error:
+            self.error(error)
+        self._registry.add_segment(self, segment)
+
+    def disk_writer(self, stats):
+        """Enregistre les mesures de l'étage d'écriture : un disque lent se voit dans queue_wait."""
+        self.disk = stats
+        self._registry.increment("disk_bytes_written_total", stats['bytes'], kind=self.kind)
+        self._registry.increment("disk_io_seconds_total", stats['write_time'], kind=self.kind)
+        self._registry.increment("disk_fsync_total", stats['fsyncs'], kind=self.kind)
+        self._registry.increment("disk_fsync_seconds_total", stats['fsync_time'], kind=self.kind)
+        self._registry.increment("disk_queue_waits_total", stats['queue_waits'], kind=self.kind)
+        self._registry.increment("disk_queue_wait_seconds_total", stats['queue_wait'], kind=self.kind)
+
+    def retry(self):
+        with self._lock:
+            self.retries += 1
+        self._registry.increment("retries_total", kind=self.kind)
+
+    def error(self, message):
+        with self._lock:
+            self.errors.append(str(message))
+
+    @property
+    def bytes(self):
+        return sum(segment.bytes for segment in self.segments)
+
+    def finish(self, success):
+        self.duration = time.perf_counter() - self._started
+        self.success = bool(success)
+        self._registry.finish_download(self)
+
+    def to_dict(self):
+        return {'id': self.id, 'url': self.url, 'final_url': self.final_url, 'kind': self.kind,
+                'started_at': self.started_at, 'total_size': self.total_size, 'probe_time': self.probe_time,
+                'ttfb': self.ttfb, 'redirects': self.redirects,
+                'redirect_times': self.redirect_times, 'phases': dict(self.phases),
+                'connection_changes': list(self.connection_changes), 'sources': list(self.sources),
+                'disk': dict(self.disk),
+                'bytes': self.bytes, 'duration': self.duration,
+                'retries': self.retries, 'errors': list(self.errors), 'success': self.success,
+                'segments': [segment.to_dict() for segment in list(self.segments)]}
+
+
+class MetricsRegistry:
+    """Registre des mesures du processus : compteurs agrégés + détail des derniers téléchargements.
+
+    Export au format texte Prometheus (to_prometheus) ou JSON (to_json). Les fonctions abonnées
+    par add_span_hook(hook) reçoivent chaque étape chronométrée :
+    hook(name, start, duration, attributes), à relayer par exemple vers OpenTelemetry.
+    """
+
+    def __init__(self, max_recorded=MAX_RECORDED_DOWNLOADS):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._counters = defaultdict(float)  # (nom, labels triés) -> valeur
+        self._active = {}
+        self._finished = deque(maxlen=max_recorded)
+        self._span_hooks = []
+
+    def start_download(self, url, kind):
+        download = DownloadMetrics(self, next(self._ids), url, kind)
+        with self._lock:
+            self._active[download.id] = download
+        return download
+
+    def finish_download(self, download):
+        result = "success" if download.success else "failure"
+        with self._lock:
+            self._active.pop(download.id, None)
+            self._finished.append(download)
+        self.increment("downloads_total", kind=download.kind, result=result)
+        self.increment("download_seconds_sum", download.duration, kind=download.kind)
+        self.increment("download_seconds_count", kind=download.kind)
+        if download.ttfb is not None:
+            self.increment("ttfb_seconds_sum", download.ttfb, kind=download.kind)
+            self.increment("ttfb_seconds_count", kind=download.kind)
+        self.span("download", download.started_at, download.duration, download=download.id, kind=download.kind,
+                  url=download.url, success=download.success, bytes=download.bytes)
+
+    def add_segment(self, download, segment):
+        self.increment("bytes_total", segment.bytes, kind=download.kind)
+        self.increment("segment_requests_total", kind=download.kind)
+        self.increment("disk_write_seconds_total", segment.disk_time, kind=download.kind)
+        if segment.error:
+            self.increment("segment_errors_total", kind=download.kind)
+        self.span("segment", segment.requested_at, segment.duration, download=download.id, range_start=segment.start,
+                  range_end=segment.end, bytes=segment.bytes, ttfb=segment.ttfb, error=segment.error)
+
+    def increment(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    # --- Traces ---
+
+    def add_span_hook(self, hook):
+        self._span_hooks.append(hook)
+
+    def remove_span_hook(self, hook):
+        self._span_hooks.remove(hook)
+
+    def span(self, name, start, duration, **attributes):
+        """Publie une étape déjà chronométrée (start : horodatage time.time()) aux hooks."""
+        for hook in list(self._span_hooks):
+            try:
+                hook(name, start, duration, attributes)
+            except Exception:
+                pass  # Un hook défaillant ne doit pas arrêter le téléchargement
+
+    @contextlib.contextmanager
+    def timed(self, name, **attributes):
+        """Chronomètre le bloc et le publie comme étape `name`."""
+        start, started = time.time(), time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            self.span(name, start, time.perf_counter() - started, **attributes)
+
+    # --- Export ---
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters), list(self._active.values()), list(self._finished)
+
+    def to_json(self, indent=None):
+        counters, active, finished = self.snapshot()
+        return json.dumps({
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                         for (name, labels), value in sorted(counters.items())],
+            'active': [download.to_dict() for download in active],
+            'finished': [download.to_dict() for download in finished],
+        }, indent=indent)
+
+    def to_prometheus(self):
+        counters, active, _ = self.snapshot()
+        lines = []
+        declared = set()
+        for (name, labels), value in sorted(counters.items()):
+            metric = f"{METRIC_PREFIX}_{name}"
+            family, kind = metric, "counter"
+            for suffix in ('_sum', '_count'):  # Paires _sum/_count : un summary sans quantiles
+                if metric.endswith(suffix):
+                    family, kind = metric[:-len(suffix)], "summary"
+            if family not in declared:
+                declared.add(family)
+                lines.append(f"# TYPE {family} {kind}")
+            lines.append(f"{metric}{_labels(labels)} {value:.17g}")
+
+        lines.append(f"# TYPE {METRIC_PREFIX}_active_downloads gauge")
+        lines.append(f"{METRIC_PREFIX}_active_downloads {len(active)}")
+        if active:
+            lines.append(f"# TYPE {METRIC_PREFIX}_active_download_bytes gauge")
+            for download in active:
+                # Pas d'URL en étiquette : jetons et identifiants de session finiraient dans la base de séries
+                # (cardinalité illimitée, secrets exposés au scraper) ; elle reste dans to_json()
+                labels = (('id', download.id), ('kind', download.kind))
+                lines.append(f"{METRIC_PREFIX}_active_download_bytes{_labels(labels)} {download.bytes}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+# Registre commun à tous les téléchargements du processus
+REGISTRY = MetricsRegistry()
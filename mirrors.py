@@ -0,0 +1,194 @@
+import random
+import threading
+
+import requests
+
+import http_session
+from journal import RemoteFileChanged
+
+MAX_MIRROR_FAILURES = 3  # Erreurs consécutives (coupure, 5xx) avant d'écarter une source
+RATE_SMOOTHING = 0.3  # Poids de la dernière requête dans le débit moyen d'une source
+SLOW_MIRROR_RATIO = 0.25  # Source délaissée tant qu'une autre est plus de 4 fois plus rapide par connexion
+RATE_SAMPLE_TIME = 1.0  # Secondes de réception avant qu'une requête en cours compte dans le débit d'une source
+PROBE_TIMEOUT = 10
+
+
+class SourceMismatch(RemoteFileChanged):
+    """Une source ne sert pas le même fichier que les autres (taille, ETag, plages refusées)."""
+
+
+class Mirror:
+    """Une URL du fichier, avec ses validateurs HTTP et son débit mesuré par connexion."""
+
+    def __init__(self, url, etag=None, last_modified=None):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.rate = None  # Octets/s par requête terminée (moyenne glissante), None tant que rien n'est mesuré
+        self.requests = []  # SegmentMetrics des requêtes de segment en cours
+        self.failures = 0  # Erreurs consécutives
+        self.bytes = 0
+        self.dropped = None  # Raison de l'abandon de la source
+
+    def if_range(self):
+        """Valeur de l'en-tête If-Range pour cette source : ETag fort de préférence, sinon Last-Modified."""
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+    def check_response(self, response, total_size):
+        """Lève SourceMismatch si une réponse 206 ne correspond pas au fichier attendu."""
+        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+        if total.isdigit() and int(total) != total_size:
+            raise SourceMismatch(f"taille {total} au lieu de {total_size}")
+        etag = response.headers.get('ETag')
+        if self.etag and etag and etag != self.etag:
+            raise SourceMismatch(f"ETag {etag} au lieu de {self.etag}")
+
+    def to_dict(self):
+        return {'url': self.url, 'rate': self.rate, 'bytes': self.bytes, 'failures': self.failures,
+                'dropped': self.dropped}
+
+
+class MirrorSet:
+    """Sources équivalentes d'un même fichier (miroirs, CDN) entre lesquelles se répartissent les segments.
+
+    Chaque requête de segment part vers une source tirée au hasard avec une probabilité proportionnelle
+    à son débit mesuré par connexion ; une source pas encore mesurée passe en premier. Une source plus
+    de 1 / SLOW_MIRROR_RATIO fois plus lente que la meilleure n'est plus choisie, et ses requêtes en
+    cours rendent leur segment (too_slow) : une source lente ne plafonne jamais le débit total.
+    Une source qui sert un autre fichier (taille, ETag) est écartée aussitôt, une source en erreur
+    après MAX_MIRROR_FAILURES échecs consécutifs, sauf s'il ne reste qu'elle.
+    La première source est la référence (journal).
+    """
+
+    def __init__(self, mirrors, cookies=None):
+        self.mirrors = list(mirrors)
+        self.cookies = cookies  # Bocal du téléchargement, pour les sondages
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.mirrors[0]
+
+    @property
+    def usable(self):
+        with self._lock:
+            return [mirror for mirror in self.mirrors if mirror.dropped is None]
+
+    def probe(self, total_size, update_status):
+        """Vérifie en parallèle que les sources secondaires servent le fichier de la référence (bytes=0-0)."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        others = self.mirrors[1:]
+        if not others:
+            return
+        with ThreadPoolExecutor(max_workers=len(others)) as executor:
+            results = list(executor.map(lambda mirror: self._probe(mirror, total_size), others))
+        seen = {self.primary.url}
+        for mirror, error in zip(others, results):
+            if error:
+                self.drop(mirror, error, update_status)
+            elif mirror.url in seen:
+                self.mirrors.remove(mirror)  # Même URL finale qu'une autre source (redirection)
+            seen.add(mirror.url)
+        update_status(f"Sources utilisables : {len(self.usable)}/{len(self.mirrors)}.", False)
+
+    def _probe(self, mirror, total_size):
+        """Retourne None si la source convient, sinon la raison de son abandon."""
+        headers = {'Range': 'bytes=0-0'}
+        try:
+            with http_session.get(mirror.url, cookies=self.cookies, stream=True, timeout=PROBE_TIMEOUT,
+                                  headers=headers) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    return "plages non supportées"
+                mirror.url = str(response.url)  # URL après redirections
+                mirror.last_modified = response.headers.get('Last-Modified')
+                etag = response.headers.get('ETag')
+                reference = self.primary.etag
+                if reference and etag and etag != reference:
+                    return f"ETag {etag} au lieu de {reference}"
+                mirror.etag = etag
+                mirror.check_response(response, total_size)
+        except SourceMismatch as e:
+            return str(e)
+        except requests.exceptions.RequestException as e:
+            return f"{type(e).__name__}: {e}"
+        return None
+
+    @staticmethod
+    def _rate(mirror):
+        """Débit par connexion : requêtes en cours depuis au moins RATE_SAMPLE_TIME, sinon requêtes terminées."""
+        rates = [request.rate for request in mirror.requests if request.elapsed >= RATE_SAMPLE_TIME]
+        return sum(rates) / len(rates) if rates else mirror.rate
+
+    def _too_slow(self, mirror, usable):
+        rate = self._rate(mirror)
+        others = [self._rate(other) for other in usable if other is not mirror]
+        best = max((other for other in others if other is not None), default=None)
+        return rate is not None and best is not None and rate < best * SLOW_MIRROR_RATIO
+
+    def too_slow(self, mirror):
+        """Vrai si une autre source utilisable est plus de 1 / SLOW_MIRROR_RATIO fois plus rapide par connexion."""
+        with self._lock:
+            return self._too_slow(mirror, [m for m in self.mirrors if m.dropped is None])
+
+    def choose(self, segment_metrics, preferred=None):
+        """Source de la requête mesurée par `segment_metrics` (None si toutes ont été écartées).
+
+        `preferred` est imposée si elle est encore utilisable (corps du sondage déjà ouvert sur elle).
+        """
+        with self._lock:
+            usable = [mirror for mirror in self.mirrors if mirror.dropped is None]
+            if not usable:
+                return None
+            unmeasured = [mirror for mirror in usable if self._rate(mirror) is None]
+            if preferred in usable:
+                mirror = preferred
+            elif unmeasured:
+                mirror = min(unmeasured, key=lambda m: len(m.requests))
+            else:
+                candidates = [mirror for mirror in usable if not self._too_slow(mirror, usable)]
+                weighted = [(m, self._rate(m)) for m in candidates if self._rate(m)]
+                if weighted:
+                    mirror = random.choices([m for m, _ in weighted], weights=[rate for _, rate in weighted])[0]
+                else:
+                    # Aucun octet reçu pour l'instant (premier octet lent) : la source la moins chargée
+                    mirror = min(candidates, key=lambda m: len(m.requests))
+            mirror.requests.append(segment_metrics)
+            return mirror
+
+    def release(self, mirror, segment_metrics, failed=False):
+        """Fin d'une requête sur `mirror` : met à jour son débit moyen.
+
+        Retourne True si la source a atteint MAX_MIRROR_FAILURES erreurs consécutives alors que d'autres
+        restent utilisables : à écarter.
+        """
+        with self._lock:
+            mirror.requests.remove(segment_metrics)
+            mirror.bytes += segment_metrics.bytes
+            if segment_metrics.bytes:
+                rate = segment_metrics.rate
+                mirror.rate = rate if mirror.rate is None else (
+                    RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * mirror.rate)
+            if not failed:
+                mirror.failures = 0
+                return False
+            mirror.failures += 1
+            others = [m for m in self.mirrors if m is not mirror and m.dropped is None]
+            return mirror.failures >= MAX_MIRROR_FAILURES and bool(others) and mirror.dropped is None
+
+    def drop(self, mirror, reason, update_status):
+        """Écarte `mirror` ; retourne False s'il n'y a plus aucune source utilisable."""
+        with self._lock:
+            newly_dropped = mirror.dropped is None
+            mirror.dropped = mirror.dropped or reason
+            remaining = any(m.dropped is None for m in self.mirrors)
+        if newly_dropped and remaining:
+            update_status(f"⚠️ Source écartée ({reason}) : {mirror.url}", True)
+        return remaining
+
+    def to_dict(self):
+        with self._lock:
+            return [mirror.to_dict() for mirror in self.mirrors]
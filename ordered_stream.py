@@ -0,0 +1,216 @@
+import threading
+
+from checksum import OrderedHasher
+from segments import SegmentScheduler
+
+MAX_REORDER_BUFFER = 64 * 1024 * 1024  # Octets reçus d'avance gardés en mémoire en attendant le lecteur
+STREAM_SEGMENT_SIZE = 4 * 1024 * 1024  # Segments courts, distribués dans l'ordre du fichier derrière le lecteur
+
+
+class StreamInterrupted(Exception):
+    """Le téléchargement s'est arrêté avant la fin du fichier (échec, fichier distant modifié)."""
+
+
+class ReorderBuffer:
+    """Tampon mémoire où les workers d'un SegmentedDownload déposent leurs blocs, relus dans l'ordre du fichier.
+
+    Remplace le stockage (mêmes méthodes que PartsStorage / PreallocatedStorage) sans rien écrire sur disque.
+    La mémoire est bornée par la fenêtre du scheduler : seuls les segments qui commencent à moins de
+    `max_buffer - segment_size` octets du lecteur sont distribués, les workers attendent ensuite qu'il
+    avance (contre-pression). Un worker n'attend jamais en gardant un segment : celui qui bloque la
+    tête du fichier (nouvelle tentative, connexion lente) peut toujours être repris ou volé.
+    Sans segments (flux sur une seule connexion), c'est write() qui attend qu'il y ait de la place.
+    """
+
+    def __init__(self, journal, max_buffer=MAX_REORDER_BUFFER):
+        self.journal = journal
+        self.total_size = journal.total_size or None  # None : taille inconnue, fin quand le flux s'arrête
+        self.max_buffer = max_buffer
+        self.segment_size = max(1, min(STREAM_SEGMENT_SIZE, max_buffer // 4))
+        self.scheduler = None
+        self.position = 0  # Prochain octet rendu au lecteur
+        self.buffered = 0
+        self.peak = 0  # Plus grand nombre d'octets en attente du lecteur
+        self.closed = False
+        self._chunks = {}  # Offset -> octets reçus, pas encore lus
+        self._finished = False
+        self._error = None
+        self._condition = threading.Condition()
+
+    # --- Côté workers ---
+
+    def load_segments(self, journal, connections, update_status):
+        """Découpe le fichier en segments de `segment_size` octets, dans l'ordre de lecture."""
+        count = max(connections, -(-self.total_size // self.segment_size))
+        self.scheduler = SegmentScheduler.split_evenly(self.total_size, count)
+        self._move_window()
+        return self.scheduler
+
+    def open_segment(self, segment):
+        return _SegmentWriter(self, segment.position)
+
+    def read_range(self, offset, length):
+        return b''  # Les octets lus sont déjà rendus au lecteur : rien à relire
+
+    def checkpoint(self, segments):
+        pass  # Pas de reprise possible : le lecteur a consommé ce qui a été reçu
+
+    def write(self, offset, data):
+        data = bytes(data)  # Le bloc reçu est une vue sur le tampon réutilisé du worker
+        with self._condition:
+            while self.buffered and self.buffered + len(data) > self.max_buffer and not self.closed:
+                self._condition.wait()
+            if self.closed:
+                return
+            self._chunks[offset] = data
+            self.buffered += len(data)
+            self.peak = max(self.peak, self.buffered)
+            if offset == self.position:
+                self._condition.notify_all()
+
+    def finish(self, error=None):
+        """Fin du téléchargement : le lecteur n'attend plus de nouveaux blocs (`error` : raison d'un échec)."""
+        with self._condition:
+            self._finished = True
+            self._error = error
+            self._condition.notify_all()
+
+    def close(self):
+        """Le lecteur abandonne : les blocs en attente sont libérés, les suivants ignorés."""
+        with self._condition:
+            self.closed = True
+            self._chunks.clear()
+            self.buffered = 0
+            self._condition.notify_all()
+
+    # --- Côté lecteur ---
+
+    def read_chunk(self):
+        """Bloc suivant dans l'ordre du fichier (b'' à la fin) ; attend qu'il soit arrivé."""
+        with self._condition:
+            while (self.position not in self._chunks and not self._finished and not self.closed
+                   and (self.total_size is None or self.position < self.total_size)):
+                self._condition.wait()
+            data = self._chunks.pop(self.position, None)
+            if data is None:
+                if self._error or (self.total_size is not None and self.position < self.total_size):
+                    raise StreamInterrupted(f"{self._error or 'flux fermé'} "
+                                            f"({self.position}/{self.total_size} octets lus)")
+                return b''
+            self.buffered -= len(data)
+            self.position += len(data)
+            self._condition.notify_all()  # Place libérée pour un write() en attente
+        self._move_window()
+        return data
+
+    def _move_window(self):
+        if self.scheduler:
+            self.scheduler.window_end = self.position + self.max_buffer - self.segment_size
+
+
+class _SegmentWriter:
+    """Fichier d'un segment pour SegmentedDownload : chaque write() dépose un bloc à la suite dans le tampon."""
+
+    def __init__(self, buffer, offset):
+        self.buffer = buffer
+        self.offset = offset
+
+    def write(self, data):
+        self.buffer.write(self.offset, data)
+        self.offset += len(data)
+        return len(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class OrderedStream:
+    """Octets d'un fichier dans l'ordre, pendant que plusieurs connexions le téléchargent (robust_downloader.open_stream).
+
+    Itérer donne des blocs `bytes` ; read(size) s'utilise comme un fichier (tarfile, zlib, shutil.copyfileobj,
+    envoi HTTP). Les empreintes (attendue ou annoncées par le serveur) sont calculées au fil de la lecture
+    et vérifiées dès le dernier octet reçu : ChecksumMismatch au lieu du dernier bloc si elles diffèrent,
+    même pour un lecteur qui s'arrête après avoir lu exactement la taille annoncée.
+    StreamInterrupted si le téléchargement échoue. close() (ou la sortie du `with`) arrête le téléchargement.
+    """
+
+    def __init__(self, buffer, produce, stop=None, checksums=(), final_url=None):
+        self.buffer = buffer
+        self.total_size = buffer.total_size
+        self.final_url = final_url
+        self._produce = produce  # Télécharge dans `buffer`, retourne True si le fichier est complet
+        self._stop = stop
+        self._hasher = OrderedHasher(checksums) if checksums else None
+        self._verified = False
+        self._pending = b''  # Reste du dernier bloc après un read(size)
+        self._thread = threading.Thread(target=self._run, name="ordered-stream")
+        self._thread.start()
+
+    def _run(self):
+        error = None
+        try:
+            if not self._produce():
+                error = "téléchargement incomplet"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            self.buffer.finish(error)
+
+    @property
+    def position(self):
+        """Octets déjà rendus au lecteur."""
+        return self.buffer.position - len(self._pending)
+
+    def _next_chunk(self):
+        data = self.buffer.read_chunk()
+        if self._hasher and not self._verified:
+            if data:
+                self._hasher.update(self.buffer.position - len(data), data)
+            if not data or self.buffer.position == self.total_size:
+                # Taille connue : vérifié avant de rendre le dernier bloc, sans attendre un read() de plus
+                self._verified = True
+                self._hasher.verify()
+        return data
+
+    def __iter__(self):
+        if self._pending:
+            data, self._pending = self._pending, b''
+            yield data
+        while True:
+            data = self._next_chunk()
+            if not data:
+                return
+            yield data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b''.join(self)
+        parts, length = [self._pending], len(self._pending)
+        while length < size:
+            data = self._next_chunk()
+            if not data:
+                break
+            parts.append(data)
+            length += len(data)
+        data = b''.join(parts)
+        self._pending = data[size:]
+        return data[:size]
+
+    def readable(self):
+        return True
+
+    def close(self):
+        """Arrête le téléchargement s'il est en cours et libère le tampon."""
+        if self._stop:
+            self._stop()
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
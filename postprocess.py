@@ -0,0 +1,123 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from metrics import REGISTRY
+
+MAX_POSTPROCESS_JOBS = 2  # Fusions ffmpeg simultanées, indépendamment du nombre de téléchargements
+MERGE_FORMAT = 'mp4'
+
+
+class PostProcessQueue:
+    """File des post-traitements (fusion vidéo + audio, remux, contrôle d'intégrité) hors des threads réseau.
+
+    Le travail lourd est fait par des processus ffmpeg / ffprobe ; au plus `max_workers` tournent
+    en même temps. Un téléchargement dépose ses fichiers puis rend la main : la vidéo suivante démarre
+    pendant que la fusion de la précédente attend son tour.
+    """
+
+    def __init__(self, max_workers=MAX_POSTPROCESS_JOBS):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._futures = set()
+        self.failed = 0
+
+    def submit_merge(self, inputs, output, status_callback=None):
+        """Programme la fusion des fichiers `inputs` dans `output` ; retourne un Future (True si réussie)."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="postprocess")
+            future = self._executor.submit(self._merge, list(inputs), output, status_callback)
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+        if status_callback:
+            status_callback(f"Fusion de '{os.path.basename(output)}' en attente ({self.pending()} en file).", False)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+            if future.cancelled() or future.exception() is not None or not future.result():
+                self.failed += 1
+
+    def pending(self):
+        with self._lock:
+            return len(self._futures)
+
+    def wait(self, timeout=None):
+        """Attend la fin des post-traitements en cours et en file ; retourne False si `timeout` est dépassé."""
+        from concurrent.futures import wait
+
+        with self._lock:
+            futures = list(self._futures)
+        _, not_done = wait(futures, timeout)
+        return not not_done
+
+    def _merge(self, inputs, output, status_callback):
+        def update_status(message, is_error=False):
+            if status_callback:
+                status_callback(message, is_error)
+            else:
+                print(message)
+
+        name = os.path.basename(output)
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            update_status(f"❌ ffmpeg introuvable : '{name}' reste en fichiers séparés ({len(inputs)}).", True)
+            REGISTRY.increment("postprocess_total", result="failure")
+            return False
+
+        update_status(f"Fusion de '{name}'...", False)
+        temp_output = f"{output}.part.{MERGE_FORMAT}"
+        command = [ffmpeg, '-y', '-loglevel', 'error']
+        for path in inputs:
+            command += ['-i', path]
+        for index in range(len(inputs)):
+            command += ['-map', str(index)]
+        command += ['-c', 'copy', '-movflags', '+faststart', temp_output]
+
+        with REGISTRY.timed("postprocess", output=output) as attributes:
+            started = time.perf_counter()
+            result = subprocess.run(command, capture_output=True, text=True)
+            ok = result.returncode == 0 and check_media(temp_output)
+            attributes['success'] = ok
+        if not ok:
+            error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "fichier de sortie invalide"
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
+            update_status(f"❌ Échec de la fusion de '{name}' : {error}. Fichiers séparés conservés.", True)
+            REGISTRY.increment("postprocess_total", result="failure")
+            return False
+
+        os.replace(temp_output, output)
+        for path in inputs:
+            if os.path.exists(path):
+                os.remove(path)
+        REGISTRY.increment("postprocess_total", result="success")
+        REGISTRY.increment("postprocess_seconds_total", time.perf_counter() - started)
+        update_status(f"✅ Fusion de '{name}' terminée avec succès.", False)
+        return True
+
+
+def check_media(path):
+    """Contrôle d'intégrité : ffprobe lit le conteneur et y trouve une durée positive (faute de ffprobe : fichier non vide)."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None:
+        return True
+    result = subprocess.run([ffprobe, '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+                            capture_output=True, text=True)
+    try:
+        return result.returncode == 0 and float(result.stdout.strip()) > 0
+    except ValueError:
+        return False
+
+
+# File commune aux téléchargements streaming du processus
+POSTPROCESS = PostProcessQueue()
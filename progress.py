@@ -0,0 +1,93 @@
+import threading
+import time
+
+PROGRESS_INTERVAL = 0.1  # Secondes entre deux publications (10 Hz)
+RATE_SMOOTHING = 0.3  # Poids du dernier intervalle dans la moyenne mobile du débit
+
+
+class ProgressSnapshot:
+    """État d'un téléchargement à un instant donné, tel que publié aux abonnés."""
+
+    def __init__(self, downloaded, total, rate, eta, segments=None, finished=False):
+        self.downloaded = downloaded
+        self.total = total
+        self.rate = rate  # Octets par seconde (moyenne mobile)
+        self.eta = eta  # Secondes restantes, None si inconnu
+        self.segments = segments or []  # [(start, written, end, active), ...] en mode segmenté
+        self.finished = finished
+
+    @property
+    def fraction(self):
+        return self.downloaded / self.total if self.total else 0.0
+
+    def __repr__(self):
+        return f"ProgressSnapshot({self.downloaded}/{self.total}, {self.rate / 1024:.0f} Kio/s, eta={self.eta})"
+
+
+class ProgressPublisher:
+    """Échantillonne la progression à intervalle fixe et publie un ProgressSnapshot aux abonnés.
+
+    Les workers ne font qu'incrémenter leurs propres compteurs (Segment.written, ou `add()`
+    en mode simple) : plus de verrou ni d'appel à la GUI par bloc reçu.
+    `sample` retourne (octets téléchargés, liste des segments) ; par défaut le compteur interne.
+    """
+
+    def __init__(self, total, sample=None, interval=PROGRESS_INTERVAL):
+        self.total = total
+        self.interval = interval
+        self.downloaded = 0
+        self._sample = sample or (lambda: (self.downloaded, None))
+        self._subscribers = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._rate = 0.0
+        self._last = None
+
+    def subscribe(self, callback):
+        """Abonne `callback(snapshot)`. Il est appelé depuis le thread d'échantillonnage."""
+        self._subscribers.append(callback)
+        return self
+
+    def add(self, nbytes):
+        """Compteur du mode simple (un seul worker, pas besoin de verrou)."""
+        self.downloaded += nbytes
+
+    def start(self):
+        if self._subscribers:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Arrête l'échantillonnage et publie un dernier état final."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._subscribers:
+            self.publish(finished=True)
+
+    def _run(self):
+        self.publish()
+        while not self._stop.wait(self.interval):
+            self.publish()
+
+    def publish(self, finished=False):
+        downloaded, segments = self._sample()
+        now = time.monotonic()
+        if self._last is not None:
+            previous_time, previous_bytes = self._last
+            if now > previous_time:
+                rate = max(0, downloaded - previous_bytes) / (now - previous_time)
+                self._rate = (1 - RATE_SMOOTHING) * self._rate + RATE_SMOOTHING * rate
+        self._last = (now, downloaded)
+
+        eta = None
+        if self.total and self._rate > 0:
+            eta = max(0, self.total - downloaded) / self._rate
+        snapshot = ProgressSnapshot(downloaded, self.total, self._rate, eta, segments, finished)
+        for callback in list(self._subscribers):
+            try:
+                callback(snapshot)
+            except Exception:
+                pass  # Un abonné défaillant ne doit pas arrêter le téléchargement
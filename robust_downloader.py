@@ -1,11 +1,40 @@
 import requests
 import os
+import random
+import http.client
+from email.utils import parsedate_to_datetime
+from urllib3.exceptions import HTTPError as Urllib3Error
 from tqdm import tqdm
 import threading
 import time
-import math
-
-MAX_CONNECTIONS = 8
+import http_session
+from bandwidth import throttle_for
+from buffers import iter_into
+from checksum import ChecksumMismatch, OrderedHasher, checksums_from_headers, parse_expected_hash
+from concurrency import ConnectionController, EVALUATION_INTERVAL, MAX_ADAPTIVE_CONNECTIONS
+from disk_writer import FSYNC_POLICY, DiskWriter
+from progress import ProgressPublisher
+from journal import DownloadJournal, RemoteFileChanged
+from metrics import REGISTRY, SegmentMetrics
+from mirrors import RATE_SAMPLE_TIME, Mirror, MirrorSet, SourceMismatch
+from ordered_stream import MAX_REORDER_BUFFER, OrderedStream, ReorderBuffer
+from storage import PartsStorage, PreallocatedStorage
+
+CHECKPOINT_INTERVAL = 1.0  # Secondes entre deux sauvegardes de l'avancement des segments
+
+# Nouvelles tentatives d'un segment : seuls les octets manquants sont redemandés
+MAX_SEGMENT_RETRIES = 5  # Échecs consécutifs sans progrès avant d'abandonner un segment
+RETRY_BUDGET = 20  # Tentatives sans aucun octet reçu, pour tout le téléchargement, tous segments confondus
+RETRY_BASE_DELAY = 0.5  # Secondes, doublées à chaque échec consécutif
+RETRY_MAX_DELAY = 30.0
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# Erreurs réseau pendant la lecture du corps (readinto lit directement http.client / urllib3)
+NETWORK_ERRORS = (requests.exceptions.RequestException, http.client.HTTPException, Urllib3Error,
+                  ConnectionError, TimeoutError)
+
+# Issue d'une tentative de segment (RETIRED : worker en trop rendu par le ConnectionController,
+# SWITCH : source écartée, le segment est repris tel quel sur une autre)
+DONE, RETRY, FAILED, RETIRED, SWITCH = 'done', 'retry', 'failed', 'retired', 'switch'
 
 BROWSER_HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -17,7 +46,397 @@ BROWSER_HEADERS = {
 }
 
 
-def download_file_robust(url, destination_folder="downloads", progress_callback=None, status_callback=None):
+class SegmentedDownload:
+    """Téléchargement multi-segments : des workers se partagent les segments d'un SegmentScheduler.
+
+    Un worker qui termine son segment en prend un autre, ou vole la moitié du segment le plus lent.
+    Les octets sont écrits via `storage` (PartsStorage ou PreallocatedStorage), dont le journal
+    fournit les validateurs envoyés en If-Range. Avec un `hasher` (OrderedHasher), l'empreinte
+    est calculée pendant la réception au lieu d'une relecture complète du fichier à la fin.
+    `initial_response` est la réponse 206 de la requête de sondage (bytes=0-) : son corps,
+    déjà en cours de réception, sert au segment 0 au lieu d'une nouvelle requête.
+    Tous les workers lisent à travers le même `throttle` (limites globale et du téléchargement).
+    Chaque requête de segment est mesurée (TTFB, octets, temps disque, erreur) dans `metrics`.
+
+    Une erreur passagère (coupure, délai, 5xx, 429) ne perd que les octets manquants : le segment
+    est remis au scheduler avec un délai exponentiel aléatoire, puis repris par le premier worker
+    libre, dans la limite de MAX_SEGMENT_RETRIES échecs consécutifs par segment et de RETRY_BUDGET
+    tentatives sans aucun octet reçu par téléchargement. Une tentative qui a progressé ne coûte rien :
+    un serveur qui coupe régulièrement les connexions ralentit le téléchargement sans le faire échouer.
+
+    Le nombre de workers suit le ConnectionController passé à run() : des workers sont ajoutés
+    (ils volent du travail aux segments en cours) ou rendus (leur segment repart au scheduler,
+    sans perte ni tentative décomptée) au fil des mesures de débit et des erreurs du serveur.
+
+    Avec `mirrors` (MirrorSet), chaque requête de segment part vers l'une des sources équivalentes,
+    choisie d'après son débit ; une source écartée rend son segment aux autres. Sinon, `url` seule.
+
+    Avec `writer` (DiskWriter), les workers déposent leurs blocs dans sa file au lieu d'écrire eux-mêmes :
+    segment.written avance quand les octets sont sur disque, et les points de reprise passent par la même
+    file (fsync puis sauvegarde du journal, selon la politique du writer).
+    """
+
+    def __init__(self, url, scheduler, storage, total_size, update_status, hasher=None, initial_response=None,
+                 throttle=None, metrics=None, mirrors=None, writer=None, cookies=None):
+        self.url = url
+        self.cookies = cookies  # Bocal du téléchargement (http_session.new_cookie_jar)
+        self.scheduler = scheduler
+        self.storage = storage
+        self.journal = storage.journal
+        self.total_size = total_size
+        self.update_status = update_status
+        self.hasher = hasher
+        self.initial_response = initial_response
+        self.throttle = throttle or throttle_for()
+        self.metrics = metrics  # DownloadMetrics du téléchargement
+        self.remote_changed = False
+        self.retries_left = RETRY_BUDGET
+        self.retry_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.checkpoint_lock = threading.Lock()
+        self.last_checkpoint = time.monotonic()
+        self.controller = None
+        self.workers_changed = threading.Condition()
+        self.running = 0  # Workers en vie
+        self.retiring = 0  # Workers en train de s'arrêter parce qu'il y en a trop
+        self.exhausted = False  # Un worker n'a plus rien trouvé à prendre : inutile d'en ajouter
+        self.mirrors = mirrors or MirrorSet([Mirror(url, self.journal.etag, self.journal.last_modified)])
+        self.writer = writer
+
+    def run(self, controller):
+        """Télécharge avec `controller.target` workers, réajusté toutes les EVALUATION_INTERVAL secondes."""
+        self.controller = controller
+        # Segment 0 déjà commencé (reprise) : le corps du sondage, qui part de l'octet 0, ne sert plus
+        if self.initial_response is not None and self.scheduler.segments[0].position != 0:
+            self._close_initial_response()
+        previous = controller.target
+        self._start_workers(previous)
+        with self.workers_changed:
+            while self.running:
+                self.workers_changed.wait(EVALUATION_INTERVAL)
+                if self.stop_event.is_set():
+                    continue
+                # Le nombre voulu a pu baisser entre-temps (backoff() appelé par un worker en erreur)
+                target = controller.update(self.scheduler.downloaded_bytes())
+                if target != previous:
+                    self.update_status(f"Connexions : {previous} → {target} "
+                                       f"(débit total {controller.rate / (1024 * 1024):.1f} Mo/s).", False)
+                    if self.metrics:
+                        self.metrics.connections(target)
+                    previous = target
+                missing = target - (self.running - self.retiring)
+                if missing > 0 and not self.exhausted:
+                    self._start_workers(missing)
+        self._close_initial_response()
+        self.checkpoint(force=True)
+
+    def _start_workers(self, count):
+        with self.workers_changed:
+            self.running += count
+        for _ in range(count):
+            threading.Thread(target=self._worker).start()
+
+    def _retire(self):
+        """Vrai si ce worker doit s'arrêter : plus de workers que le nombre de connexions voulu."""
+        if self.running - self.retiring <= self.controller.target:  # Lecture sans verrou : cas courant
+            return False
+        with self.workers_changed:
+            if self.running - self.retiring > self.controller.target:
+                self.retiring += 1
+                return True
+        return False
+
+    def _close_initial_response(self):
+        if self.initial_response is not None:
+            self.initial_response.close()
+            self.initial_response = None
+
+    def _uses_probe(self, segment):
+        return segment.start == 0 and segment.position == 0 and self.initial_response is not None
+
+    def _open_response(self, source, segment, headers, segment_metrics):
+        """Réponse à utiliser pour le segment : celle du sondage pour le segment 0, sinon une nouvelle requête."""
+        if self._uses_probe(segment) and source is self.mirrors.primary:
+            # Un seul worker tient le segment 0 à la fois : pas besoin de verrou
+            response, self.initial_response = self.initial_response, None
+            segment_metrics.reused_probe = True
+        else:
+            response = http_session.get(source.url, cookies=self.cookies, stream=True, headers=headers, timeout=10)
+        segment_metrics.response(response)
+        return response
+
+    def checkpoint(self, force=False):
+        """Sauvegarde l'avancement au plus toutes les CHECKPOINT_INTERVAL secondes (sans bloquer les autres workers)."""
+        if not force and time.monotonic() - self.last_checkpoint < CHECKPOINT_INTERVAL:
+            return
+        if self.writer:
+            # Après les écritures en file, par le thread d'écriture : le journal ne décrit que des octets sur disque
+            self.last_checkpoint = time.monotonic()
+            self.writer.checkpoint(self._save_checkpoint, wait=force)
+            return
+        if not self.checkpoint_lock.acquire(blocking=force):
+            return
+        try:
+            self.last_checkpoint = time.monotonic()
+            self._save_checkpoint()
+        finally:
+            self.checkpoint_lock.release()
+
+    def _save_checkpoint(self):
+        try:
+            self.storage.checkpoint(self.scheduler.snapshot())
+        except OSError as e:
+            self.update_status(f"Impossible de sauvegarder l'avancement : {e}", True)
+
+    def _worker(self):
+        retired = False
+        try:
+            retired = self._work()
+        finally:
+            with self.workers_changed:
+                self.running -= 1
+                if retired:
+                    self.retiring -= 1
+                self.workers_changed.notify_all()
+
+    def _work(self):
+        """Boucle d'un worker ; retourne True s'il s'arrête parce que les connexions ont été réduites."""
+        while not self.stop_event.is_set():
+            if self._retire():
+                return True
+            segment = self.scheduler.next_segment()
+            if segment is None:
+                # Plus rien à prendre, sauf peut-être un segment qui attend sa nouvelle tentative
+                delay = self.scheduler.next_retry_delay()
+                if delay is None:
+                    self.exhausted = True
+                    return False
+                self.stop_event.wait(delay)
+                continue
+            segment_metrics = (self.metrics.segment(segment.position, segment.end) if self.metrics
+                               else SegmentMetrics(segment.position, segment.end))
+            outcome = self.download_part(segment, segment_metrics)
+            segment_metrics.end = segment.end  # Le segment a pu être raccourci par un vol
+            if self.metrics:
+                self.metrics.finish_segment(segment_metrics, segment_metrics.error)
+
+            if outcome in (RETIRED, SWITCH):
+                self.scheduler.retry(segment, 0)  # Repris tel quel par un autre worker, sans tentative décomptée
+                if outcome == RETIRED:
+                    return True
+                continue
+            if outcome == RETRY:
+                self.controller.backoff()  # Le serveur sature ou refuse : moins de connexions
+            if outcome == RETRY and not self.stop_event.is_set():
+                progressed = segment_metrics.bytes > 0
+                if progressed:
+                    segment.failures = 0  # La tentative a progressé : l'erreur est passagère
+                delay = self._retry_delay(segment, progressed)
+                if delay is not None:
+                    self.update_status(f"Nouvelle tentative de la partie {segment.start} dans {delay:.1f} s "
+                                       f"({segment.end - segment.written + 1} octets manquants).", False)
+                    if self.metrics:
+                        self.metrics.retry()
+                    self.scheduler.retry(segment, delay)
+                    continue  # Ce worker passe à un autre segment pendant l'attente
+                self.update_status(f"❌ Partie {segment.start} abandonnée : nombre maximal de tentatives atteint.", True)
+                outcome = FAILED
+
+            self.scheduler.release(segment, failed=outcome == FAILED)
+            if outcome != DONE:
+                # Échec définitif ou arrêt : les autres workers s'arrêtent, l'avancement reste dans le journal
+                self.stop_event.set()
+                return False
+            if self.hasher:
+                # Les segments suivant la tête sont hachés dès que la plage depuis le début est complète
+                self.hasher.catch_up(self.scheduler.contiguous_written())
+
+    def _retry_delay(self, segment, progressed=False):
+        """Délai avant la prochaine tentative du segment (backoff exponentiel avec aléa), None si le budget est épuisé.
+
+        Seules les tentatives sans aucun octet reçu (`progressed` faux) sont décomptées de RETRY_BUDGET.
+        """
+        with self.retry_lock:
+            if segment.failures >= MAX_SEGMENT_RETRIES:
+                return None
+            if not progressed:
+                if self.retries_left <= 0:
+                    return None
+                self.retries_left -= 1
+            segment.failures += 1
+        backoff = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (segment.failures - 1))
+        # Moitié fixe + moitié aléatoire : les workers en échec ne relancent pas tous au même instant
+        delay = backoff / 2 + random.uniform(0, backoff / 2)
+        return max(delay, segment.retry_after)
+
+    def download_part(self, segment, segment_metrics=None):
+        """Télécharge le segment de segment.position à segment.end (qui peut diminuer en cours de route).
+
+        Retourne DONE, RETRY (erreur passagère, à retenter), FAILED (échec définitif),
+        RETIRED (worker en trop, segment inachevé à redistribuer) ou SWITCH (source écartée).
+        """
+        segment_metrics = segment_metrics or SegmentMetrics(segment.position, segment.end)
+        segment.retry_after = 0.0
+        if segment.done:
+            self.update_status(f"Partie {segment.start} déjà complète.", False)
+            return DONE
+
+        # Le corps du sondage, déjà ouvert, vient de la source de référence
+        source = self.mirrors.choose(segment_metrics, self.mirrors.primary if self._uses_probe(segment) else None)
+        if source is None:
+            segment_metrics.error = "no_source"
+            return FAILED
+        outcome = self._download_part(source, segment, segment_metrics)
+        if self.mirrors.release(source, segment_metrics, failed=outcome == RETRY):
+            # Trop d'erreurs consécutives sur cette source alors que d'autres répondent
+            self.mirrors.drop(source, f"{source.failures} erreurs consécutives", self.update_status)
+            return SWITCH
+        return outcome
+
+    def _download_part(self, source, segment, segment_metrics):
+        headers = BROWSER_HEADERS.copy()  # Chaque partie utilise les headers du navigateur
+        headers['Range'] = f'bytes={segment.position}-{segment.end}'  # Puis ajoute son propre Range
+        if_range = source.if_range()
+        if if_range:
+            headers['If-Range'] = if_range  # Le serveur répond 200 (et non 206) si le fichier a changé
+
+        if segment.position > segment.start:
+            self.update_status(f"Reprise de la partie {segment.start} à partir de {segment.position} octets...", False)
+        else:
+            self.update_status(f"Démarrage du téléchargement de la partie {segment.start} "
+                               f"({segment.position}-{segment.end})...", False)
+
+        try:
+            # Si le segment 0 est raccourci, fermer la réponse du sondage (bytes=0-) abandonne sa connexion
+            with self._open_response(source, segment, headers, segment_metrics) as response:
+                response.raise_for_status()
+
+                # Réponse 200 au lieu de 206 : le corps commence à l'octet 0, inutilisable pour cette partie
+                if response.status_code == 200:
+                    if if_range:
+                        raise RemoteFileChanged("le serveur a renvoyé le fichier entier (If-Range refusé)")
+                    if segment.position > 0 and len(self.mirrors.usable) > 1:
+                        raise SourceMismatch("plages non supportées")
+                    if segment.position > 0:
+                        self.update_status(f"Serveur ne supporte pas les plages pour la partie {segment.start}.", True)
+                        segment_metrics.error = "range_not_supported"
+                        return FAILED
+                else:
+                    source.check_response(response, self.total_size)
+
+                f = self.storage.open_segment(segment)
+                if self.writer:
+                    f = self.writer.open(segment, f)
+                with f:
+                    next_source_check = time.monotonic() + RATE_SAMPLE_TIME
+                    # Lectures directes dans un tampon réutilisé dont la taille suit le débit
+                    for chunk in iter_into(response, throttle=self.throttle):
+                        # Le segment a pu être raccourci par un worker inactif : on n'écrit que notre plage
+                        offset = segment.position
+                        keep = self.scheduler.claim(segment, len(chunk))
+                        if keep:
+                            write_started = time.perf_counter()
+                            f.write(chunk[:keep])
+                            segment_metrics.disk_time += time.perf_counter() - write_started
+                            if self.hasher:
+                                self.hasher.update(offset, chunk[:keep])
+                            if self.writer is None:
+                                segment.written += keep  # Lu par le ProgressPublisher, sans verrou
+                            segment_metrics.bytes += keep
+                            self.checkpoint()
+                        if segment.done or self.stop_event.is_set():
+                            break
+                        if self._retire():
+                            return RETIRED
+                        if time.monotonic() >= next_source_check:
+                            # Source bien plus lente qu'une autre : le reste du segment part sur une plus rapide
+                            if self.mirrors.too_slow(source):
+                                return SWITCH
+                            next_source_check = time.monotonic() + RATE_SAMPLE_TIME
+
+            if self.stop_event.is_set() and not segment.done:
+                segment_metrics.error = "stopped"
+                return FAILED
+            if not segment.done:
+                # Le serveur a fermé la connexion trop tôt : seuls les octets manquants seront redemandés
+                self.update_status(f"⚠️ Partie {segment.start} interrompue avant la fin "
+                                   f"({segment.written}/{segment.end + 1}).", True)
+                segment_metrics.error = "incomplete"
+                return RETRY
+            self.update_status(f"Partie {segment.start} téléchargée avec succès.", False)
+            return DONE
+
+        except RemoteFileChanged as e:
+            segment_metrics.error = f"RemoteFileChanged: {e}"
+            if self.mirrors.drop(source, str(e), self.update_status):
+                return SWITCH  # Les autres sources servent toujours le fichier attendu
+            self.update_status(f"❌ Le fichier distant a changé ({e}). Arrêt des segments.", True)
+            self.remote_changed = True
+            self.stop_event.set()
+            return FAILED
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code
+            segment_metrics.error = f"HTTPError: {status}"
+            if status in RETRYABLE_STATUS:
+                segment.retry_after = _retry_after(e.response)
+                self.update_status(f"⚠️ Erreur HTTP {status} pour la partie {segment.start}.", True)
+                return RETRY
+            self.update_status(f"❌ Erreur HTTP {status} pour la partie {segment.start} : {e}", True)
+            return FAILED
+        except NETWORK_ERRORS as e:
+            # Coupure, délai dépassé, corps tronqué... : passager le plus souvent
+            self.update_status(f"⚠️ Erreur lors du téléchargement de la partie {segment.start}: {e}", True)
+            segment_metrics.error = f"{type(e).__name__}: {e}"
+            return RETRY
+        except Exception as e:
+            self.update_status(f"❌ Erreur inattendue pour la partie {segment.start}: {e}", True)
+            segment_metrics.error = f"{type(e).__name__}: {e}"
+            return FAILED
+
+
+def download_file_robust(url, destination_folder="downloads", progress_callback=None, status_callback=None,
+                         preallocate=True, max_connections=MAX_ADAPTIVE_CONNECTIONS, snapshot_callback=None,
+                         expected_hash=None, max_speed=None, adaptive_connections=True, mirrors=None,
+                         fsync_policy=FSYNC_POLICY, cache=None):
+    """
+    Télécharge un fichier en plusieurs segments parallèles si le serveur le permet, sinon d'un seul bloc.
+
+    :param preallocate: Écrit les segments directement dans un fichier préalloué (sinon dossier .parts + fusion)
+    :param max_connections: Nombre maximal de connexions simultanées pour ce fichier
+    :param adaptive_connections: Ajuste le nombre de connexions pendant le téléchargement (démarrage lent,
+                                 recul sur erreur serveur) ; sinon max_connections du début à la fin
+    :param progress_callback: Prend (current_bytes, total_bytes) en param, appelé toutes les PROGRESS_INTERVAL secondes
+    :param snapshot_callback: Reçoit un ProgressSnapshot (débit, temps restant, état des segments) au même rythme
+    :param expected_hash: Empreinte attendue ('sha256:<hex>'), vérifiée pendant la réception avec celles
+                          annoncées par le serveur (Repr-Digest, Digest, Content-MD5)
+    :param max_speed: Débit maximal de ce téléchargement en octets/s, ou un bandwidth.TokenBucket modifiable
+                      en cours de route. La limite globale (bandwidth.set_global_limit) s'applique en plus.
+    :param mirrors: Autres URL du même fichier (miroirs, CDN) : les segments sont répartis entre toutes
+                    les sources selon leur débit, une source en erreur ou différente (taille, ETag) est écartée
+    :param fsync_policy: Durabilité des écritures des segments : 'checkpoint' (fsync avant chaque sauvegarde
+                         du journal), 'always' (après chaque bloc) ou 'none' (laissé au système)
+    :param cache: Cache local par contenu (content_cache.ContentCache, par ex. content_cache.CONTENT_CACHE ;
+                  désactivé par défaut) : un fichier déjà téléchargé (même source et ETag, ou même empreinte)
+                  est placé dans la destination sans rien télécharger, et chaque fichier complet y est ajouté,
+                  son SHA-256 calculé pendant la réception
+    :return: True si le fichier est complet (et conforme aux empreintes) à la fin, False sinon
+
+    Les mesures (sondage, redirections, segments, octets, erreurs) sont enregistrées dans metrics.REGISTRY.
+    """
+    metrics = REGISTRY.start_download(url, 'direct')
+    success = False
+    try:
+        success = _download_file_robust(url, destination_folder, progress_callback, status_callback, preallocate,
+                                        max_connections, snapshot_callback, expected_hash, max_speed,
+                                        adaptive_connections, tuple(mirrors or ()), fsync_policy, cache, metrics)
+        return success
+    finally:
+        metrics.finish(success)
+
+
+def _download_file_robust(url, destination_folder, progress_callback, status_callback, preallocate, max_connections,
+                          snapshot_callback, expected_hash, max_speed, adaptive_connections, mirrors, fsync_policy,
+                          cache, metrics):
     def update_status(message, is_error=False):
         if status_callback:
             status_callback(message, is_error)
@@ -28,6 +447,64 @@ def download_file_robust(url, destination_folder="downloads", progress_callback=
         if progress_callback:
             progress_callback(current, total)
 
+    def progress_publisher(total, sample=None):
+        # Progression échantillonnée à PROGRESS_INTERVAL au lieu d'un appel par bloc reçu
+        publisher = ProgressPublisher(total, sample)
+        if progress_callback:
+            publisher.subscribe(lambda snapshot: progress_callback(snapshot.downloaded, snapshot.total))
+        if snapshot_callback:
+            publisher.subscribe(snapshot_callback)
+        return publisher
+
+    def verify_checksum(hasher):
+        try:
+            hasher.verify()
+        except ChecksumMismatch as e:
+            update_status(f"❌ Empreinte incorrecte pour '{file_name}' : {e}. Fichier supprimé.", True)
+            return False
+        verified = [algorithm for algorithm, expected in hasher.checksums if expected is not None]
+        if verified:
+            update_status(f"Empreinte vérifiée pour '{file_name}' ({', '.join(verified)}).", False)
+        return True
+
+    def hasher_checksums():
+        # Avec le cache, le SHA-256 (clé des objets) est calculé au fil de la réception, sans relecture à la fin
+        if cache is not None and 'sha256' not in dict(checksums):
+            return checksums + [('sha256', None)]
+        return checksums
+
+    def from_cache(sha256):
+        """Place le fichier en cache dans la destination ; False s'il faut le télécharger quand même."""
+        method = cache.materialize(sha256, file_path)
+        if method is None:
+            return False
+        if probe_response is not None:
+            probe_response.close()
+        try:
+            storage.discard()  # Téléchargement commencé auparavant : inutile désormais
+        except OSError:
+            pass
+        metrics.mark("content_cache")
+        size = os.path.getsize(file_path)
+        update_status(f"✅ '{file_name}' repris du cache local ({method}, {size} octets) : aucun téléchargement.",
+                      False)
+        update_progress(size, size)
+        return True
+
+    def add_to_cache(hasher, etag, size):
+        if cache is not None and cache.store(file_path, str(final_download_url), etag, size,
+                                             hasher.digests()) is None:
+            update_status(f"⚠️ Impossible d'ajouter '{file_name}' au cache local.", True)
+
+    throttle = throttle_for(max_speed)
+    checksums = []
+    if expected_hash:
+        try:
+            checksums.append(parse_expected_hash(expected_hash))
+        except ValueError as e:
+            update_status(f"❌ {e}", True)
+            return False
+
     if not os.path.exists(destination_folder):
         os.makedirs(destination_folder)
         update_status(f"Dossier de destination créé : {destination_folder}")
@@ -40,176 +517,198 @@ def download_file_robust(url, destination_folder="downloads", progress_callback=
     mode = 'wb'
     initial_bytes = 0
 
+    # --- Stockage et journal de reprise ---
+    # Un dossier .parts existant (téléchargement commencé sans préallocation) est repris tel quel
+    parts_storage = PartsStorage(destination_folder, file_name)
+    if preallocate and not os.path.exists(parts_storage.parts_dir):
+        storage = PreallocatedStorage(destination_folder, file_name)
+    else:
+        storage = parts_storage
+
+    # Avec un journal, la reprise est immédiate : pas de requête préalable, les segments envoient If-Range
+    journal = storage.read_journal()
+    if journal is not None and (journal.url != url or not journal.total_size):
+        update_status(f"Journal de reprise de '{file_name}' obsolète (autre URL). Redémarrage.", True)
+        storage.discard()
+        journal = None
+    resumed_from_journal = journal is not None
+
+    cookies = http_session.new_cookie_jar()  # Cookies de ce téléchargement seulement
+
+    # Empreinte attendue déjà en cache (autre URL, autre dossier) : aucune requête
+    probe_response = None  # Réponse du sondage, gardée ouverte : son corps sert au premier segment
+    if cache is not None and checksums and not os.path.exists(file_path):
+        sha256 = cache.lookup(digests=checksums)
+        if sha256 and from_cache(sha256):
+            return True
+
     # --- Étape 1 : Obtenir l'URL finale après les redirections et ses infos ---
     total_server_size = 0
     accept_ranges = False
     final_download_url = url  # On commence avec l'URL initiale
+    candidates = [url] + [mirror for mirror in mirrors if mirror != url]
+
+    if resumed_from_journal:
+        final_download_url = journal.final_url
+        total_server_size = journal.total_size
+        accept_ranges = True
+        checksums += [tuple(checksum) for checksum in journal.checksums if checksum[0] not in dict(checksums)]
+        update_status(f"Reprise depuis le journal : {journal.completed_bytes}/{total_server_size} octets "
+                      f"déjà téléchargés ({final_download_url}).")
+    else:
+        probe_headers = BROWSER_HEADERS.copy()
+        probe_headers['Range'] = 'bytes=0-'
+        # Référence : la première source qui répond au sondage (l'URL principale, sinon un miroir)
+        for index, probe_url in enumerate(candidates):
+            try:
+                # GET qui suit toutes les redirections ; une réponse 206 prouve le support des plages.
+                # Le corps n'est pas jeté : il devient le segment 0 (ou le téléchargement simple).
+                probe_started = time.perf_counter()
+                probe_response = http_session.get(probe_url, cookies=cookies, stream=True, timeout=10,
+                                                  headers=probe_headers)
+                metrics.probe(probe_response, time.perf_counter() - probe_started)
+                probe_response.raise_for_status()
+                final_download_url = probe_response.url  # L'URL après toutes les redirections
+
+                # Tente de récupérer la taille totale
+                partial = probe_response.status_code == 206
+                if partial:
+                    total_server_size = _content_range_total(probe_response)
+                    accept_ranges = True
+                else:
+                    total_server_size = int(probe_response.headers.get('content-length', 0))
+                journal = DownloadJournal.from_response(storage.journal_path, url, probe_response, total_server_size)
+                # Empreintes du fichier complet annoncées par le serveur, gardées pour une reprise sans requête
+                journal.checksums = [[algorithm, digest] for algorithm, digest
+                                     in checksums_from_headers(probe_response.headers, partial)]
+                checksums += [tuple(checksum) for checksum in journal.checksums if checksum[0] not in dict(checksums)]
+
+                update_status(f"URL finale après redirection : {final_download_url}")
+                update_status(
+                    f"Taille du fichier sur le serveur : {total_server_size / (1024 * 1024):.2f} Mo. Supporte les plages : {accept_ranges}.")
+                break
 
-    try:
-        # Fait une requête GET pour s'assurer de suivre toutes les redirections
-        # et obtenir les headers de la réponse finale
-        with requests.get(url, stream=True, timeout=5, headers=BROWSER_HEADERS) as initial_response:
-            initial_response.raise_for_status()
-            final_download_url = initial_response.url  # L'URL après toutes les redirections
-
-            # Tente de récupérer la taille totale
-            total_server_size = int(initial_response.headers.get('content-length', 0))
-            accept_ranges = 'bytes' in initial_response.headers.get('accept-ranges', '').lower()
-
-            # Note: initial_response.close() est appelé automatiquement par 'with'
-
-        update_status(f"URL finale après redirection : {final_download_url}")
-        update_status(
-            f"Taille du fichier sur le serveur : {total_server_size / (1024 * 1024):.2f} Mo. Supporte les plages : {accept_ranges}.")
-
-    except requests.exceptions.RequestException as e:
-        update_status(
-            f"Impossible de récupérer les informations du fichier sur le serveur : {e}. Tentative de téléchargement simple.",
-            True)
-        total_server_size = 0  # Force le téléchargement simple si erreur ou pas d'info
+            except requests.exceptions.RequestException as e:
+                metrics.error(f"probe {type(e).__name__}: {e}")
+                if probe_response is not None:
+                    probe_response.close()
+                    probe_response = None
+                if index + 1 < len(candidates):
+                    update_status(f"⚠️ Source indisponible ({e}) : {probe_url}. Essai de la suivante.", True)
+                    continue
+                update_status(
+                    f"Impossible de récupérer les informations du fichier sur le serveur : {e}. Tentative de téléchargement simple.",
+                    True)
+                total_server_size = 0  # Force le téléchargement simple si erreur ou pas d'info
+    metrics.total_size = total_server_size
+    # Le serveur a ignoré 'Range: bytes=0-' : aucune reprise possible
+    ranges_refused = probe_response is not None and probe_response.status_code == 200
 
     # --- Gestion des fichiers existants et reprise (adaptée au multi-segments) ---
-    temp_parts_dir = os.path.join(destination_folder, f"{file_name}.parts")
 
     # Si le fichier final existe et est complet, on ne fait rien
     if os.path.exists(file_path) and 0 < total_server_size == os.path.getsize(file_path):
         update_status(
             f"Le fichier '{file_name}' est déjà complet ({os.path.getsize(file_path)} octets). Téléchargement ignoré.",
             False)
+        if probe_response is not None:
+            probe_response.close()
         if progress_callback:
             update_progress(total_server_size, total_server_size)
-        if os.path.exists(temp_parts_dir):
-            try:
-                for f in os.listdir(temp_parts_dir):
-                    os.remove(os.path.join(temp_parts_dir, f))
-                os.rmdir(temp_parts_dir)
-                update_status(f"Dossier temporaire supprimé : {temp_parts_dir}", False)
-            except Exception as e:
-                update_status(f"Impossible de supprimer le dossier temporaire : {e}", True)
-        return
+        try:
+            if storage.discard():
+                update_status(f"Fichiers temporaires de '{file_name}' supprimés.", False)
+        except Exception as e:
+            update_status(f"Impossible de supprimer les fichiers temporaires : {e}", True)
+        return True
+
+    # Même source (URL finale, ETag, taille) ou même empreinte annoncée déjà téléchargées
+    if cache is not None and total_server_size > 0:
+        sha256 = cache.lookup(str(final_download_url), journal.etag if journal else None, total_server_size,
+                              checksums)
+        if sha256 and from_cache(sha256):
+            return True
 
     # --- LOGIQUE MULTI-SEGMENTS (si accept_ranges est True et total_server_size > 0) ---
-    # Nous allons déplacer cette logique plus haut pour la prioriser si elle est supportée
+    # Les segments sont attribués dynamiquement : un worker inactif récupère la moitié du segment le plus lent
 
     if accept_ranges and total_server_size > 0:
         update_status("Téléchargement multi-segments supporté. Démarrage du téléchargement segmenté.", False)
 
-        if not os.path.exists(temp_parts_dir):
-            os.makedirs(temp_parts_dir)
-            update_status(f"Dossier temporaire créé pour les parties : {temp_parts_dir}", False)
-
-        part_size = math.ceil(total_server_size / MAX_CONNECTIONS)
-        threads = []
-
-        downloaded_total_bytes = 0
-        progress_lock = threading.Lock()
-
-        def download_part(part_num, start_byte, end_byte, part_url, part_file_path, part_progress_callback=None,
-                          part_status_callback=None):
-            nonlocal downloaded_total_bytes
-
-            headers = BROWSER_HEADERS.copy()  # Chaque partie utilise les headers du navigateur
-            headers['Range'] = f'bytes={start_byte}-{end_byte}'  # Puis ajoute son propre Range
-
-            part_mode = 'wb'
-            part_initial_bytes = 0
-
-            # Gérer la reprise pour la partie individuelle
-            if os.path.exists(part_file_path):
-                part_initial_bytes = os.path.getsize(part_file_path)
-                if part_initial_bytes == (end_byte - start_byte + 1):
-                    update_status(f"Partie {part_num} déjà complète.", False)
-                    with progress_lock:
-                        downloaded_total_bytes += part_initial_bytes
-                    if progress_callback:
-                        update_progress(downloaded_total_bytes, total_server_size)
-                    return
-                elif part_initial_bytes < (end_byte - start_byte + 1):
-                    headers['Range'] = f'bytes={start_byte + part_initial_bytes}-{end_byte}'  # Ajuste le range
-                    part_mode = 'ab'
-                    update_status(
-                        f"Reprise de la partie {part_num} à partir de {start_byte + part_initial_bytes} octets...",
-                        False)
-                else:
-                    update_status(f"Partie {part_num} corrompue ou taille incorrecte. Redémarrage.", True)
-                    part_initial_bytes = 0
-                    part_mode = 'wb'
-
-            update_status(f"Démarrage du téléchargement de la partie {part_num} ({start_byte}-{end_byte})...", False)
-
+        controller = ConnectionController(total_server_size, max_connections, adaptive_connections)
+        try:
+            scheduler = storage.load_segments(journal, controller.target, update_status)
+        except OSError as e:
+            update_status(f"❌ Impossible de préparer les fichiers temporaires : {e}", True)
+            if probe_response is not None:
+                probe_response.close()
+            return False
+        hasher = OrderedHasher(hasher_checksums(), storage.read_range) if hasher_checksums() else None
+        sources = _mirror_set(final_download_url, journal, candidates, update_status, cookies)
+        # Écritures regroupées par un thread dédié : un disque lent ralentit la file, pas les sockets
+        writer = DiskWriter(fsync_policy).start()
+        download = SegmentedDownload(final_download_url, scheduler, storage, total_server_size, update_status, hasher,
+                                     probe_response, throttle, metrics, sources, writer, cookies)
+        publisher = progress_publisher(total_server_size, scheduler.progress).start()
+        try:
+            download.run(controller)
+        finally:
+            writer.close()
+            publisher.stop()
+            metrics.sources = download.mirrors.to_dict()
+            metrics.disk_writer(writer.stats())
+        if writer.error:
+            update_status(f"❌ Erreur d'écriture sur le disque pour '{file_name}' : {writer.error}", True)
+
+        # Le fichier distant a changé : les octets déjà reçus appartiennent à une autre version
+        if download.remote_changed:
+            storage.discard()
+            if resumed_from_journal:
+                update_status(f"Le fichier '{file_name}' a changé sur le serveur : reprise refusée, "
+                              f"redémarrage du téléchargement.", True)
+                metrics.retry()
+                return _download_file_robust(url, destination_folder, progress_callback, status_callback,
+                                             preallocate, max_connections, snapshot_callback, expected_hash,
+                                             max_speed, adaptive_connections, mirrors, fsync_policy, cache,
+                                             metrics)
+            update_status(f"❌ Le fichier '{file_name}' a changé sur le serveur pendant le téléchargement.", True)
+            return False
+
+        # Un fichier incomplet n'est jamais finalisé : l'avancement est conservé pour une reprise
+        if not scheduler.complete:
+            update_status(f"❌ Le téléchargement de '{file_name}' est incomplet "
+                          f"({scheduler.downloaded_bytes()}/{total_server_size} octets). Relancez pour reprendre.", True)
+            metrics.error("incomplete")
+            return False
+
+        # Une empreinte porte sur le fichier entier : impossible de savoir quel segment est fautif
+        if hasher:
             try:
-                # Utiliser final_download_url pour les parties
-                response = requests.get(final_download_url, stream=True, headers=headers,
-                                        timeout=10)  # Utilise les headers déjà fusionnés
-                response.raise_for_status()
-
-                # Si le serveur ne supporte pas la reprise pour cette requête GET (réponse 200 au lieu de 206)
-                if response.status_code == 200 and part_initial_bytes > 0:
-                    update_status(f"Serveur ne supporte pas la reprise pour la partie {part_num}. Redémarrage complet.",
-                                  True)
-                    part_initial_bytes = 0
-                    part_mode = 'wb'
-                    # Re-requête sans l'en-tête Range si le serveur répond 200 malgré tout
-                    # Pour simplifier, on laisse l'écriture 'wb' et on recommence
-                    # Si on voulait être parfait, on ferait un nouveau requests.get ici sans Range
-
-                with open(part_file_path, part_mode) as f:
-                    for chunk in response.iter_content(chunk_size=1024):
-                        if chunk:
-                            f.write(chunk)
-                            chunk_len = len(chunk)
-                            with progress_lock:
-                                downloaded_total_bytes += chunk_len
-                            if progress_callback:
-                                update_progress(downloaded_total_bytes, total_server_size)
-                update_status(f"Partie {part_num} téléchargée avec succès.", False)
-
-            except requests.exceptions.RequestException as e:
-                update_status(f"❌ Erreur lors du téléchargement de la partie {part_num}: {e}", True)
-            except Exception as e:
-                update_status(f"❌ Erreur inattendue pour la partie {part_num}: {e}", True)
-
-        for i in range(MAX_CONNECTIONS):
-            start = i * part_size
-            end = min((i + 1) * part_size - 1, total_server_size - 1)
-            if start > end:
-                continue
-
-            part_file_path = os.path.join(temp_parts_dir, f"{file_name}.part{i}")
-
-            # Pass final_download_url to download_part
-            thread = threading.Thread(target=download_part,
-                                      args=(i, start, end, final_download_url, part_file_path,
-                                            # MODIF ICI : final_download_url
-                                            progress_callback, status_callback))
-            threads.append(thread)
-            thread.start()
-
-        for thread in threads:
-            thread.join()
-
-        update_status("Toutes les parties téléchargées. Fusion en cours...", False)
+                hasher.catch_up(total_server_size)
+            except OSError as e:
+                update_status(f"❌ Impossible de relire '{file_name}' pour vérifier son empreinte : {e}", True)
+                return False
+            if not verify_checksum(hasher):
+                metrics.error("checksum_mismatch")
+                storage.discard()
+                return False
+
+        update_status("Toutes les parties téléchargées. Finalisation en cours...", False)
         try:
-            with open(file_path, 'wb') as outfile:
-                for i in range(MAX_CONNECTIONS):
-                    part_file_path = os.path.join(temp_parts_dir, f"{file_name}.part{i}")
-                    if os.path.exists(part_file_path):
-                        with open(part_file_path, 'rb') as infile:
-                            outfile.write(infile.read())
-                        os.remove(part_file_path)
-
-            os.rmdir(temp_parts_dir)
+            storage.finalize(scheduler.segments)
             update_status(
-                f"✅ Téléchargement multi-segments de '{file_name}' terminé avec succès. Dossier temporaire supprimé.",
+                f"✅ Téléchargement multi-segments de '{file_name}' terminé avec succès. Fichiers temporaires supprimés.",
                 False)
+            add_to_cache(hasher, journal.etag, total_server_size)
             if progress_callback:
                 update_progress(total_server_size, total_server_size)
+            return True
 
         except Exception as e:
-            update_status(f"❌ Erreur lors de la fusion ou de la suppression des parties : {e}", True)
+            update_status(f"❌ Erreur lors de la finalisation ou de la suppression des parties : {e}", True)
             update_status(f"Le fichier '{file_name}' peut être incomplet ou corrompu.", True)
 
-        return  # Termine la fonction après le multi-segments
+        return False  # Termine la fonction après le multi-segments
 
     # --- LOGIQUE DE TÉLÉCHARGEMENT SIMPLE (si multi-segments non supporté/applicable) ---
     # Cette section est exécutée si la condition 'if accept_ranges and total_server_size > 0:' ci-dessus est fausse
@@ -224,7 +723,7 @@ def download_file_robust(url, destination_folder="downloads", progress_callback=
     # Reprise simple si le fichier existe et est incomplet
     if os.path.exists(file_path):
         initial_bytes = os.path.getsize(file_path)
-        if total_server_size > 0 and initial_bytes < total_server_size:
+        if total_server_size > 0 and initial_bytes < total_server_size and not ranges_refused:
             headers['Range'] = f'bytes={initial_bytes}-'
             mode = 'ab'
             update_status(f"Reprise du téléchargement simple à partir de {initial_bytes} octets...", False)
@@ -232,7 +731,7 @@ def download_file_robust(url, destination_folder="downloads", progress_callback=
             update_status(f"Le fichier '{file_name}' est déjà complet ({initial_bytes} octets). Téléchargement ignoré.",
                           False)
             if progress_callback: update_progress(initial_bytes, total_server_size)
-            return
+            return True
         else:  # Fichier existe mais ne peut pas être repris ou est de taille incorrecte, on écrase
             update_status(
                 f"Impossible de reprendre le téléchargement pour '{file_name}'. Redémarrage du téléchargement.", False)
@@ -247,11 +746,18 @@ def download_file_robust(url, destination_folder="downloads", progress_callback=
                 f"Impossible de supprimer l'ancien fichier '{file_name}': {e}. Le téléchargement pourrait échouer.",
                 True)
 
+    segment_metrics = metrics.segment(initial_bytes, total_server_size - 1 if total_server_size else None)
     try:
-        # Utiliser final_download_url pour le téléchargement simple
-        response = requests.get(final_download_url, stream=True, timeout=10,
-                                headers=headers)  # MODIF ICI : final_download_url
-        response.raise_for_status()
+        if probe_response is not None and mode == 'wb':
+            response = probe_response  # Le corps du sondage part de l'octet 0 : pas de seconde requête
+        else:
+            if probe_response is not None:
+                probe_response.close()
+            # Utiliser final_download_url pour le téléchargement simple
+            response = http_session.get(final_download_url, cookies=cookies, stream=True, timeout=10,
+                                    headers=headers)  # MODIF ICI : final_download_url
+            response.raise_for_status()
+        segment_metrics.response(response)
 
         if response.status_code == 200 and initial_bytes > 0:
             update_status(
@@ -259,55 +765,218 @@ def download_file_robust(url, destination_folder="downloads", progress_callback=
                 False)
             initial_bytes = 0
             mode = 'wb'
+            segment_metrics.start = 0
 
         total_size_response = int(response.headers.get('content-length', 0))
         total_size_for_progress = total_size_response + initial_bytes
 
-        block_size = 1024
-
         progress_bar = tqdm(initial=initial_bytes,
                             total=total_size_for_progress,
                             unit='iB', unit_scale=True, desc=file_name,
                             disable=total_size_for_progress == 0 and progress_callback is None)
 
-        with open(file_path, mode) as file:
-            for chunk in response.iter_content(chunk_size=block_size):
-                if chunk:
+        hasher = None
+        if hasher_checksums():
+            hasher = OrderedHasher(hasher_checksums(), _file_range_reader(file_path))
+            hasher.catch_up(initial_bytes)  # Début déjà présent sur disque en cas de reprise
+
+        publisher = progress_publisher(total_size_for_progress)
+        publisher.add(initial_bytes)
+        publisher.start()
+        try:
+            with open(file_path, mode) as file:
+                position = initial_bytes
+                for chunk in iter_into(response, throttle=throttle):
+                    write_started = time.perf_counter()
                     file.write(chunk)
+                    segment_metrics.disk_time += time.perf_counter() - write_started
+                    if hasher:
+                        hasher.update(position, chunk)
                     chunk_len = len(chunk)
+                    segment_metrics.bytes += chunk_len
+                    position += chunk_len
                     progress_bar.update(chunk_len)
-                    if progress_callback:
-                        update_progress(progress_bar.n, total_size_for_progress)
+                    publisher.add(chunk_len)
+        finally:
+            publisher.stop()
 
         progress_bar.close()
 
+        complete = total_size_for_progress == 0 or progress_bar.n == total_size_for_progress
+        if hasher and complete and not verify_checksum(hasher):
+            os.remove(file_path)
+            segment_metrics.error = "checksum_mismatch"
+            return False
+
         if total_size_for_progress != 0 and progress_bar.n != total_size_for_progress:
             update_status(
                 f"⚠️ AVERTISSEMENT : Le téléchargement de '{file_name}' n'est pas complet (taille attendue: {total_size_for_progress}, téléchargée: {progress_bar.n}).",
                 is_error=True)
+            segment_metrics.error = "incomplete"
+            return False
         elif total_size_for_progress == 0 and initial_bytes == 0:
             update_status(
                 f"Téléchargement de '{file_name}' terminé. Taille du fichier inconnue (pas de Content-Length).", False)
         else:
             update_status(f"✅ Téléchargement de '{file_name}' terminé avec succès.", False)
+            add_to_cache(hasher, journal.etag if journal else None, total_size_for_progress)
+        return True
 
     except requests.exceptions.HTTPError as e:
         update_status(
             f"❌ Erreur HTTP lors du téléchargement simple de {url}: {e.response.status_code} - {e.response.reason}",
             is_error=True)
+        segment_metrics.error = f"HTTPError: {e.response.status_code}"
     except requests.exceptions.ConnectionError as e:
         update_status(
             f"❌ Erreur de connexion lors du téléchargement simple : Impossible de se connecter à {url}. Détails: {e}",
             is_error=True)
+        segment_metrics.error = f"{type(e).__name__}: {e}"
     except requests.exceptions.Timeout as e:
         update_status(
             f"❌ Délai de connexion dépassé lors du téléchargement simple : Le serveur n'a pas répondu à temps pour {url}. Détails: {e}",
             is_error=True)
+        segment_metrics.error = f"{type(e).__name__}: {e}"
     except requests.exceptions.RequestException as e:
         update_status(f"❌ Une erreur générale de requête s'est produite lors du téléchargement simple de {url}: {e}",
                       is_error=True)
+        segment_metrics.error = f"{type(e).__name__}: {e}"
     except Exception as e:
         update_status(f"❌ Une erreur inattendue s'est produite lors du traitement simple de {url}: {e}", is_error=True)
-    return  # Termine la fonction si on a fait un téléchargement simple
+        segment_metrics.error = f"{type(e).__name__}: {e}"
+    finally:
+        metrics.finish_segment(segment_metrics, segment_metrics.error)
+    return False  # Termine la fonction si on a fait un téléchargement simple
+
+
+def open_stream(url, max_buffer=MAX_REORDER_BUFFER, max_connections=MAX_ADAPTIVE_CONNECTIONS, status_callback=None,
+                expected_hash=None, max_speed=None, adaptive_connections=True, mirrors=None):
+    """
+    Télécharge un fichier en plusieurs segments parallèles et rend ses octets dans l'ordre, sans passer par le disque :
+    de quoi alimenter directement un décompresseur, un calcul d'empreinte ou un envoi, au débit multi-connexions.
+
+    :param max_buffer: Octets au plus gardés en mémoire en attendant le lecteur ; au-delà, les connexions attendent
+    :param max_connections, adaptive_connections, max_speed, mirrors: comme pour download_file_robust
+    :param expected_hash: Empreinte attendue ('sha256:<hex>'), vérifiée à la fin de la lecture avec celles
+                          annoncées par le serveur
+    :return: ordered_stream.OrderedStream, à fermer (ou à utiliser avec `with`)
+
+    Lève requests.exceptions.RequestException si le fichier est inaccessible, ValueError si expected_hash
+    est invalide. Sans support des plages, le flux passe par une seule connexion.
+    """
+    def update_status(message, is_error=False):
+        if status_callback:
+            status_callback(message, is_error)
+        else:
+            print(message)
+
+    checksums = [parse_expected_hash(expected_hash)] if expected_hash else []
+    throttle = throttle_for(max_speed)
+    metrics = REGISTRY.start_download(url, 'stream')
+    cookies = http_session.new_cookie_jar()
+    probe_headers = BROWSER_HEADERS.copy()
+    probe_headers['Range'] = 'bytes=0-'
+    try:
+        probe_started = time.perf_counter()
+        probe_response = http_session.get(url, cookies=cookies, stream=True, timeout=10, headers=probe_headers)
+        metrics.probe(probe_response, time.perf_counter() - probe_started)
+        probe_response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        metrics.error(f"probe {type(e).__name__}: {e}")
+        metrics.finish(False)
+        raise
+
+    partial = probe_response.status_code == 206
+    total_size = (_content_range_total(probe_response) if partial
+                  else int(probe_response.headers.get('content-length', 0)))
+    metrics.total_size = total_size
+    checksums += [checksum for checksum in checksums_from_headers(probe_response.headers, partial)
+                  if checksum[0] not in dict(checksums)]
+    final_url = str(probe_response.url)
+    journal = DownloadJournal.from_response(None, url, probe_response, total_size)
+    buffer = ReorderBuffer(journal, max_buffer)
+
+    if not (partial and total_size):
+        update_status("Plages non supportées ou taille inconnue : flux sur une seule connexion.", False)
+
+        def produce_single():
+            segment_metrics = metrics.segment(0, total_size - 1 if total_size else None)
+            segment_metrics.response(probe_response)
+            success = False
+            try:
+                with probe_response:
+                    for chunk in iter_into(probe_response, throttle=throttle):
+                        if buffer.closed:
+                            break
+                        buffer.write(segment_metrics.bytes, chunk)
+                        segment_metrics.bytes += len(chunk)
+                success = not buffer.closed and (not total_size or segment_metrics.bytes == total_size)
+                return success
+            except NETWORK_ERRORS as e:
+                segment_metrics.error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                metrics.finish_segment(segment_metrics, segment_metrics.error)
+                metrics.finish(success)
+
+        return OrderedStream(buffer, produce_single, checksums=checksums, final_url=final_url)
+
+    controller = ConnectionController(total_size, max_connections, adaptive_connections)
+    scheduler = buffer.load_segments(journal, controller.target, update_status)
+    candidates = [url] + [mirror for mirror in mirrors or () if mirror != url]
+    sources = _mirror_set(final_url, journal, candidates, update_status, cookies)
+    download = SegmentedDownload(final_url, scheduler, buffer, total_size, update_status, None, probe_response,
+                                 throttle, metrics, sources, cookies=cookies)
+
+    def produce_segmented():
+        success = False
+        try:
+            download.run(controller)
+            success = scheduler.complete
+            if download.remote_changed:
+                update_status(f"❌ Le fichier distant a changé pendant la lecture du flux ({url}).", True)
+            return success
+        finally:
+            metrics.sources = download.mirrors.to_dict()
+            metrics.finish(success)
+
+    return OrderedStream(buffer, produce_segmented, download.stop_event.set, checksums, final_url)
+
+
+def _mirror_set(final_url, journal, candidates, update_status, cookies=None):
+    """MirrorSet des `candidates` (None s'il n'y a qu'une source) : la source du sondage ou du journal fait
+    référence, les autres doivent servir le même fichier."""
+    if len(candidates) < 2:
+        return None
+    sources = MirrorSet([Mirror(final_url, journal.etag, journal.last_modified)]
+                        + [Mirror(candidate) for candidate in candidates if candidate != final_url], cookies)
+    sources.probe(journal.total_size, update_status)
+    return sources
+
+
+def _retry_after(response):
+    """Délai demandé par l'en-tête Retry-After (secondes ou date HTTP), 0 s'il est absent ou illisible."""
+    value = response.headers.get('Retry-After', '').strip()
+    if value.isdigit():
+        return min(float(value), RETRY_MAX_DELAY)
+    try:
+        return min(max(0.0, parsedate_to_datetime(value).timestamp() - time.time()), RETRY_MAX_DELAY)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _content_range_total(response):
+    """Taille totale indiquée par 'Content-Range: bytes 0-99/1234' (0 si inconnue)."""
+    total = response.headers.get('Content-Range', '').rpartition('/')[2]
+    return int(total) if total.isdigit() else 0
+
+
+def _file_range_reader(path):
+    """read_range(offset, length) sur un fichier en cours d'écriture, pour OrderedHasher.catch_up()."""
+    def read_range(offset, length):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+    return read_range
 
 # ... (Votre bloc if __name__ == "__main__": reste inchangé, mais vous pouvez tester avec l'URL de sibnet pour le multi-segments)
\ No newline at end of file
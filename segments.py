@@ -0,0 +1,174 @@
+import math
+import threading
+import time
+
+# En dessous de cette taille, couper un segment en deux coûte plus cher (nouvelle connexion) que ça ne rapporte
+MIN_SEGMENT_SIZE = 1024 * 1024
+MAX_CONNECTIONS = 8  # Connexions simultanées par fichier
+WINDOW_POLL_INTERVAL = 0.05  # Secondes entre deux essais d'un worker arrêté par window_end
+
+
+class Segment:
+    """Plage d'octets [start, end] (bornes incluses) d'un fichier à télécharger.
+
+    position est le prochain octet réservé par le worker, written le prochain octet réellement écrit.
+    end peut diminuer pendant le téléchargement si le scheduler coupe le segment.
+    """
+
+    def __init__(self, start, end, position=None):
+        self.start = start
+        self.end = end
+        self.position = start if position is None else position
+        self.written = self.position
+        self.active = False
+        self.failed = False  # Échec définitif (pas de nouvelle tentative)
+        self.failures = 0  # Tentatives échouées consécutives, sans progrès
+        self.retry_at = 0.0  # Instant (time.monotonic) avant lequel le segment n'est pas redistribué
+        self.retry_after = 0.0  # Délai minimal demandé par le serveur (Retry-After) pour la prochaine tentative
+        self.assigned_at = None
+        self.received = 0  # Octets reçus depuis la dernière attribution (pour estimer le débit)
+
+    @property
+    def remaining(self):
+        return max(0, self.end - self.position + 1)
+
+    @property
+    def done(self):
+        return self.position > self.end
+
+    def estimated_time_left(self, now):
+        """Temps restant estimé d'après le débit observé. Infini si le segment est bloqué."""
+        elapsed = now - self.assigned_at if self.assigned_at else 0
+        if self.received == 0 or elapsed <= 0:
+            return math.inf
+        return self.remaining / (self.received / elapsed)
+
+    def __repr__(self):
+        return f"Segment({self.start}-{self.end}, position={self.position})"
+
+
+class SegmentScheduler:
+    """Distribue les segments aux workers et fait du vol de travail.
+
+    Quand un worker n'a plus de segment en attente, il récupère la seconde moitié
+    du segment actif qui finira le plus tard (le plus lent ou bloqué).
+    """
+
+    def __init__(self, segments, min_segment_size=MIN_SEGMENT_SIZE):
+        self.segments = sorted(segments, key=lambda s: s.start)
+        self.min_segment_size = min_segment_size
+        # Les segments qui commencent au-delà ne sont pas distribués (lecture ordonnée : ordered_stream)
+        self.window_end = math.inf
+        self._lock = threading.Lock()
+
+    @classmethod
+    def split_evenly(cls, total_size, count, min_segment_size=MIN_SEGMENT_SIZE):
+        """Découpe [0, total_size - 1] en `count` segments de taille égale."""
+        part_size = math.ceil(total_size / count)
+        segments = []
+        for i in range(count):
+            start = i * part_size
+            end = min((i + 1) * part_size - 1, total_size - 1)
+            if start > end:
+                continue
+            segments.append(Segment(start, end))
+        return cls(segments, min_segment_size)
+
+    def next_segment(self):
+        """Retourne un segment à télécharger, ou None si rien n'est disponible pour l'instant.
+
+        Un segment en attente de nouvelle tentative n'est redistribué qu'après son délai,
+        au premier worker libre (pas forcément celui qui a échoué).
+        """
+        with self._lock:
+            now = time.monotonic()
+            for segment in self.segments:
+                if segment.start >= self.window_end:
+                    break
+                if not segment.active and not segment.done and not segment.failed and segment.retry_at <= now:
+                    self._activate(segment)
+                    return segment
+            return self._steal()
+
+    def next_retry_delay(self):
+        """Secondes avant qu'un segment en attente (nouvelle tentative, fenêtre) soit disponible, None s'il n'y en a pas."""
+        with self._lock:
+            now = time.monotonic()
+            waiting = [s for s in self.segments if not s.active and not s.done and not s.failed]
+            delays = [s.retry_at - now for s in waiting if s.retry_at > now]
+            if any(s.start >= self.window_end for s in waiting):
+                delays.append(WINDOW_POLL_INTERVAL)  # La fenêtre avance quand le lecteur consomme
+            return max(0.0, min(delays)) if delays else None
+
+    def _steal(self):
+        now = time.monotonic()
+        candidates = [s for s in self.segments
+                      if s.active and s.remaining >= 2 * self.min_segment_size]
+        if not candidates:
+            return None
+        victim = max(candidates, key=lambda s: (s.estimated_time_left(now), s.remaining))
+        middle = victim.position + victim.remaining // 2
+        stolen = Segment(middle, victim.end)
+        victim.end = middle - 1
+        self.segments.insert(self.segments.index(victim) + 1, stolen)
+        self._activate(stolen)
+        return stolen
+
+    @staticmethod
+    def _activate(segment):
+        segment.active = True
+        segment.assigned_at = time.monotonic()
+        segment.received = 0
+
+    def claim(self, segment, length):
+        """Réserve `length` octets reçus pour ce segment.
+
+        Retourne le nombre d'octets à écrire : moins que `length` si le segment
+        a été raccourci entre-temps, 0 s'il est terminé.
+        """
+        with self._lock:
+            keep = max(0, min(length, segment.end - segment.position + 1))
+            segment.position += keep
+            segment.received += keep
+            return keep
+
+    def release(self, segment, failed=False):
+        """Rend le segment au scheduler à la fin (ou à l'échec définitif) de son téléchargement."""
+        with self._lock:
+            segment.active = False
+            segment.failed = failed and not segment.done
+
+    def retry(self, segment, delay):
+        """Rend le segment pour une nouvelle tentative dans `delay` secondes, à partir du premier octet non écrit."""
+        with self._lock:
+            segment.active = False
+            segment.position = segment.written  # Octets réservés mais jamais écrits : redemandés
+            segment.retry_at = time.monotonic() + delay
+
+    @property
+    def complete(self):
+        with self._lock:
+            return all(s.done for s in self.segments)
+
+    def snapshot(self):
+        """Liste (start, written, end) de chaque segment, pour les points de reprise."""
+        with self._lock:
+            return [[s.start, s.written, s.end] for s in self.segments]
+
+    def progress(self):
+        """(octets écrits, [(start, written, end, active), ...]) pour les indicateurs de progression."""
+        with self._lock:
+            return (sum(s.written - s.start for s in self.segments),
+                    [(s.start, s.written, s.end, s.active) for s in self.segments])
+
+    def contiguous_written(self):
+        """Fin de la plus longue plage [0, n[ entièrement écrite depuis le début du fichier."""
+        with self._lock:
+            for s in self.segments:
+                if s.written <= s.end:
+                    return s.written
+            return self.segments[-1].end + 1 if self.segments else 0
+
+    def downloaded_bytes(self):
+        with self._lock:
+            return sum(s.position - s.start for s in self.segments)
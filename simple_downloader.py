@@ -1,6 +1,9 @@
 import requests
 import os
 from tqdm import tqdm
+import http_session
+from bandwidth import throttle_for
+from buffers import iter_into
 
 def download_file(url, destination_folder="downloads"):
     """
@@ -21,20 +24,19 @@ def download_file(url, destination_folder="downloads"):
     print(f"Vers : {file_path}")
 
     try:
-        response = requests.get(url, stream=True) # Stream = True lit le contenu par morceaux
+        response = http_session.get(url, stream=True) # Stream = True lit le contenu par morceaux
         response.raise_for_status()  # Lève une execption pour les erreurs
 
         total_size_in_bytes = int(response.headers.get('content-length', 0))
-        block_size = 1024  # 1 Kilobyte
 
         # initialiser la barre de progression tqdm
         progress_bar = tqdm(total=total_size_in_bytes, unit='iB', unit_scale=True, desc=file_name)
 
         with open(file_path, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=block_size):
-                if chunk: # Assurer que le morceau n'est pas vide
-                    file.write(chunk)
-                    progress_bar.update(len(chunk))
+            # Lectures directes dans un tampon réutilisé dont la taille suit le débit
+            for chunk in iter_into(response, throttle=throttle_for()):  # Limite de débit globale
+                file.write(chunk)
+                progress_bar.update(len(chunk))
         progress_bar.close()
 
         if total_size_in_bytes != 0 and progress_bar.n != total_size_in_bytes:
@@ -0,0 +1,200 @@
+import functools
+import os
+import shutil
+import sys
+
+from journal import DownloadJournal
+from segments import Segment, SegmentScheduler
+
+
+class PartsStorage:
+    """Un fichier par segment dans '<nom>.parts/', concaténés dans le fichier final à la fin."""
+
+    def __init__(self, destination_folder, file_name):
+        self.file_name = file_name
+        self.file_path = os.path.join(destination_folder, file_name)
+        self.parts_dir = os.path.join(destination_folder, f"{file_name}.parts")
+        self.journal_path = os.path.join(self.parts_dir, f"{file_name}.journal")
+        self.journal = None
+        self.scheduler = None
+
+    def read_journal(self):
+        return DownloadJournal.load(self.journal_path)
+
+    def part_path(self, segment):
+        return self._part_path(segment.start)
+
+    def _part_path(self, start):
+        return os.path.join(self.parts_dir, f"{self.file_name}.part{start}")
+
+    def load_segments(self, journal, connections, update_status):
+        """Reconstruit les segments à partir des fichiers '<nom>.part<octet de début>' déjà présents.
+
+        Chaque partie s'étend jusqu'au début de la suivante : la reprise ne dépend donc pas
+        du nombre de connexions ni des découpages faits lors du téléchargement précédent.
+        Le journal ne sert ici qu'aux validateurs : la taille des parties fait foi.
+        """
+        self.journal = journal
+        total_size = journal.total_size
+        if not os.path.exists(self.parts_dir):
+            os.makedirs(self.parts_dir)
+            update_status(f"Dossier temporaire créé pour les parties : {self.parts_dir}", False)
+
+        prefix = f"{self.file_name}.part"
+        offsets = []
+        for name in os.listdir(self.parts_dir):
+            suffix = name[len(prefix):]
+            if name.startswith(prefix) and suffix.isdigit():
+                if int(suffix) < total_size:
+                    offsets.append(int(suffix))
+                else:
+                    os.remove(os.path.join(self.parts_dir, name))
+        offsets.sort()
+
+        if not offsets:
+            self.scheduler = SegmentScheduler.split_evenly(total_size, connections)
+            journal.save(self.scheduler.snapshot())
+            return self.scheduler
+
+        segments = []
+        if offsets[0] > 0:
+            segments.append(Segment(0, offsets[0] - 1))
+        for i, start in enumerate(offsets):
+            end = offsets[i + 1] - 1 if i + 1 < len(offsets) else total_size - 1
+            part_size = os.path.getsize(os.path.join(self.parts_dir, f"{prefix}{start}"))
+            if part_size > end - start + 1:
+                update_status(f"Partie {start} corrompue ou taille incorrecte. Redémarrage.", True)
+                os.remove(os.path.join(self.parts_dir, f"{prefix}{start}"))
+                part_size = 0
+            segments.append(Segment(start, end, position=start + part_size))
+        self.scheduler = SegmentScheduler(segments)
+        journal.save(self.scheduler.snapshot())
+        return self.scheduler
+
+    def open_segment(self, segment):
+        """Ouvre le fichier de la partie sans tampon (relisible aussitôt), positionné sur segment.position."""
+        return open(self.part_path(segment), 'ab' if segment.position > segment.start else 'wb', buffering=0)
+
+    def read_range(self, offset, length):
+        """Relit au plus `length` octets déjà écrits à partir de `offset` (dans une seule partie)."""
+        for start, written, end in self.scheduler.snapshot():
+            if start <= offset < written:
+                with open(self._part_path(start), 'rb') as f:
+                    f.seek(offset - start)
+                    return f.read(min(length, written - offset))
+        return b''
+
+    def checkpoint(self, segments):
+        self.journal.save(segments)
+
+    def finalize(self, segments):
+        """Concatène les parties dans le fichier final puis supprime le dossier temporaire."""
+        with open(self.file_path, 'wb') as outfile:
+            for segment in segments:
+                part_file_path = self.part_path(segment)
+                if os.path.exists(part_file_path):
+                    with open(part_file_path, 'rb') as infile:
+                        shutil.copyfileobj(infile, outfile, 1024 * 1024)
+                    os.remove(part_file_path)
+        self.journal.delete()
+        os.rmdir(self.parts_dir)
+
+    def discard(self):
+        """Supprime les fichiers temporaires (le fichier final est déjà complet)."""
+        if not os.path.exists(self.parts_dir):
+            return False
+        for f in os.listdir(self.parts_dir):
+            os.remove(os.path.join(self.parts_dir, f))
+        os.rmdir(self.parts_dir)
+        return True
+
+
+class PreallocatedStorage:
+    """Fichier préalloué '<nom>.download' où chaque segment écrit directement à son offset.
+
+    L'avancement des segments est noté dans le journal '<nom>.download.journal' ;
+    la fin du téléchargement se résume à un renommage, sans relire ni recopier les données.
+    """
+
+    def __init__(self, destination_folder, file_name):
+        self.file_name = file_name
+        self.file_path = os.path.join(destination_folder, file_name)
+        self.temp_path = f"{self.file_path}.download"
+        self.journal_path = f"{self.temp_path}.journal"
+        self.journal = None
+
+    def read_journal(self):
+        return DownloadJournal.load(self.journal_path)
+
+    def load_segments(self, journal, connections, update_status):
+        """Reprend les segments notés dans le journal, ou préalloue un nouveau fichier."""
+        self.journal = journal
+        total_size = journal.total_size
+        if (journal.segments and os.path.exists(self.temp_path)
+                and os.path.getsize(self.temp_path) == total_size):
+            update_status(f"Reprise du fichier préalloué '{self.temp_path}'.", False)
+            return SegmentScheduler([Segment(start, end, position=written)
+                                     for start, written, end in journal.segments])
+
+        with open(self.temp_path, 'wb') as f:
+            preallocate(f, total_size)
+        update_status(f"Fichier préalloué : {self.temp_path} ({total_size} octets).", False)
+        scheduler = SegmentScheduler.split_evenly(total_size, connections)
+        journal.save(scheduler.snapshot())
+        return scheduler
+
+    def open_segment(self, segment):
+        """Ouvre le fichier préalloué sans tampon, positionné sur segment.position."""
+        f = open(self.temp_path, 'r+b', buffering=0)
+        f.seek(segment.position)
+        return f
+
+    def read_range(self, offset, length):
+        """Relit `length` octets déjà écrits à partir de `offset`."""
+        with open(self.temp_path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def checkpoint(self, segments):
+        """Écrit l'avancement (start, written, end) de chaque segment dans le journal."""
+        self.journal.save(segments)
+
+    def finalize(self, segments):
+        os.replace(self.temp_path, self.file_path)
+        self.journal.delete()
+
+    def discard(self):
+        removed = False
+        for path in (self.temp_path, self.journal_path, f"{self.journal_path}.tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+                removed = True
+        return removed
+
+
+def preallocate(f, size):
+    """Donne au fichier ouvert `f` la taille `size`, en réservant les blocs si le système de fichiers sait le faire.
+
+    Seul fallocate(2) natif réserve les blocs (moins de fragmentation) : os.posix_fallocate retombe, sur les
+    systèmes de fichiers qui ne le gèrent pas, sur une émulation de la glibc qui écrit chaque bloc du fichier
+    avant le premier octet téléchargé. Sinon, fichier creux (ftruncate) : les blocs sont alloués à l'écriture.
+    """
+    fallocate = _native_fallocate()
+    if fallocate is not None and size > 0 and fallocate(f.fileno(), 0, 0, size) == 0:
+        return
+    f.truncate(size)
+
+
+@functools.lru_cache(maxsize=None)
+def _native_fallocate():
+    """fallocate(2) de la libc (Linux), ou None ; mode 0 : échoue (EOPNOTSUPP) au lieu d'émuler."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        fallocate = ctypes.CDLL(None, use_errno=True).fallocate
+    except (ImportError, OSError, AttributeError):
+        return None
+    fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+    fallocate.restype = ctypes.c_int
+    return fallocate
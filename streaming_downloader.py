@@ -1,9 +1,93 @@
-import yt_dlp
 import os
 import threading
-import tkinter as tk
+from extraction_cache import EXTRACTION_CACHE
+from metrics import REGISTRY
+from postprocess import MERGE_FORMAT, POSTPROCESS
 
-def download_streaming_video(url, destination_folder="downloads", progress_callback=None, status_callback=None):
+MAX_CONCURRENT_VIDEOS = 3  # Vidéos d'une playlist téléchargées en parallèle
+CONCURRENT_FRAGMENTS = 4  # Fragments HLS/DASH téléchargés en parallèle pour une même vidéo
+
+
+def _ydl_options(destination_folder, progress_hooks, concurrent_fragments=CONCURRENT_FRAGMENTS):
+    """Options yt-dlp communes au téléchargement d'une vidéo."""
+    return {
+        'format': 'bestvideo+bestaudio/best', # Télécharge la meilleure qualité vidéo et audio et les fusionne
+        'outtmpl': os.path.join(destination_folder, "%(title)s.%(ext)s"), # Chemin de sortie avec le titre et l'extension
+        'progress_hooks': progress_hooks, # Fonctions de rappel pour la progression
+        'merge_output_format': MERGE_FORMAT, # Fusionne en mp4 si audio et vidéo sont séparés
+        'noplaylist': True, # Empêche le téléchargement de playlists entières si l'URL est une playlist
+        'buffersize': 64 * 1024, # Tampon de lecture initial (yt-dlp l'agrandit ensuite selon le débit), 1 Kio par défaut
+        'concurrent_fragment_downloads': concurrent_fragments, # Formats fragmentés : plusieurs fragments à la fois
+    }
+
+
+def _download_video(ydl_opts, url, cache, postprocess, status_callback):
+    """Télécharge `url`, en reprenant si possible l'extraction en cache.
+
+    Si le téléchargement échoue avec une extraction en cache (URL de média expirée plus tôt que prévu,
+    format retiré), l'entrée est supprimée et l'extraction refaite une fois.
+    Retourne le Future de la fusion confiée à `postprocess`, ou None s'il n'y a rien à fusionner.
+    """
+    import yt_dlp
+
+    with yt_dlp.YoutubeDL(dict(ydl_opts)) as ydl:  # Copie : yt-dlp normalise ses options sur place
+        info = cache.get(url) if cache is not None else None
+        if info is not None:
+            if status_callback:
+                status_callback("Extraction reprise du cache, démarrage immédiat.", False)
+            try:
+                return _process(ydl, ydl_opts, info, postprocess, status_callback)
+            except yt_dlp.utils.DownloadError as e:
+                cache.invalidate(url)
+                if status_callback:
+                    status_callback(f"⚠️ Échec avec l'extraction en cache ({e}), nouvelle extraction.", False)
+
+        info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+        if cache is not None:
+            cache.put(url, info)
+        return _process(ydl, ydl_opts, info, postprocess, status_callback)
+
+
+def _process(ydl, ydl_opts, info, postprocess, status_callback):
+    """Télécharge les formats retenus dans `info`.
+
+    Vidéo et audio séparés : chaque format est téléchargé seul, puis leur fusion est confiée à
+    `postprocess` au lieu de bloquer ce thread (None : yt-dlp fusionne lui-même, comme avant).
+    Retourne le Future de cette fusion (True si réussie), ou None si aucune fusion n'a été programmée.
+    """
+    import yt_dlp
+
+    formats = info.get('requested_formats') or []
+    if postprocess is None or len(formats) < 2:
+        ydl.process_ie_result(info, download=True)
+        return None
+
+    output = f"{os.path.splitext(ydl.prepare_filename(info))[0]}.{MERGE_FORMAT}"
+    if os.path.exists(output):
+        if status_callback:
+            status_callback(f"✅ '{os.path.basename(output)}' est déjà téléchargé.", False)
+        return None
+
+    files = []
+
+    def _collect(d):
+        if d['status'] == 'finished':
+            files.append(d['filename'])
+
+    # Sans la sélection combinée précédente, sinon yt-dlp la reprendrait telle quelle
+    single_info = {key: value for key, value in info.items() if key not in ('requested_formats', 'requested_downloads')}
+    template = os.path.splitext(ydl_opts['outtmpl'])[0]
+    for fmt in formats:
+        options = {**ydl_opts, 'format': fmt['format_id'], 'outtmpl': f"{template}.f%(format_id)s.%(ext)s",
+                   'progress_hooks': ydl_opts['progress_hooks'] + [_collect]}
+        with yt_dlp.YoutubeDL(options) as single:
+            single.process_ie_result(dict(single_info), download=True)
+    return postprocess.submit_merge(files, output, status_callback)
+
+
+def download_streaming_video(url, destination_folder="downloads", progress_callback=None, status_callback=None,
+                             concurrent_fragments=CONCURRENT_FRAGMENTS, cache=EXTRACTION_CACHE,
+                             postprocess=POSTPROCESS, merge_callback=None):
     """
     Télécharge une vidéo depuis une URL de streaming en utilisant yt-dlp.
     :param url: L'URL de la page vidéo (ex: YouTube, Anime-Sama))
@@ -14,66 +98,200 @@ def download_streaming_video(url, destination_folder="downloads", progress_callb
     :type progress_callback: callable
     :param status_callback: Fonction à appeler pour mettre à jour le statut. Prend (message, is_error=False) en param
     :type status_callback: callable
+    :param concurrent_fragments: Fragments téléchargés simultanément pour les formats HLS/DASH
+    :type concurrent_fragments: int
+    :param cache: Cache des extractions (None pour toujours extraire à nouveau)
+    :type cache: extraction_cache.ExtractionCache
+    :param postprocess: File des fusions vidéo + audio (None pour fusionner dans ce thread)
+    :type postprocess: postprocess.PostProcessQueue
+    :param merge_callback: Reçoit le Future de la fusion confiée à `postprocess` (True si réussie), dès qu'elle est en file
+    :type merge_callback: callable
+    :return: True si la vidéo a été téléchargée (la fusion éventuelle peut être encore en file : voir merge_callback), False sinon
+    :rtype: bool
+
+    Les callbacks sont appelés depuis le thread de téléchargement : ils doivent être thread-safe
+    (par exemple les méthodes d'un events.EventQueue, vidé par la GUI ou le CLI).
+    Les mesures (extraction, un flux par format téléchargé, erreurs) sont enregistrées dans metrics.REGISTRY.
     """
+    import yt_dlp  # Import différé : plusieurs centaines de ms, inutiles tant qu'aucune vidéo n'est demandée
+
+    metrics = REGISTRY.start_download(url, 'streaming')
+    streams = {}  # Fichier en cours -> SegmentMetrics (un par format : vidéo, audio...)
+
+    def _record(d):
+        stream = streams.get(d.get('filename'))
+        if stream is None:
+            if not streams:
+                metrics.mark('extraction')  # Premier octet reçu : extraction et choix des formats terminés
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            stream = streams[d.get('filename')] = metrics.segment(0, total - 1 if total else None)
+        stream.bytes = d.get('downloaded_bytes') or stream.bytes
+        if d['status'] == 'finished':
+            metrics.finish_segment(stream)
+        elif d['status'] == 'error':
+            metrics.finish_segment(stream, str(d.get('error', 'error')))
 
     def _report_hook(d):
         # Cette fonction est appelée par yt-dlp pour reporter la progression
+        _record(d)
         if d['status'] == 'downloading':
             total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
             downloaded_bytes = d.get('downloaded_bytes')
             speed = d.get('speed', 0)
             eta = d.get('eta', 0)
 
-            # Mettre à jour la GUI avec la progression
+            # Progression (vitesse et temps restant compris) : un seul événement par tick, fusionnable
             if progress_callback:
-                progress_callback(downloaded_bytes, total_bytes, f"Vitesse: {speed/1024:.2f} KiB/s, Reste: {eta}s")
-            # Mettre à jour le GUI avec le status général si besoin
-            if status_callback:
-                # utilisation de .after pour s'assurer que la mise à jour se fait dans le thread principal de Tkinter
-                tk.Frame().after(0, status_callback, f"Téléchargement : {d['_percent_str']} de {d['_total_bytes_str']} (vitesse: {d['_speed_str']})", False )
+                progress_callback(downloaded_bytes, total_bytes, f"Vitesse: {(speed or 0)/1024:.2f} KiB/s, Reste: {eta}s")
+            elif status_callback:
+                status_callback(f"Téléchargement : {d['_percent_str']} de {d['_total_bytes_str']} (vitesse: {d['_speed_str']})", False)
         elif d['status'] == 'finished':
             if progress_callback:
                 progress_callback(d.get('total_bytes', 1), d.get('total_bytes', 1), "Terminé") # s'assurer que la barre est pleine
             if status_callback:
-                tk.Frame().after(0, status_callback, f"✅ Téléchargement de '{d['filename']}' terminé avec succès.",False)
+                status_callback(f"✅ Téléchargement de '{d['filename']}' terminé avec succès.", False)
         elif d['status'] == 'error':
             if status_callback:
-                tk.Frame().after(0, status_callback,f"❌ Erreur lors du téléchargement: {d.get('error', 'Inconnu')}", True)
+                status_callback(f"❌ Erreur lors du téléchargement: {d.get('error', 'Inconnu')}", True)
 
     if not os.path.exists(destination_folder):
         os.makedirs(destination_folder)
         if status_callback:
-            tk.Frame().after(0, status_callback, f"Dossier de destination créé : {destination_folder}", False)
+            status_callback(f"Dossier de destination créé : {destination_folder}", False)
         else:
             print(f"Dossier de destination créé : {destination_folder}")
 
     # Options pour yt-dlp
-    ydl_opts = {
-        'format': 'bestvideo+bestaudio/best', # Télécharge la meilleure qualité vidéo et audio et les fusionne
-        'outtmpl': os.path.join(destination_folder, "%(title)s.%(ext)s"), # Chemin de sortie avec le titre et l'extension
-        'progress_hooks': [_report_hook], # Fonction de rappel pour la progression
-        'merge_output_format': 'mp4', # Fusionne en mp4 si audio et vidéo sont séparés
-        'noplaylist': True, # Empêche le téléchargement de playlists entières si l'URL est une playlist
-    }
+    ydl_opts = _ydl_options(destination_folder, [_report_hook], concurrent_fragments)
 
+    success = False
     try:
         if status_callback:
-            tk.Frame().after(0, status_callback, f"Préparation du téléchargement de la vidéo : {url}", False)
+            status_callback(f"Préparation du téléchargement de la vidéo : {url}", False)
         else:
             print(f"Préparation du téléchargement de la vidéo : {url}")
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+        merge = _download_video(ydl_opts, url, cache, postprocess, status_callback)
+        if merge is not None and merge_callback:
+            merge_callback(merge)
+        success = True
+        return success
     except yt_dlp.utils.DownloadError as e:
+        metrics.error(f"DownloadError: {e}")
         if status_callback:
-            tk.Frame().after(0, status_callback, f"❌ Erreur de téléchargement vidéo : {e}", True)
+            status_callback(f"❌ Erreur de téléchargement vidéo : {e}", True)
         else:
             print(f"❌ Erreur de téléchargement vidéo : {e}")
     except Exception as e:
+        metrics.error(f"{type(e).__name__}: {e}")
         if status_callback:
-            tk.Frame().after(0, status_callback, f"❌ Une erreur inattendue s'est produite : {e}", True)
+            status_callback(f"❌ Une erreur inattendue s'est produite : {e}", True)
         else:
             print(f"❌ Une erreur inattendue s'est produite : {e}")
+    finally:
+        metrics.finish(success)
+    return False
+
+def playlist_entries(urls, status_callback=None, cache=EXTRACTION_CACHE):
+    """Liste les URL des vidéos de `urls` (pages de vidéo ou playlists), en une extraction légère par URL.
+
+    Les playlists ne sont parcourues qu'à plat (sans extraire chaque vidéo) ; une URL qui n'est pas
+    une playlist est gardée telle quelle. Les listes obtenues sont gardées dans `cache`.
+    """
+    import yt_dlp
+
+    entries = []
+    with yt_dlp.YoutubeDL({'extract_flat': 'in_playlist', 'quiet': True, 'no_warnings': True}) as ydl:
+        for url in urls:
+            cached = cache.get(url, kind='playlist') if cache is not None else None
+            if cached is not None:
+                entries.extend(cached['entries'])
+                continue
+            try:
+                info = ydl.extract_info(url, download=False)
+            except yt_dlp.utils.DownloadError as e:
+                if status_callback:
+                    status_callback(f"❌ Impossible de lire la playlist {url} : {e}", True)
+                continue
+            if info.get('_type') != 'playlist':
+                found = [url]
+            else:
+                found = [entry.get('webpage_url') or entry.get('url') for entry in info.get('entries') or [] if entry]
+                found = [entry for entry in found if entry]
+            if cache is not None:
+                cache.put(url, {'entries': found}, kind='playlist')
+            entries.extend(found)
+    return entries
+
+
+def download_playlist(urls, destination_folder="downloads", progress_callback=None, status_callback=None,
+                      max_workers=MAX_CONCURRENT_VIDEOS, concurrent_fragments=CONCURRENT_FRAGMENTS,
+                      cache=EXTRACTION_CACHE, postprocess=POSTPROCESS, merge_callback=None):
+    """
+    Télécharge toutes les vidéos de une ou plusieurs playlists (ou pages de vidéo), `max_workers` à la fois.
+    :param urls: URL de playlist ou de vidéo, ou liste de ces URL
+    :type urls: str | list
+    :param progress_callback: Reçoit (octets téléchargés, octets attendus, texte) cumulés sur toutes les vidéos
+    :type progress_callback: callable
+    :param status_callback: Fonction à appeler pour mettre à jour le statut. Prend (message, is_error=False) en param
+    :type status_callback: callable
+    :param max_workers: Vidéos téléchargées simultanément
+    :type max_workers: int
+    :param concurrent_fragments: Fragments téléchargés simultanément pour chaque vidéo HLS/DASH
+    :type concurrent_fragments: int
+    :param cache: Cache des extractions, playlists et vidéos (None pour le désactiver)
+    :type cache: extraction_cache.ExtractionCache
+    :param postprocess: File des fusions : les vidéos suivantes se téléchargent pendant les fusions
+    :type postprocess: postprocess.PostProcessQueue
+    :param merge_callback: Reçoit le Future de chaque fusion programmée (voir download_streaming_video)
+    :type merge_callback: callable
+    :return: True si toutes les vidéos ont été téléchargées (fusions éventuellement encore en file), False sinon
+    :rtype: bool
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    entries = playlist_entries([urls] if isinstance(urls, str) else urls, status_callback, cache)
+    if not entries:
+        if status_callback:
+            status_callback("❌ Aucune vidéo trouvée.", True)
+        return False
+    if status_callback:
+        status_callback(f"{len(entries)} vidéo(s) à télécharger, {max_workers} à la fois.", False)
+
+    lock = threading.Lock()
+    progress = {}  # Indice de la vidéo -> (octets téléchargés, octets attendus)
+    finished = []
+
+    def _progress(index, current, total, *extra):
+        with lock:
+            progress[index] = (current or 0, total or 0)
+            downloaded = sum(current for current, _ in progress.values())
+            expected = sum(total for _, total in progress.values())
+            text = f"{len(finished)}/{len(entries)} vidéos"
+        if progress_callback:
+            progress_callback(downloaded, expected, text)
+
+    def _download(index, url):
+        success = download_streaming_video(url, destination_folder,
+                                           progress_callback=lambda *args: _progress(index, *args),
+                                           status_callback=status_callback,
+                                           concurrent_fragments=concurrent_fragments, cache=cache,
+                                           postprocess=postprocess, merge_callback=merge_callback)
+        with lock:
+            finished.append(success)
+        return success
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="playlist") as pool:
+        results = list(pool.map(_download, range(len(entries)), entries))
+
+    failed = results.count(False)
+    if status_callback:
+        if failed:
+            status_callback(f"❌ {failed} vidéo(s) sur {len(entries)} en échec.", True)
+        else:
+            status_callback(f"✅ Les {len(entries)} vidéos ont été téléchargées avec succès.", False)
+    return not failed
+
 
 if __name__ == "__main__":
     # Exemple d'utilisation
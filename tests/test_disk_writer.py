@@ -0,0 +1,103 @@
+import io
+import threading
+
+import pytest
+
+from disk_writer import DiskWriter, FSYNC_NONE
+
+
+class Segment:
+    def __init__(self):
+        self.position = 0
+        self.written = 0
+
+
+class RecordingFile(io.BytesIO):
+    """Fichier en mémoire qui note la taille de chaque write() et peut bloquer ou échouer."""
+
+    def __init__(self, gate=None, fail=False):
+        super().__init__()
+        self.sizes = []
+        self.gate = gate
+        self.fail = fail
+        self.contents = None
+
+    def write(self, data):
+        if self.gate is not None:
+            self.gate.wait()
+        if self.fail:
+            raise OSError(28, "No space left on device")
+        self.sizes.append(len(data))
+        return super().write(data)
+
+    def close(self):
+        self.contents = self.getvalue()
+        super().close()
+
+
+@pytest.fixture
+def writer():
+    writer = DiskWriter(fsync_policy=FSYNC_NONE, block_size=1024).start()
+    yield writer
+    writer.close()
+
+
+def test_small_writes_are_coalesced(writer):
+    segment, file = Segment(), RecordingFile()
+    data = bytes(range(256)) * 10
+    with writer.open(segment, file) as f:
+        for start in range(0, len(data), 100):
+            f.write(data[start:start + 100])
+    assert file.sizes[:2] == [1100, 1100]  # Regroupés jusqu'à block_size (blocs de 100 octets)
+    assert file.sizes[2:] == [360]  # Reste écrit à la fermeture
+    assert file.contents == data
+    assert segment.written == len(data)
+
+
+def test_large_blocks_are_written_whole(writer):
+    segment, file = Segment(), RecordingFile()
+    with writer.open(segment, file) as f:
+        f.write(memoryview(b"a" * 4096))
+        f.write(b"b" * 10)
+        f.write(b"c" * 2048)
+    assert file.sizes == [4096, 2058]
+    assert file.contents == b"a" * 4096 + b"b" * 10 + b"c" * 2048
+    assert writer.stats()['direct_writes'] == 2
+
+
+def test_queued_blocks_keep_their_order():
+    # Une écriture directe en cours sur un autre segment oblige celui-ci à passer par la file
+    writer = DiskWriter(fsync_policy=FSYNC_NONE, block_size=1024).start()
+    gate = threading.Event()
+    blocked = writer.open(Segment(), RecordingFile(gate=gate))
+    thread = threading.Thread(target=blocked.write, args=(b"x" * 1024,))
+    thread.start()
+    try:
+        while not writer._direct.locked():
+            pass
+        segment, file = Segment(), RecordingFile()
+        buffer = bytearray(b"1" * 1024)
+        with writer.open(segment, file) as f:
+            f.write(buffer)
+            buffer[:] = b"2" * 1024  # Tampon de réception réutilisé : le bloc en file doit en être une copie
+            f.write(buffer)
+            gate.set()
+        assert file.contents == b"1" * 1024 + b"2" * 1024
+        assert segment.written == 2048
+    finally:
+        gate.set()
+        thread.join()
+        blocked.close()
+        writer.close()
+
+
+def test_write_error_is_raised_and_rewinds_segment(writer):
+    segment, file = Segment(), RecordingFile(fail=True)
+    f = writer.open(segment, file)
+    with pytest.raises(OSError):
+        f.write(b"x" * 4096)
+    segment.position = 4096  # Octets réservés par le worker
+    with pytest.raises(OSError):
+        f.close()
+    assert segment.written == 0 and segment.position == 0
+    assert writer.stats()['error'].startswith("OSError")
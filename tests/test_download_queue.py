@@ -0,0 +1,85 @@
+from concurrent.futures import Future
+
+import pytest
+
+from download_queue import DownloadQueue, DownloadJob, DIRECT, STREAMING, PLAYLIST
+from streaming_downloader import CONCURRENT_FRAGMENTS
+
+
+@pytest.fixture
+def queue():
+    # Répartiteur non démarré : les tests appellent _next_job eux-mêmes
+    return DownloadQueue(queue_file=None, max_active=10, max_connections_per_host=8,
+                         status_callback=lambda message, is_error=False: None)
+
+
+def start_next(queue):
+    """Ce que fait le répartiteur pour le job choisi, sans lancer de téléchargement."""
+    with queue._condition:
+        job = queue._next_job()
+        if job is not None:
+            queue._reserve(job)
+        return job
+
+
+def test_direct_jobs_share_the_host_limit(queue):
+    first = queue.submit("http://a.example/1")
+    second = queue.submit("http://a.example/2")
+    other = queue.submit("http://b.example/3")
+    assert start_next(queue) is first and first.connections == 8
+    assert start_next(queue) is other  # a.example est plein, b.example a encore tout
+    assert start_next(queue) is None
+    assert second.state == DownloadJob.QUEUED
+
+
+def test_priority_then_order(queue):
+    low = queue.submit("http://a.example/1")
+    high = queue.submit("http://b.example/2", priority=5)
+    assert start_next(queue) is high
+    assert start_next(queue) is low
+
+
+def test_mirrors_count_on_every_host(queue):
+    queue.submit("http://a.example/1", mirrors=["http://b.example/1"])
+    queue.submit("http://b.example/2")
+    assert start_next(queue).hosts == ["a.example", "b.example"]
+    assert queue._host_connections["b.example"] == 8
+    assert start_next(queue) is None
+
+
+def test_video_jobs_count_their_fragments(queue):
+    video = queue.submit("http://v.example/watch", kind=STREAMING)
+    playlist = queue.submit("http://v.example/list", kind=PLAYLIST)
+    start_next(queue)
+    assert video.fragments == CONCURRENT_FRAGMENTS and video.connections == CONCURRENT_FRAGMENTS
+    start_next(queue)
+    assert playlist.videos * playlist.fragments == playlist.connections
+    assert queue._host_connections["v.example"] <= queue.max_connections_per_host
+
+
+def test_max_active(queue):
+    queue.max_active = 1
+    queue.submit("http://a.example/1", kind=DIRECT)
+    queue.submit("http://b.example/2", kind=DIRECT)
+    assert start_next(queue) is not None
+    assert start_next(queue) is None
+
+
+@pytest.mark.parametrize("merged, state", [(True, DownloadJob.DONE), (False, DownloadJob.FAILED)])
+def test_video_job_waits_for_its_merge(queue, monkeypatch, merged, state):
+    import streaming_downloader
+    merge = Future()
+
+    def fake_download(url, destination, merge_callback=None, **kwargs):
+        merge_callback(merge)
+        return True
+    monkeypatch.setattr(streaming_downloader, 'download_streaming_video', fake_download)
+
+    job = queue.submit("http://v.example/watch", kind=STREAMING)
+    queue._run_job(start_next(queue))
+    assert job.state == DownloadJob.MERGING
+    assert queue._active == 0 and queue._host_connections["v.example"] == 0  # Réseau libéré pendant la fusion
+    assert not queue.wait(timeout=0)
+    merge.set_result(merged)
+    assert job.state == state
+    assert queue.wait(timeout=0)
@@ -0,0 +1,51 @@
+from mirrors import Mirror, MirrorSet, RATE_SAMPLE_TIME
+
+
+class FakeRequest:
+    """Requête de segment en cours : débit et durée fixés (interface de metrics.SegmentMetrics)."""
+
+    def __init__(self, bytes=0, elapsed=RATE_SAMPLE_TIME * 5):
+        self.bytes = bytes
+        self.elapsed = elapsed
+
+    @property
+    def rate(self):
+        return self.bytes / self.elapsed
+
+
+def test_choose_without_any_byte_received():
+    # Premier octet plus lent que RATE_SAMPLE_TIME sur toutes les sources : débit mesuré nul partout
+    first, second = Mirror("http://a/f"), Mirror("http://b/f")
+    first.requests.append(FakeRequest())
+    second.requests.append(FakeRequest())
+    second.requests.append(FakeRequest())
+    mirrors = MirrorSet([first, second])
+    request = FakeRequest()
+    assert mirrors.choose(request) is first  # La moins chargée
+    assert request in first.requests
+
+
+def test_choose_ignores_zero_rates():
+    fast, stalled = Mirror("http://a/f"), Mirror("http://b/f")
+    fast.rate = 1e6
+    stalled.rate = 1e6
+    stalled.requests.append(FakeRequest())  # En cours depuis longtemps, aucun octet : débit 0
+    mirrors = MirrorSet([fast, stalled])
+    for _ in range(20):
+        assert mirrors.choose(FakeRequest(elapsed=0)) is fast  # Requête qui vient de partir
+
+
+def test_choose_unmeasured_first():
+    measured, fresh = Mirror("http://a/f"), Mirror("http://b/f")
+    measured.rate = 1e6
+    mirrors = MirrorSet([measured, fresh])
+    assert mirrors.choose(FakeRequest()) is fresh
+
+
+def test_choose_preferred_and_dropped():
+    primary, other = Mirror("http://a/f"), Mirror("http://b/f")
+    mirrors = MirrorSet([primary, other])
+    other.dropped = "ETag différent"
+    assert mirrors.choose(FakeRequest(), other) is primary
+    primary.dropped = "erreurs"
+    assert mirrors.choose(FakeRequest()) is None
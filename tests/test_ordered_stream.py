@@ -0,0 +1,90 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from ordered_stream import ReorderBuffer, StreamInterrupted
+
+KIB = 1024
+
+
+def make_buffer(total_size, max_buffer):
+    return ReorderBuffer(SimpleNamespace(total_size=total_size), max_buffer=max_buffer)
+
+
+def read_all(buffer):
+    chunks = []
+    while True:
+        data = buffer.read_chunk()
+        if not data:
+            return b''.join(chunks)
+        chunks.append(data)
+
+
+def test_out_of_order_writes_are_read_in_order():
+    data = bytes(range(256)) * 48  # 12 Kio
+    buffer = make_buffer(len(data), max_buffer=64 * KIB)
+    buffer.load_segments(None, 3, None)
+    writers = [buffer.open_segment(segment) for segment in buffer.scheduler.segments]
+    for writer, segment in reversed(list(zip(writers, buffer.scheduler.segments))):
+        # Deux blocs par segment, le dernier segment arrivé en premier
+        middle = (segment.start + segment.end + 1) // 2
+        writer.write(memoryview(data)[segment.start:middle])
+        writer.write(memoryview(data)[middle:segment.end + 1])
+    assert read_all(buffer) == data
+    assert buffer.position == len(data) and buffer.buffered == 0
+
+
+def test_window_limits_the_segments_handed_out():
+    buffer = make_buffer(64 * KIB, max_buffer=16 * KIB)
+    assert buffer.segment_size == 4 * KIB
+    scheduler = buffer.load_segments(None, 1, None)
+    assert scheduler.window_end == 12 * KIB
+
+    handed_out = []
+    while (segment := scheduler.next_segment()) is not None:
+        handed_out.append(segment)
+    # Seuls les segments qui commencent dans la fenêtre : au plus max_buffer octets reçus d'avance
+    assert [segment.start for segment in handed_out] == [0, 4 * KIB, 8 * KIB]
+
+    buffer.open_segment(handed_out[0]).write(b'x' * 4 * KIB)
+    buffer.read_chunk()
+    assert scheduler.window_end == 16 * KIB  # Le lecteur a avancé : la fenêtre aussi
+    assert scheduler.next_segment().start == 12 * KIB
+
+
+def test_write_waits_for_the_reader_when_full():
+    buffer = make_buffer(None, max_buffer=8 * KIB)
+    buffer.write(0, b'a' * 6 * KIB)
+    written = threading.Event()
+
+    def _write():
+        buffer.write(6 * KIB, b'b' * 4 * KIB)
+        written.set()
+    thread = threading.Thread(target=_write)
+    thread.start()
+    assert not written.wait(0.1)  # 10 Kio ne tiennent pas dans 8 Kio
+    assert buffer.read_chunk() == b'a' * 6 * KIB
+    thread.join(timeout=5)
+    assert written.is_set() and buffer.peak <= buffer.max_buffer
+    buffer.finish()
+    assert read_all(buffer) == b'b' * 4 * KIB
+
+
+def test_close_releases_a_waiting_writer():
+    buffer = make_buffer(None, max_buffer=4 * KIB)
+    buffer.write(0, b'a' * 4 * KIB)
+    thread = threading.Thread(target=buffer.write, args=(4 * KIB, b'b' * KIB))
+    thread.start()
+    buffer.close()
+    thread.join(timeout=5)
+    assert not thread.is_alive() and buffer.buffered == 0
+
+
+def test_incomplete_stream_raises():
+    buffer = make_buffer(8 * KIB, max_buffer=64 * KIB)
+    buffer.write(0, b'a' * 4 * KIB)
+    buffer.finish("connexion perdue")
+    assert buffer.read_chunk() == b'a' * 4 * KIB
+    with pytest.raises(StreamInterrupted):
+        buffer.read_chunk()